@@ -0,0 +1,489 @@
+"""
+Throughput benchmarks for the log parser
+
+Usage:
+    python bench_jsr.py [benchmark ...]
+
+With no arguments all benchmarks are run.  The sample lines come from the files in tdata/
+and are repeated so that each measurement runs long enough to be meaningful.
+"""
+import bz2
+import glob
+import gzip
+import lzma
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from js.jsr import Jobs, Job, JOB_KEYS, parse_line, classify_line_by_search, timestamp2float
+from js.jsr import iter_log_spans, iter_log_mmap, time2tuple, interval2string_m, write_csv_rows
+
+
+def sample_lines():
+    """Return the non-blank lines of all the sample logs in tdata"""
+    lines = []
+    for filename in sorted(glob.glob('tdata/*.txt') + glob.glob('tdata/*.log')):
+        with open(filename, encoding='utf-8-sig') as fp:
+            lines += [line.rstrip() for line in fp if line.strip()]
+    return lines
+
+
+def rate(func, items, repeat):
+    """Return the number of items per second func processes"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(item)
+    elapsed = time.perf_counter() - start
+    return len(items) * repeat / elapsed
+
+
+_jobre = re.compile(r'- Job \d\d*:')
+_re_restore_job = re.compile(r'- Job \d\d* ')
+_dequere = re.compile(r'job number \d\d* ')
+
+
+def match(s, substring):
+    return s.find(substring) != -1
+
+
+def elif_dispatch(line):
+    """The dispatch of the original read_log_file: the match() elif chain, then the job number regex"""
+    number_re = _jobre
+    if match(line, 'Found version'):
+        (kind, number_re) = ('found', None)
+    elif match(line, 'Submitted.'):
+        kind = 'submitted'
+    elif match(line, 'restored. UniqueID'):
+        (kind, number_re) = ('restored', _re_restore_job)
+    elif match(line, 'Creating Process'):
+        kind = 'creating'
+    elif match(line, 'on controller'):
+        kind = 'started'
+    elif match(line, 'releasing'):
+        kind = 'releasing'
+    elif match(line, 'Job Scheduler shutting down'):
+        (kind, number_re) = ('shutdown', None)
+    elif match(line, 'Processing Command Line'):
+        (kind, number_re) = ('restart', None)
+    elif match(line, 'MaxProcessors'):
+        kind = 'request_info'
+    elif match(line, 'peak working set ='):
+        kind = 'working_set'
+    elif match(line, 'Exit status'):
+        kind = 'exit_status'
+    elif match(line, 'exit code '):
+        kind = 'exit_code'
+    elif match(line, '- Dequeueing job') or match(line, '- Dequeueing pending job j'):
+        (kind, number_re) = ('cancelled', _dequere)
+    elif match(line, 'Dequeueing scheduled job'):
+        kind = 'cancelled'
+    elif match(line, ': Dequeueing job'):
+        kind = 'cancelled'
+    elif match(line, 'Setting job to CANCELING state'):
+        kind = 'cancelled'
+    elif match(line, 'Terminating job'):
+        (kind, number_re) = ('terminated', _dequere)
+    elif match(line, 'Output Files remaining:'):
+        kind = 'copy_back'
+    elif match(line, 'Registering Task token') or match(line, 'Registering task id'):
+        return 'ignore', None
+    elif match(line, 'Child Process'):
+        return 'ignore', None
+    elif match(line, 'assigned'):
+        kind = 'assigned'
+    elif match(line, 'Requesting input file') or\
+            match(line, 'Preparing to wait for transfer of input file') or\
+            match(line, 'Transfer complete for outgoing input file') or\
+            match(line, 'Transfer complete for all input files') or\
+            match(line, 'File requested by remote queue') or\
+            match(line, 'Transfer complete for input file'):
+        return 'ignore', None
+    elif match(line, 'Transfer complete for output file') or\
+            match(line, 'Preparing to wait for transfer of output file') or\
+            match(line, 'Requesting output file'):
+        return 'ignore', None
+    elif match(line, 'Responded to ping from') or match(line, 'has disconnected'):
+        return 'ignore', None
+    elif match(line, 'Starting Job Scheduler'):
+        (kind, number_re) = ('scheduler_start', None)
+    elif match(line, 'Output Files remaining'):
+        kind = 'files_remaining'
+    else:
+        return None, None
+    m = number_re.search(line) if number_re is not None else None
+    return kind, m.group() if m else None
+
+
+def elif_and_split(line):
+    """The per line work done before parse_line: the elif chain, then splitting the line again"""
+    (kind, job_number) = elif_dispatch(line)
+    if kind and kind != 'ignore':
+        (tm, rest) = line.split(' - ', 1)
+        timestamp2float(tm)
+        rest.split(': ', 1)
+    return kind, job_number
+
+
+def bench_classify(repeat=200):
+    """Lines per second of parse_line against the original elif chain then splitting, by kind of line"""
+    lines = sample_lines()
+    by_kind = defaultdict(list)
+    for line in lines:
+        by_kind[classify_line_by_search(line)[0] or 'unmatched'].append(line)
+    by_kind['(all lines)'] = lines
+
+    print('{:16s} {:>6s} {:>12s} {:>12s} {:>8s}'.format('kind', 'lines', 'elif/s', 'parse_line/s', 'speedup'))
+    for kind in sorted(by_kind):
+        lines = by_kind[kind]
+        old = rate(elif_and_split, lines, repeat)
+        new = rate(parse_line, lines, repeat)
+        print('{:16s} {:6d} {:12,.0f} {:12,.0f} {:8.2f}'.format(kind, len(lines), old, new, new / old))
+
+
+def timestamp2float_strptime(ts):
+    """The original strptime/mktime implementation of timestamp2float"""
+    (time_stamp, fractseconds) = ts.split('.')
+    return time.mktime(time.strptime(time_stamp, "%Y-%m-%dT%H:%M:%S")) + float('0.' + fractseconds)
+
+
+def bench_timestamp(repeat=20):
+    """Timestamps per second of timestamp2float against strptime and mktime"""
+    stamps = [line[:line.find(' - ')] for line in sample_lines()]
+    old = rate(timestamp2float_strptime, stamps, repeat)
+    new = rate(timestamp2float, stamps, repeat)
+    print('{:>6s} {:>12s} {:>16s} {:>8s}'.format('stamps', 'strptime/s', 'timestamp2float/s', 'speedup'))
+    print('{:6d} {:12,.0f} {:16,.0f} {:8.2f}'.format(len(stamps), old, new, new / old))
+
+
+class DictJob:
+    """The original job record: the fields in a defaultdict(str) with '' for missing"""
+
+    def __init__(self):
+        self.job = defaultdict(str)
+        self.jl = None
+        self.lines = []
+
+
+def copy_as_dict_job(job):
+    j = DictJob()
+    j.job.update(job.job)
+    return j
+
+
+def copy_as_job(job):
+    j = Job()
+    for slot in JOB_KEYS.values():
+        setattr(j, slot, getattr(job, slot))
+    j.extra = dict(job.extra) if job.extra else None
+    return j
+
+
+def bytes_per_job(copy, jobs, count):
+    """Return the bytes allocated per job making count copies of jobs"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    copies = [copy(jobs[i % len(jobs)]) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(copies) == count
+    return (after - before) / count
+
+
+def bench_job_memory(count=100000):
+    """Bytes per job of the slotted Job against the defaultdict(str) record it replaced"""
+    jobs = []
+    for filename in sorted(glob.glob('tdata/*.txt')):
+        jobs += Jobs(filename, track_lines=False).get_list()
+    old = bytes_per_job(copy_as_dict_job, jobs, count)
+    new = bytes_per_job(copy_as_job, jobs, count)
+    print('{:>7s} {:>12s} {:>10s} {:>8s}'.format('jobs', 'dict B/job', 'Job B/job', 'ratio'))
+    print('{:7d} {:12,.0f} {:10,.0f} {:8.2f}'.format(count, old, new, old / new))
+
+
+def job2csv_concat(job):
+    """The original job2csv: the row is concatenated a field at a time through the JobView"""
+    d = job.job
+    s = ''
+    (date, tm, day) = time2tuple(d['submitted'])
+    s += date + ',' + tm + ',' + day + ','
+    (date, tm, day) = time2tuple(d['start'])
+    s += date + ',' + tm + ',' + day + ','
+    s += interval2string_m(d['duration']) + ','
+    s += interval2string_m(d['queued']) + ','
+    s += d['S_User'] + ',' + job.sim() + ',' + d['host'] + ',' + str(d['working_set']) + ','
+    s += d['S_Priority'] + ',' + d['R_MinProcessors'] + ',' + d['R_ThreadsPerProcessor'] + ','
+    s += d['R_MaxProcessors'] + ',' + d['R_PreferredPerf'] + ',' + d['R_PreferredMemCap'] + ','
+    s += d['exit'] + ',' + interval2string_m(d['results_copy']) + ',' + str(d['S_UniqueID']) + ','
+    s += str(d['major_version'])
+    return s
+
+
+def synthetic_jobs(count):
+    """Return count copies of the sample jobs spread over about 400 days"""
+    sample = []
+    for filename in sorted(glob.glob('tdata/*.txt')):
+        sample += Jobs(filename, track_lines=False).get_list()
+    jobs = []
+    for i in range(count):
+        job = copy_as_job(sample[i % len(sample)])
+        shift = i * 37.0
+        job.submit_time = job.submit_time and job.submit_time + shift
+        job.start_time = job.start_time and job.start_time + shift
+        jobs.append(job)
+    return jobs
+
+
+def bench_csv(count=1000000):
+    """Jobs per second written to csv a job at a time against write_csv_rows, on count synthetic jobs"""
+    jobs = synthetic_jobs(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        (old_file, new_file) = (os.path.join(tmp, 'old.csv'), os.path.join(tmp, 'new.csv'))
+        start = time.perf_counter()
+        with open(old_file, 'w') as fp:
+            print(jobs[0].job2csv(True), file=fp)
+            for job in jobs:
+                print(job2csv_concat(job), file=fp)
+        old = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(new_file, 'w', buffering=1024 * 1024) as fp:
+            write_csv_rows(fp, jobs)
+        new = time.perf_counter() - start
+        with open(old_file) as a, open(new_file) as b:
+            assert a.read() == b.read()
+    print('{:>8s} {:>8s} {:>8s} {:>10s} {:>8s}'.format('jobs', 'old s', 'new s', 'jobs/s', 'speedup'))
+    print('{:8d} {:8.2f} {:8.2f} {:10,.0f} {:8.2f}'.format(count, old, new, count / new, old / new))
+
+
+def synthetic_jobs_frame(rows, users=100):
+    """Return a jobs frame of rows random jobs with the columns js_pd uses"""
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(1)
+    exits = ['0'] * 16 + ['cancelled', 'host_reassigned', 'shutdown', '-1']
+    duration = rng.lognormal(1.0, 1.5, rows).round(2)
+    duration[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        'simulator': pd.Categorical.from_codes(rng.integers(0, 4, rows), ['AXIEM', 'Analyst', 'EM_3rd_Party', 'Sim']),
+        'user': pd.Categorical.from_codes(rng.integers(0, users, rows), ['user{}'.format(n) for n in range(users)]),
+        'exit_code': pd.Categorical.from_codes(rng.integers(0, len(exits), rows) % len(set(exits)),
+                                               sorted(set(exits), key=exits.index)),
+        'duration_m': duration,
+        'wait_m': rng.exponential(2.0, rows).round(2),
+    })
+
+
+def masked_stats(df, column, rows, simulators):
+    """The original js_pd statistics: a boolean mask and a filter of the whole frame per simulator"""
+    import pandas as pd
+    results = {}
+    for (label, stat_func) in rows:
+        row = {'Overall': stat_func(df[column])}
+        for sim in simulators:
+            row[sim] = stat_func(df[df.simulator == sim][column])
+        results[label] = row
+    return pd.DataFrame.from_dict(results, orient="index")
+
+
+def masked_median_by_user(jobs_df, simulators):
+    """The original median_by_user, with its undefined names fixed, a mask per user and simulator"""
+    import pandas as pd
+    from js.js_pd import successful_jobs
+    jobs_df = successful_jobs(jobs_df)
+    results = {}
+    for user in sorted(jobs_df.user.unique()):
+        df = jobs_df[jobs_df.user == user]
+        row = {'Overall': df.duration_m.median()}
+        for sim in simulators:
+            row[sim] = df[df.simulator == sim].duration_m.median()
+        results[user] = row
+    return pd.DataFrame.from_dict(results, orient="index")
+
+
+def bench_stats(rows=10000000):
+    """Seconds to build the js_pd summary tables with a mask per group against grouped aggregation"""
+    import numpy as np
+    from js import js_pd
+    df = synthetic_jobs_frame(rows)
+    sims = js_pd.sim_list(df)
+    durations = js_pd.jobs_with_duration(df)
+    waits = df[df.exit_code != 'cancelled']
+    stats = [('max', lambda s: s.max()), ('mean', lambda s: s.mean()), ('median', lambda s: s.median())]
+    tables = [
+        ('duration_stats', lambda: masked_stats(durations, 'duration_m', stats, sims), js_pd.duration_stats),
+        ('wait_stats', lambda: masked_stats(waits, 'wait_m', stats, sims), js_pd.wait_stats),
+        ('median_by_user', lambda: masked_median_by_user(df, sims), js_pd.median_by_user),
+    ]
+    print('{:>15s} {:>9s} {:>8s} {:>9s} {:>8s}'.format('table', 'rows', 'masks s', 'groupby s', 'speedup'))
+    for (name, old_table, new_table) in tables:
+        start = time.perf_counter()
+        old = old_table()
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new = new_table(df)
+        new_time = time.perf_counter() - start
+        assert np.allclose(old.to_numpy(float), new.to_numpy(float), equal_nan=True)
+        print('{:>15s} {:9d} {:8.2f} {:9.2f} {:8.2f}'.format(name, rows, old_time, new_time, old_time / new_time))
+    start = time.perf_counter()
+    cube = js_pd.job_stats(df)
+    print('{:>15s} {:9d} {:>8s} {:9.2f} {:>8s}  ({} groups)'.format('job_stats', rows, '', time.perf_counter() - start,
+                                                                    '', len(cube)))
+
+
+def bench_rollup(count=1000000):
+    """Jobs per second added to a Rollup and the time of the monthly and hourly queries, on synthetic jobs"""
+    from js.rollup import Rollup
+    jobs = synthetic_jobs(count)
+    rollup = Rollup()
+    start = time.perf_counter()
+    rollup.add_jobs(jobs)
+    add = time.perf_counter() - start
+    start = time.perf_counter()
+    monthly = rollup.monthly()
+    hourly = rollup.hourly()
+    query = time.perf_counter() - start
+    print('{:>8s} {:>8s} {:>10s} {:>8s} {:>8s}'.format('jobs', 'cells', 'jobs/s', 'query ms', 'rows'))
+    print('{:8d} {:8d} {:10,.0f} {:8.1f} {:8d}'.format(count, len(rollup.cells), count / add, query * 1e3,
+                                                       len(monthly) + len(hourly)))
+
+
+def bench_histogram(rows=10000000):
+    """Seconds to bin the durations for every user with np.histogram per user against js_pd.histogram"""
+    import numpy as np
+    from js import js_pd
+    df = synthetic_jobs_frame(rows)
+    bins = js_pd.BIN_PRESETS['duration']
+    start = time.perf_counter()
+    old = [np.histogram(df[df.user == user].duration_m.dropna(), bins=bins.edges)[0]
+           for user in sorted(df.user.unique())]
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = js_pd.histogram(df, 'duration_m', bins, by='user')
+    new_time = time.perf_counter() - start
+    assert np.array_equal(np.array(old), new.to_numpy())
+    print('{:>9s} {:>6s} {:>10s} {:>12s} {:>8s}'.format('rows', 'users', 'per user s', 'histogram s', 'speedup'))
+    print('{:9d} {:6d} {:10.2f} {:12.2f} {:8.2f}'.format(rows, len(new), old_time, new_time, old_time / new_time))
+
+
+def bench_parallel(copies=40):
+    """Seconds to parse a long log in one process and with a process per CPU"""
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        sample = fp.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'AWR_JobScheduler_x64_log.txt')
+        with open(filename, 'wb') as fp:
+            for _ in range(copies):
+                fp.write(sample)
+        timings = []
+        for processes in [1, None]:
+            start = time.perf_counter()
+            Jobs(track_lines=False).read_log_files([filename], processes)
+            timings.append(time.perf_counter() - start)
+    print('{:>8s} {:>5s} {:>10s} {:>10s} {:>8s}'.format('MB', 'cpus', 'serial s', 'parallel s', 'speedup'))
+    print('{:8.1f} {:5d} {:10.2f} {:10.2f} {:8.2f}'.format(len(sample) * copies / 1e6, os.cpu_count(),
+                                                           timings[0], timings[1], timings[0] / timings[1]))
+
+
+def bench_compressed(copies=40):
+    """MB per second of log text parsed from a plain log and from .gz, .bz2 and .xz archives of it"""
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        data = fp.read() * copies
+    print('{:>6s} {:>10s} {:>8s} {:>10s} {:>8s}'.format('format', 'file MB', 'seconds', 'text MB/s', 'relative'))
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = None
+        for (ext, compress) in (('', bytes), ('.gz', gzip.compress), ('.bz2', bz2.compress), ('.xz', lzma.compress)):
+            filename = os.path.join(tmp, 'AWR_JobScheduler_x64_log.txt' + ext)
+            with open(filename, 'wb') as fp:
+                fp.write(compress(data))
+            start = time.perf_counter()
+            Jobs(track_lines=False).read_log_file(filename)
+            elapsed = time.perf_counter() - start
+            plain = plain or elapsed
+            print('{:>6s} {:10.2f} {:8.2f} {:10.1f} {:8.2f}'.format(ext or 'txt', os.path.getsize(filename) / 1e6,
+                                                                    elapsed, len(data) / 1e6 / elapsed,
+                                                                    plain / elapsed))
+
+
+def parse_with(spans_of, filename):
+    """Parse a log with the line source spans_of(filename), return (seconds, bytes allocated)"""
+    allocated = 0
+    for traced in (False, True):
+        jobs = Jobs(track_lines=False)
+        jobs.files.append(filename)
+        if traced:
+            tracemalloc.start()
+        start = time.perf_counter()
+        jobs.parse_spans(spans_of(filename), 0)
+        if traced:
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            elapsed = time.perf_counter() - start
+    return elapsed, allocated
+
+
+def bench_mmap(copies=40):
+    """Seconds and peak allocation parsing a long log decoding every line, and skipping ignored lines as bytes"""
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        sample = fp.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'AWR_JobScheduler_x64_log.txt')
+        with open(filename, 'wb') as fp:
+            for _ in range(copies):
+                fp.write(sample)
+        skipped = sum(line is None for (offset, length, line) in iter_log_mmap(filename))
+        lines = sum(1 for _ in iter_log_spans(filename))
+        (old, old_mem) = parse_with(iter_log_spans, filename)
+        (new, new_mem) = parse_with(iter_log_mmap, filename)
+    print('{:>8s} {:>8s} {:>10s} {:>8s} {:>10s} {:>8s}'.format('lines', 'skipped', 'decode s', 'mmap s', 'speedup',
+                                                               'peak MB'))
+    print('{:8d} {:8d} {:10.2f} {:8.2f} {:10.2f} {:4.1f}/{:.1f}'.format(lines, skipped, old, new, old / new,
+                                                                        old_mem / 1e6, new_mem / 1e6))
+
+
+def bench_columnar(copies=500):
+    """File size and load time of the jobs as CSV read with pandas, and as Parquet and Arrow IPC"""
+    import pandas as pd
+    from js.arrow import read_table
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        sample = fp.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'AWR_JobScheduler_x64_log.txt')
+        with open(log, 'wb') as fp:
+            for _ in range(copies):
+                fp.write(sample)
+        jobs = Jobs(log, track_lines=False)
+        print('{:>8s} {:>7s} {:>10s} {:>10s}'.format('format', 'jobs', 'file KB', 'load ms'))
+        for (fmt, write, read) in (('csv', jobs.write_csv, pd.read_csv),
+                                   ('parquet', jobs.write_parquet, lambda f: read_table(f).to_pandas()),
+                                   ('arrow', jobs.write_arrow, lambda f: read_table(f).to_pandas())):
+            filename = os.path.join(tmp, 'jobs.' + fmt)
+            write(filename)
+            start = time.perf_counter()
+            df = read(filename)
+            elapsed = time.perf_counter() - start
+            print('{:>8s} {:7d} {:10.1f} {:10.1f}'.format(fmt, len(df), os.path.getsize(filename) / 1e3, elapsed * 1e3))
+
+
+benchmarks = {
+    'classify': bench_classify,
+    'columnar': bench_columnar,
+    'compressed': bench_compressed,
+    'csv': bench_csv,
+    'histogram': bench_histogram,
+    'job_memory': bench_job_memory,
+    'mmap': bench_mmap,
+    'parallel': bench_parallel,
+    'rollup': bench_rollup,
+    'stats': bench_stats,
+    'timestamp': bench_timestamp,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(benchmarks):
+        print('\n# {}'.format(name))
+        benchmarks[name]()
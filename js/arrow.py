@@ -0,0 +1,145 @@
+"""
+Parquet and Arrow IPC output of jobs and events
+
+The CSV output is text that has to be parsed and typed again before it can be analyzed.  These writers
+store the same data with a fixed schema: times are UTC timestamps, durations are minutes as doubles
+and the columns with few distinct values (user, host, simulator, exit code, ...) are dictionary encoded.
+The job columns come straight from the columnar JobTable of the job list.
+
+pyarrow is needed for this module, it is not needed for the rest of the package.
+"""
+from typing import List
+
+import numpy as np
+import pyarrow as pa
+
+from js.jsr import Jobs, Timeline, EVENT_TYPES
+
+_timestamp = pa.timestamp('us', tz='UTC')
+_category = pa.dictionary(pa.int32(), pa.string())
+
+JOB_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('submitted', _timestamp),
+    ('start', _timestamp),
+    ('stop', _timestamp),
+    ('duration_m', pa.float64()),
+    ('wait_m', pa.float64()),
+    ('user', _category),
+    ('simulator', _category),
+    ('host', _category),
+    ('working_set', pa.float32()),  # MB
+    ('priority', pa.int32()),
+    ('min_proc', pa.int32()),
+    ('threads', pa.int32()),
+    ('max_proc', pa.int32()),
+    ('req_perf', _category),
+    ('req_mem', _category),
+    ('exit_code', _category),
+    ('results_copy_m', pa.float64()),
+    ('uuid', pa.string()),
+    ('version', _category),
+])
+
+EVENT_SCHEMA = pa.schema([
+    ('time', _timestamp),
+    ('type', pa.dictionary(pa.int8(), pa.string())),
+    ('running', pa.int32()),
+    ('queued', pa.int32()),
+    ('id', pa.string()),
+])
+
+# JOB_SCHEMA column -> JobTable column it is made from
+_TABLE_COLUMNS = {
+    'submitted': 'submitted', 'start': 'start', 'stop': 'stop',
+    'duration_m': 'duration', 'wait_m': 'queued', 'results_copy_m': 'results_copy', 'working_set': 'working_set',
+    'priority': 'priority', 'min_proc': 'min_proc', 'threads': 'threads', 'max_proc': 'max_proc',
+    'user': 'user', 'simulator': 'simulator', 'host': 'host', 'req_perf': 'req_perf', 'req_mem': 'req_mem',
+    'exit_code': 'exit', 'version': 'version',
+}
+
+
+def timestamps(seconds: np.ndarray) -> pa.Array:
+    """Return epoch seconds as a timestamp array, NaN is null"""
+    missing = np.isnan(seconds)
+    micros = np.round(np.where(missing, 0, seconds) * 1e6).astype(np.int64)
+    return pa.array(micros, _timestamp, mask=missing)
+
+
+def categories(codes: np.ndarray, labels: List[str], index_type=pa.int32()) -> pa.DictionaryArray:
+    """Return category codes as a dictionary array, -1 is null"""
+    indices = pa.array(codes.astype(index_type.to_pandas_dtype()), index_type, mask=codes < 0)
+    return pa.DictionaryArray.from_arrays(indices, pa.array(labels, pa.string()))
+
+
+def jobs_table(jobs: Jobs) -> pa.Table:
+    """Return the jobs of a job list as a table with JOB_SCHEMA"""
+    table = jobs.job_table()
+    if table is None:
+        raise ImportError('the job table needs numpy')
+    columns = []
+    for field in JOB_SCHEMA:
+        name = field.name
+        if name in ('id', 'uuid'):  # the Job slots have the same names
+            columns.append(pa.array([getattr(j, name) for j in jobs.joblist], pa.string()))
+            continue
+        col = table.column(_TABLE_COLUMNS[name])
+        if field.type == _timestamp:
+            columns.append(timestamps(col))
+        elif field.type == _category:
+            columns.append(categories(col, table.categories[_TABLE_COLUMNS[name]].labels))
+        elif name.endswith('_m'):
+            columns.append(pa.array(col / 60.0, field.type, from_pandas=True))  # NaN is null
+        elif pa.types.is_integer(field.type):
+            columns.append(pa.array(col, field.type, mask=col < 0))
+        else:
+            columns.append(pa.array(col, field.type, from_pandas=True))
+    return pa.Table.from_arrays(columns, schema=JOB_SCHEMA)
+
+
+def events_table(timeline: Timeline) -> pa.Table:
+    """Return the events of a timeline as a table with EVENT_SCHEMA"""
+    (running, queued) = timeline.counts()
+    jobs = timeline.jobs
+    ids = [jobs[n].id if n >= 0 else None for n in timeline.job_index]
+    columns = [
+        timestamps(np.frombuffer(timeline.times, dtype=np.float64) if len(timeline) else np.zeros(0)),
+        categories(np.array(timeline.types, dtype=np.int8), EVENT_TYPES, pa.int8()),
+        pa.array(running, pa.int32()),
+        pa.array(queued, pa.int32()),
+        pa.array(ids, pa.string()),
+    ]
+    return pa.Table.from_arrays(columns, schema=EVENT_SCHEMA)
+
+
+def table_format(filename: str) -> str:
+    """Return 'parquet' for a .parquet file name and 'arrow' for anything else"""
+    return 'parquet' if filename.lower().endswith('.parquet') else 'arrow'
+
+
+def write_table(table: pa.Table, filename: str, fmt: str = None) -> None:
+    """
+    Write a table to a file
+
+    Arguments:
+        table: the jobs_table or events_table to write
+        filename: name of the file
+        fmt: 'parquet' or 'arrow' for an Arrow IPC file, by default it depends on filename, see table_format
+    """
+    if (fmt or table_format(filename)) == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, filename, compression='zstd')
+    else:
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.OSFile(filename, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+
+
+def read_table(filename: str, fmt: str = None) -> pa.Table:
+    """Read back a table written by write_table"""
+    if (fmt or table_format(filename)) == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(filename)
+    with pa.memory_map(filename, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
@@ -0,0 +1,205 @@
+"""
+On-disk cache of parsed log files
+
+Archived logs do not change so there is no need to parse them again for every conversion.  Each log
+file is parsed on its own, as js.parallel parses a segment, and the result is saved compressed under
+the hash of the file's contents and of the parser source.  A file that was seen before is loaded and
+stitched into the job list, which gives the same jobs and events as parsing it.  Editing the parser
+changes the hash so old entries are simply never used again and age out.
+
+The cache is bounded in size, the least recently used entries are removed when a new entry is stored.
+
+Entries are pickles and loading a pickle can run any code, so the cache directory must only be
+writable by the user running the conversion.  It is created that way, and a directory that belongs
+to another user or that the group or others can write to is not used.
+"""
+import hashlib
+import os
+import pickle
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import js.jsr as jsr
+import js.parallel as parallel
+import js.util as util
+from js.jsr import Jobs
+from js.parallel import Segment, SegmentJobs, parse_segment, stitch
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'awrjs')
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+
+# file name extension of the cache entries
+ENTRY_EXT = '.jsc'
+
+
+def parser_version() -> str:
+    """Return a hash of the parser source, entries made by another version of the parser are not used"""
+    h = hashlib.sha1()
+    # util opens and decompresses the logs
+    for module in (jsr, parallel, util):
+        with open(module.__file__, 'rb') as fp:
+            h.update(fp.read())
+    return h.hexdigest()
+
+
+class LogCache:
+    """
+    Parsed log files stored by content hash
+
+    Members:
+        directory: where the entries are kept, it is created when the first entry is stored
+        max_size: most bytes the entries may take up
+        version: parser_version() when the cache was opened
+        hits, misses: number of files loaded from the cache and parsed since it was opened
+        untrusted: True once the directory was found to be writable by others, the cache is then not used
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.version = parser_version()
+        self.hits = 0
+        self.misses = 0
+        self.untrusted = False
+
+    def trusted(self) -> bool:
+        """Return True if only this user can write to the cache directory, or it does not exist yet"""
+        if self.untrusted:
+            return False
+        try:
+            st = os.stat(self.directory)
+        except FileNotFoundError:
+            return True
+        # there are no uids on Windows, the directory is left to the file system permissions there
+        if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+            print('ERROR: not using the cache in {}, it can be written to by other users'.format(self.directory))
+            self.untrusted = True
+            return False
+        return True
+
+    def key(self, filename: str, track_lines: bool) -> str:
+        """Return the cache key of a log file, the hash of its contents and of how it is parsed"""
+        h = hashlib.sha1('{} {}\n'.format(self.version, track_lines).encode('utf-8'))
+        with open(filename, 'rb') as fp:
+            for block in iter(lambda: fp.read(jsr.LOG_CHUNK_SIZE), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_EXT)
+
+    def load(self, key: str) -> Optional[SegmentJobs]:
+        """Return the parsed file stored under key, None if it is not in the cache"""
+        if not self.trusted():
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fp:
+                seg = pickle.loads(zlib.decompress(fp.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            print('ERROR: removing unreadable cache entry {}: {}'.format(path, e))
+            self.remove(path)
+            return None
+        os.utime(path)  # the modification time is the last use for the LRU eviction
+        return seg
+
+    def store(self, key: str, seg: SegmentJobs) -> None:
+        """Save a parsed file under key and make room for it"""
+        if not self.trusted():
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self.path(key)
+        data = zlib.compress(pickle.dumps(seg, pickle.HIGHEST_PROTOCOL), 1)
+        with open(path + '.tmp', 'wb') as fp:
+            fp.write(data)
+        os.replace(path + '.tmp', path)
+        self.evict(keep=path)
+
+    def entries(self) -> List[os.DirEntry]:
+        """Return the cache entries, least recently used first"""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(ENTRY_EXT)]
+        return sorted(entries, key=lambda e: e.stat().st_mtime)
+
+    def size(self) -> int:
+        """Return the number of bytes the entries take up"""
+        return sum(e.stat().st_size for e in self.entries())
+
+    def evict(self, keep: str = None) -> None:
+        """Remove the least recently used entries until the cache fits in max_size, keep is never removed"""
+        entries = self.entries()
+        total = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if total <= self.max_size:
+                break
+            if e.path != keep:
+                total -= e.stat().st_size
+                self.remove(e.path)
+
+    def clear(self) -> None:
+        """Remove all the entries"""
+        for e in self.entries():
+            self.remove(e.path)
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # another conversion got there first
+
+    def parse(self, filename: str, track_lines: bool = True, key: str = None) -> SegmentJobs:
+        """Return the parsed log file, from the cache if it has been parsed before"""
+        key = key or self.key(filename, track_lines)
+        seg = self.load(key)
+        if seg is not None:
+            self.hits += 1
+            return seg
+        self.misses += 1
+        seg = parse_segment(Segment(0, filename, 0, None, 1, True, track_lines))
+        self.store(key, seg)
+        return seg
+
+    def read_log_file(self, jobs: Jobs, filename: str) -> int:
+        """
+        Add the jobs and events of a log file to a job list, as Jobs.read_log_file
+
+        Returns:
+            the number of jobs submitted
+        """
+        return self.add(jobs, filename, self.parse(filename, jobs.track_lines))
+
+    def read_log_files(self, jobs: Jobs, filenames: List[str], processes: int = 1) -> List[int]:
+        """
+        Add the jobs and events of log files to a job list, as Jobs.read_log_files
+
+        The files that are not in the cache are parsed in a pool of processes unless processes is 1,
+        each file is parsed by one process.
+
+        Returns:
+            the number of jobs submitted in each file
+        """
+        if processes == 1:
+            return [self.read_log_file(jobs, f) for f in filenames]
+        keys = [self.key(f, jobs.track_lines) for f in filenames]
+        segs = [self.load(k) for k in keys]
+        missing = [n for (n, seg) in enumerate(segs) if seg is None]
+        self.hits += len(filenames) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            segments = [Segment(n, filenames[n], 0, None, 1, True, jobs.track_lines) for n in missing]
+            with ProcessPoolExecutor(processes) as pool:
+                for (n, seg) in zip(missing, pool.map(parse_segment, segments)):
+                    self.store(keys[n], seg)
+                    segs[n] = seg
+        return [self.add(jobs, f, seg) for (f, seg) in zip(filenames, segs)]
+
+    def add(self, jobs: Jobs, filename: str, seg: SegmentJobs) -> int:
+        """Stitch a parsed file into a job list and return the number of jobs submitted in it"""
+        file_id = len(jobs.files)
+        jobs.files.append(filename)
+        stitch(jobs, seg, file_id)
+        return seg.count
@@ -0,0 +1,165 @@
+"""
+Checkpoint and resume of the parse state for incremental conversions
+
+A nightly conversion of the scheduler logs only needs to parse what was written since the last night.
+A Checkpoint records, for each log file, its identity and how far it has been parsed, and keeps the
+parse state needed to carry on: the open jobs, the running hosts and the counters.  Jobs are returned
+by read() once they finish, every job exactly once over the runs, so the outputs can be appended to.
+
+The last file in the list is the live log.  Its open jobs are held in the checkpoint rather than closed
+out at the end of the file, as in js.follow they are returned once their exit is settle seconds old.
+Jobs stay in the checkpoint for revive_days after they end so that later lines can still find them:
+the results copy of an active job, a restore by UniqueID or a host reassignment of a retired one.
+The changes made to a job after it was returned are not written again.
+
+    checkpoint = Checkpoint.load('nightly.ckpt')
+    for job in checkpoint.read(files):
+        ...
+    checkpoint.events().write(fp, header=False)
+    checkpoint.save('nightly.ckpt')
+"""
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+from typing import List
+
+from js.jsr import Jobs, Job, Timeline
+from js.follow import LogFollower
+
+CHECKPOINT_VERSION = 1
+
+# bytes at the start of a log that are hashed to tell if it is still the same file
+HEAD_SIZE = 4096
+
+# how far a log has been parsed, size/mtime/head_size/head_hash identify the file, offset and lineno
+# are where parsing carries on, closed is True if the open jobs were closed out at the end of it
+FileMark = namedtuple('FileMark', ['size', 'mtime', 'head_size', 'head_hash', 'offset', 'lineno',
+                                   'last_line', 'closed'])
+
+
+def head_hash(filename: str, size: int) -> str:
+    """Return the sha1 of the first size bytes of a file"""
+    with open(filename, 'rb') as fp:
+        return hashlib.sha1(fp.read(size)).hexdigest()
+
+
+class Checkpoint:
+    """
+    Parse state saved between incremental conversions
+
+    Members:
+        files: log file name -> FileMark
+        jobs: the Jobs holding the parse state, its joblist only has the jobs that may still change
+        written: jobs in jobs.joblist that have already been returned by read()
+        last_tm: latest job time seen, None before any jobs
+        settle: seconds of log time after its exit before a job of the live log is returned
+        revive_days: days a job is kept after it ends so that later lines can find it
+    """
+
+    def __init__(self, settle: float = 60.0, revive_days: float = 7.0) -> None:
+        self.version = CHECKPOINT_VERSION
+        self.files = {}
+        self.jobs = Jobs(track_lines=False)
+        self.written = set()
+        self.last_tm = None  # type: float
+        self.settle = settle
+        self.revive_days = revive_days
+
+    @classmethod
+    def load(cls, path: str) -> 'Checkpoint':
+        """Return the checkpoint saved in path, a new one if the file does not exist"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'rb') as fp:
+            checkpoint = pickle.load(fp)
+        if getattr(checkpoint, 'version', None) != CHECKPOINT_VERSION:
+            print('ERROR: {} is not a checkpoint of this version, starting over'.format(path))
+            return cls()
+        return checkpoint
+
+    def save(self, path: str) -> None:
+        """Drop the jobs that can no longer change and write the checkpoint to path"""
+        self.trim()
+        with open(path + '.tmp', 'wb') as fp:
+            pickle.dump(self, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)  # an interrupted save leaves the old checkpoint
+
+    def same_file(self, filename: str, mark: FileMark, stat: os.stat_result) -> bool:
+        """Return True if filename is the log mark was made for, possibly with lines added"""
+        if stat.st_size == mark.size and stat.st_mtime == mark.mtime:
+            return True
+        return stat.st_size >= mark.offset and head_hash(filename, mark.head_size) == mark.head_hash
+
+    def read(self, filenames: List[str]) -> List[Job]:
+        """
+        Parse what has been added to the log files since the last run
+
+        Arguments:
+            filenames: all the log files, in the order they would be read, the last one is the live log
+
+        Returns:
+            the jobs that finished and were not returned before, in the order they were submitted
+        """
+        jobs = self.jobs
+        jobs.finished = []
+        for (n, filename) in enumerate(filenames):
+            close = n < len(filenames) - 1
+            stat = os.stat(filename)
+            mark = self.files.get(filename)
+            if mark is not None and not self.same_file(filename, mark, stat):
+                print('{} has been replaced, reading it from the start'.format(filename))
+                mark = None
+            unchanged = mark is not None and (stat.st_size, stat.st_mtime) == (mark.size, mark.mtime)
+            if unchanged and (mark.closed or not close):
+                continue
+            # a log carried on from a run before keeps its file id, the latest one if it was replaced
+            file_id = None if mark is None else len(jobs.files) - 1 - jobs.files[::-1].index(filename)
+            follower = LogFollower(jobs, filename, self.settle, file_id=file_id)
+            if mark is not None:
+                (follower.offset, follower.lineno, follower.last_line) = (mark.offset, mark.lineno, mark.last_line)
+            # a compressed log is archived, it is read to the end, offsets are in the decompressed text
+            end = None if close else follower.complete_end(stat.st_size)
+            if end is None or end > follower.offset:
+                jobs.parse_spans(follower.spans(end), follower.file_id, follower.lineno, close=False)
+            if not close:
+                follower.settle_jobs()
+            elif follower.last_line:
+                jobs.restart_scheduler(follower.last_line)
+            head_size = min(HEAD_SIZE, follower.offset)
+            self.files[filename] = FileMark(stat.st_size, stat.st_mtime, head_size, head_hash(filename, head_size),
+                                            follower.offset, follower.lineno, follower.last_line, close)
+
+        finished = []
+        for job in jobs.finished:
+            if job not in self.written:
+                self.written.add(job)
+                finished.append(job)
+        jobs.finished = None
+        return sorted(finished, key=lambda j: j.index)
+
+    def events(self) -> Timeline:
+        """Return the events parsed by the last read(), the counts carry on from the run before"""
+        return self.jobs.timeline
+
+    def revivable(self, job: Job, horizon: float) -> bool:
+        """Return True if a retired job may still be restored or ended by a later line"""
+        last = job.stop_time or job.start_time or job.submit_time or 0
+        return job.exit in (None, 'shutdown', 'restored') and last >= horizon
+
+    def trim(self) -> None:
+        """Keep only the jobs that may still change and start a new timeline"""
+        jobs = self.jobs
+        times = [t for j in jobs.joblist for t in (j.submit_time, j.start_time, j.stop_time) if t]
+        if times:
+            self.last_tm = max(times + [self.last_tm or 0])
+        horizon = (self.last_tm or 0) - self.revive_days * 24 * 3600
+
+        # jobs that have been returned and ended long ago no longer need their number
+        for (number, job) in list(jobs.active.items()):
+            if job in self.written and (job.stop_time or job.submit_time or 0) < horizon:
+                job.number = None
+                del jobs.active[number]
+        retired = list(jobs.by_uuid.values()) + list(jobs.running_hosts.values())
+        jobs.retain(j for j in retired if self.revivable(j, horizon))
+        self.written &= set(jobs.joblist)
@@ -0,0 +1,169 @@
+"""
+Following a live scheduler log
+
+A LogFollower parses the lines appended to a log since it last looked.  The open jobs, the running
+hosts and the timeline stay in the Jobs between polls so only the new bytes are ever read.
+
+Jobs are returned as they finish: when they leave the active jobs at a scheduler restart, or once
+their exit is more than settle seconds old in log time.  The scheduler keeps logging for a job after
+its exit (working set, copying back the results) and those lines still update a job that has been
+returned, they just do not return it again.
+
+A follower runs for as long as the scheduler does, so after each poll the returned jobs and the
+events are dropped from the Jobs with Jobs.retain, as in js.stream.  Only the jobs that a later line
+may still change are kept: active jobs until their exit is revive_days old, and jobs retired at a
+restart without an exit, which may be restored by UniqueID or ended by a host reassignment.
+"""
+import os
+from typing import Callable, List
+
+from js.jsr import Jobs, Job, Timeline, LOG_CHUNK_SIZE, iter_log_spans, timestamp2float
+
+
+class LogFollower:
+    """
+    Parses a log file as it grows
+
+    Members:
+        jobs: the Jobs the lines are parsed into
+        filename: name of the log being followed
+        settle: seconds of log time after its exit before a job that is still active is finished
+        revive_days: days of log time a returned job is kept after it ends so that later lines can find it
+        events: None, or called with the timeline of the events parsed since the last poll before they
+                are dropped
+        file_id: index of filename in jobs.files, it is added to them unless given
+        offset: byte offset of the first line not parsed yet, only complete lines are parsed
+        lineno: line number of that line
+        last_tm: time of the last line parsed, None before the first line
+        last_line: the last line parsed that has a timestamp, a restart is logged at its time
+        exit_seen: active job -> log time its exit was first seen
+        returned: the jobs in jobs.joblist that have been returned
+    """
+
+    def __init__(self, jobs: Jobs, filename: str, settle: float = 60.0, revive_days: float = 7.0,
+                 events: Callable[[Timeline], None] = None, file_id: int = None) -> None:
+        self.jobs = jobs
+        self.filename = filename
+        self.settle = settle
+        self.revive_days = revive_days
+        self.events = events
+        self.offset = 0
+        self.lineno = 1
+        self.last_tm = None  # type: float
+        self.last_line = None  # type: str
+        if file_id is None:
+            file_id = len(jobs.files)
+            jobs.files.append(filename)
+        self.file_id = file_id
+        self.exit_seen = {}
+        self.returned = set()
+        if jobs.finished is None:
+            jobs.finished = []
+
+    def poll(self) -> List[Job]:
+        """
+        Parse the complete lines added to the log since the last poll
+
+        Returns:
+            the jobs that finished, in the order they finished
+        """
+        size = os.path.getsize(self.filename)
+        if size < self.offset:
+            # the log was replaced, start again at the top of the new one
+            self.offset = 0
+            self.lineno = 1
+            self.file_id = len(self.jobs.files)
+            self.jobs.files.append(self.filename)
+        end = self.complete_end(size)
+        if end > self.offset:
+            self.jobs.parse_spans(self.spans(end), self.file_id, self.lineno, close=False)
+        self.settle_jobs()
+        finished = self.drain()
+        self.trim()
+        return finished
+
+    def close(self) -> List[Job]:
+        """Close out the open jobs as at the end of a log and return the jobs that finished"""
+        if self.last_line:
+            self.jobs.restart_scheduler(self.last_line)
+        finished = self.drain()
+        self.trim()
+        return finished
+
+    def queue_depth(self):
+        """Return the (running, queued) number of jobs as of the last line parsed"""
+        return self.jobs.timeline.running_jobs, self.jobs.timeline.queued_jobs
+
+    def complete_end(self, size: int) -> int:
+        """Return the byte offset just after the last complete line, a line being written is left for later"""
+        with open(self.filename, 'rb') as fp:
+            pos = size
+            while pos > self.offset:
+                block = max(self.offset, pos - 4096)
+                fp.seek(block)
+                i = fp.read(pos - block).rfind(b'\n')
+                if i >= 0:
+                    return block + i + 1
+                pos = block
+        return self.offset
+
+    def spans(self, end: int):
+        """iter_log_spans from offset to end, keeping track of where the parsing is"""
+        for (offset, length, line) in iter_log_spans(self.filename, LOG_CHUNK_SIZE, self.offset, end):
+            self.offset = offset + length
+            self.lineno += 1
+            stripped = line.strip().lstrip('\ufeff')
+            if stripped:
+                # a continuation line has no time, restart_scheduler needs one
+                try:
+                    self.last_tm = timestamp2float(stripped.split(' - ', 1)[0])
+                    self.last_line = stripped
+                except (ValueError, IndexError):
+                    pass
+            yield offset, length, line
+
+    def settle_jobs(self) -> None:
+        """Finish the active jobs whose exit is more than settle seconds old"""
+        if self.last_tm is None:
+            return
+        for job in list(self.jobs.active.values()):
+            # a restored job has its exit set until it is released
+            if not job.exit or job in self.returned or (job.exit == 'restored' and job.stop_time is None):
+                continue
+            seen = self.exit_seen.setdefault(job, job.stop_time or self.last_tm)
+            if self.last_tm - seen >= self.settle:
+                self.jobs.finalize(job)
+
+    def drain(self) -> List[Job]:
+        """Return the jobs finalized since the last call that have not been returned before"""
+        finished = []
+        for job in self.jobs.finished:
+            self.exit_seen.pop(job, None)
+            if job not in self.returned:
+                self.returned.add(job)
+                finished.append(job)
+        self.jobs.finished.clear()
+        return finished
+
+    def revivable(self, job: Job, horizon: float) -> bool:
+        """Return True if a retired job may still be restored or ended by a later line"""
+        last = job.stop_time or job.start_time or job.submit_time or 0
+        return job.exit in (None, 'shutdown', 'restored') and last >= horizon
+
+    def trim(self) -> None:
+        """Pass on the events and drop them along with the returned jobs that can no longer change"""
+        jobs = self.jobs
+        if self.events is not None:
+            self.events(jobs.timeline)
+        horizon = (self.last_tm or 0) - self.revive_days * 24 * 3600
+        # returned jobs that ended long ago no longer need their number
+        for (number, job) in list(jobs.active.items()):
+            if job in self.returned and (job.stop_time or job.submit_time or 0) < horizon:
+                job.number = None
+                del jobs.active[number]
+        retired = list(jobs.by_uuid.values()) + list(jobs.running_hosts.values())
+        keep = [j for j in jobs.joblist if j not in self.returned]
+        jobs.retain(keep + [j for j in retired if self.revivable(j, horizon)])
+        kept = set(jobs.joblist)
+        self.returned &= kept
+        self.exit_seen = {job: tm for (job, tm) in self.exit_seen.items() if job in kept}
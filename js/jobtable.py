@@ -0,0 +1,158 @@
+"""
+Columnar store of parsed jobs
+
+JobTable keeps one row per job in growable NumPy arrays so that summaries and exports can be computed
+over the whole job history at once instead of looping over Job objects.  Row i is Jobs.joblist[i].
+
+Missing times and sizes are NaN, missing integers are -1 and missing categories have the code -1.
+"""
+import time
+from typing import Dict, Any
+
+import numpy as np
+
+
+# column name -> dtype of the numeric columns
+FLOAT_COLUMNS = [
+    ('submitted', np.float64),   # epoch seconds
+    ('start', np.float64),
+    ('stop', np.float64),
+    ('queued', np.float64),      # seconds
+    ('duration', np.float64),
+    ('results_copy', np.float64),
+    ('working_set', np.float32),  # MB
+]
+INT_COLUMNS = [
+    ('priority', np.int32),
+    ('min_proc', np.int32),
+    ('threads', np.int32),
+    ('max_proc', np.int32),
+    ('processors', np.int32),
+    ('files_remaining', np.int32),
+]
+# columns stored as integer codes into Categories
+CATEGORY_COLUMNS = ['user', 'host', 'simulator', 'exit', 'version', 'req_perf', 'req_mem']
+
+
+class Categories:
+    """Maps labels to small integer codes, codes are given out in the order labels are first seen"""
+
+    def __init__(self):
+        self.labels = []  # code -> label
+        self.codes = {}  # type: Dict[str, int]
+
+    def code(self, label: Any) -> int:
+        if label is None or label == '':
+            return -1
+        c = self.codes.get(label)
+        if c is None:
+            c = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return c
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Return an object array of the labels for codes, None where the code is -1"""
+        labels = np.array(self.labels + [None], dtype=object)
+        return labels[codes]  # -1 indexes the trailing None
+
+
+class JobTable:
+    """
+    Growable columns of job fields, one row per job
+
+    Members:
+        columns: dict of column name -> array, the arrays have spare capacity, use column() for the rows
+        categories: dict of category column name -> Categories
+        final: bool column, True once the job has been finalized (it is no longer active in the log)
+        has_duration: bool column, True if the job has a duration, it may be NaN if the start time was
+                      lost in a restart
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.size = 0
+        self.capacity = capacity
+        self.columns = {}  # type: Dict[str, np.ndarray]
+        for name, dtype in FLOAT_COLUMNS:
+            self.columns[name] = np.full(capacity, np.nan, dtype=dtype)
+        for name, dtype in INT_COLUMNS:
+            self.columns[name] = np.full(capacity, -1, dtype=dtype)
+        for name in CATEGORY_COLUMNS:
+            self.columns[name] = np.full(capacity, -1, dtype=np.int32)
+        self.columns['final'] = np.zeros(capacity, dtype=bool)
+        self.columns['has_duration'] = np.zeros(capacity, dtype=bool)
+        self.categories = {name: Categories() for name in CATEGORY_COLUMNS}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def grow(self, capacity: int) -> None:
+        """Make room for at least capacity rows, the arrays double in size so appends stay cheap"""
+        if capacity <= self.capacity:
+            return
+        new_capacity = max(capacity, 2 * self.capacity)
+        for name, col in self.columns.items():
+            fill = np.nan if col.dtype.kind == 'f' else (False if col.dtype == bool else -1)
+            grown = np.full(new_capacity, fill, dtype=col.dtype)
+            grown[:self.size] = col[:self.size]
+            self.columns[name] = grown
+        self.capacity = new_capacity
+
+    def append(self, job) -> int:
+        """Add a row for job and return its index"""
+        self.grow(self.size + 1)
+        row = self.size
+        self.size += 1
+        self.store(row, job)
+        return row
+
+    def store(self, row: int, job, final: bool = False) -> None:
+        """Write the current fields of job into row"""
+        cols = self.columns
+        for name, value in (('submitted', job.submit_time), ('start', job.start_time), ('stop', job.stop_time),
+                            ('queued', job.wait_time), ('duration', job.run_time),
+                            ('results_copy', job.copy_time), ('working_set', job.mem_mb)):
+            cols[name][row] = np.nan if value is None else value
+        for name, value in (('priority', job.priority), ('min_proc', job.min_proc), ('threads', job.threads),
+                            ('max_proc', job.max_proc), ('processors', job.processors),
+                            ('files_remaining', job.files_left)):
+            cols[name][row] = value if isinstance(value, int) else -1
+        cats = self.categories
+        cols['user'][row] = cats['user'].code(job.user)
+        cols['host'][row] = cats['host'].code(job.host)
+        cols['simulator'][row] = cats['simulator'].code(job.sim())
+        cols['exit'][row] = cats['exit'].code(job.exit)
+        cols['version'][row] = cats['version'].code(job.version)
+        cols['req_perf'][row] = cats['req_perf'].code(job.req_perf)
+        cols['req_mem'][row] = cats['req_mem'].code(job.req_mem)
+        cols['has_duration'][row] = job.run_time is not None
+        cols['final'][row] = final
+
+    def column(self, name: str) -> np.ndarray:
+        """Return the rows of a column, this is a view so do not keep it across appends"""
+        return self.columns[name][:self.size]
+
+    def labels(self, name: str) -> np.ndarray:
+        """Return the rows of a category column as an object array of labels"""
+        return self.categories[name].decode(self.column(name))
+
+    def counts(self, name: str) -> Dict[str, int]:
+        """Return label -> number of jobs for a category column, jobs with no label are not counted"""
+        codes = self.column(name)
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories[name].labels))
+        return dict(zip(self.categories[name].labels, counts.tolist()))
+
+
+def local_seconds(seconds: np.ndarray) -> np.ndarray:
+    """
+    Return epoch seconds shifted by the local UTC offset, as time.localtime would see them, NaN stays NaN
+
+    Time zone offsets and their changes are whole quarter hours so time.localtime is only called once for
+    each quarter hour.
+    """
+    missing = np.isnan(seconds)
+    quarters = np.floor(seconds[~missing] / 900.0)
+    (unique, inverse) = np.unique(quarters, return_inverse=True)
+    offsets = np.array([time.localtime(q * 900.0).tm_gmtoff for q in unique.tolist()], dtype=np.float64)
+    local = np.full(len(seconds), np.nan)
+    local[~missing] = seconds[~missing] + offsets[inverse]
+    return local
@@ -1,9 +1,8 @@
 # python 3.4 only due to use of nonlocal
 
 # standard python includes
-import os
-import sys
-from collections import Counter
+import time
+from collections import namedtuple
 import pandas as pd
 import numpy as np
 
@@ -19,16 +18,181 @@ class ImproperFormat(Exception):
         return repr(self.value)
 
 
-def read_and_validate(filename):
-    df = pd.read_csv(filename)
-
-    # validate the columns we have to have
-    required_cols = ['simulator', 'exit_code', 'duration_m', 'user']
-    for c in required_cols:
-        if c not in df.columns:
+# dtypes of the columns of the jobs csv, the date columns are parsed as dates.  user, simulator and host
+# are grouped and pivoted on, they are strings rather than categories so that a groupby or pivot_table of
+# a filtered frame does not have rows of zeros for the values that were filtered out
+CSV_DTYPES = {
+    'submitted_time': 'Int8',
+    'submitted_day': 'category',
+    'start_time': 'Int8',
+    'start_day': 'category',
+    'duration_m': 'float32',
+    'wait_m': 'float32',
+    'user': 'str',
+    'simulator': 'str',
+    'host': 'str',
+    'working_set': 'float32',
+    'priority': 'Int32',
+    'min_proc': 'Int32',
+    'threads': 'Int32',
+    'max_proc': 'Int32',
+    'req_perf': 'category',
+    'req_mem': 'category',
+    'exit_code': 'category',
+    'results_copy_m': 'float32',
+    'uuid': 'str',
+    'version': 'category',
+}
+DATE_COLUMNS = ['submitted_date', 'start_date']
+# dtype read_csv parses the dates into, its resolution depends on the version of pandas
+DATE_DTYPE = pd.to_datetime(pd.Series(['2016-01-01'])).dtype
+# read_csv is slow to parse nullable integers, they are read as floats and converted
+_READ_DTYPES = {c: 'float64' if t.startswith('Int') else t for (c, t) in CSV_DTYPES.items()}
+REQUIRED_COLUMNS = ['simulator', 'exit_code', 'duration_m', 'user']
+
+
+def validate(df, usecols=None):
+    """Raise ImproperFormat if df is missing a required column, only the columns in usecols are required"""
+    for c in REQUIRED_COLUMNS:
+        if c not in df.columns and (usecols is None or c in usecols):
             raise ImproperFormat('Required column named {} is missing'.format(c))
 
-    return df
+
+def read_and_validate(filename, usecols=None, chunksize=None):
+    """
+    Read a jobs csv with the column types of CSV_DTYPES and check it has the required columns
+
+    Arguments:
+        filename: the csv file, or a file like object
+        usecols: the columns to read, all of them if None
+        chunksize: if given, return an iterator of dataframes of chunksize jobs so that files larger than
+                   memory can be processed a chunk at a time, see aggregate_csv
+
+    Returns:
+        a dataframe, or an iterator of dataframes
+    """
+    dates = [c for c in DATE_COLUMNS if usecols is None or c in usecols]
+    try:
+        result = pd.read_csv(filename, dtype=_READ_DTYPES, parse_dates=dates, usecols=usecols, chunksize=chunksize)
+    except ValueError as e:
+        raise ImproperFormat(str(e))
+    if chunksize is None:
+        return _typed(result, usecols)
+    return _typed_chunks(result, usecols)
+
+
+def _typed(df, usecols):
+    validate(df, usecols)
+    return df.astype({c: t for (c, t) in CSV_DTYPES.items() if c in df.columns and t.startswith('Int')})
+
+
+def _typed_chunks(reader, usecols):
+    with reader:
+        for chunk in reader:
+            yield _typed(chunk, usecols)
+
+
+def combine_stats(parts):
+    """
+    Combine group_stats of parts of the jobs into the statistics of all of them
+
+    Counts, sums and maximums add up across parts and the mean is recomputed from them, medians do not
+    combine and are dropped.
+    """
+    stats = pd.concat(parts)
+    grouped = stats.groupby(level=list(range(stats.index.nlevels)), dropna=False, sort=True)
+    how = {}
+    for c in stats.columns:
+        if c == 'jobs' or c.endswith('_count') or c.endswith('_sum'):
+            how[c] = 'sum'
+        elif c.endswith('_max'):
+            how[c] = 'max'
+    result = grouped.agg(how)
+    for c in stats.columns:
+        if c.endswith('_mean'):
+            column = c[:-len('_mean')]
+            result[c] = result[column + '_sum'] / result[column + '_count'].where(result[column + '_count'] > 0)
+    return result
+
+
+def aggregate_csv(filename, keys, columns=('duration_m', 'wait_m'), chunksize=1000000):
+    """
+    Compute group_stats of a jobs csv a chunk at a time, for files larger than memory
+
+    Only the key and statistic columns are read.  The result is as group_stats with stats count, sum, max
+    and mean.
+    """
+    usecols = list(dict.fromkeys(list(keys) + list(columns)))
+    parts = [group_stats(chunk, keys, columns, ('count', 'sum', 'max', 'mean'))
+             for chunk in read_and_validate(filename, usecols=usecols, chunksize=chunksize)]
+    return combine_stats(parts)
+
+
+# day names in the locale, as the day columns of the csv, Monday first
+DAY_NAMES = [time.strftime('%A', time.gmtime((4 + n) * 24 * 3600)) for n in range(7)]
+
+
+def _categorical(codes, labels):
+    """Return category codes (-1 is missing) as a Categorical"""
+    return pd.Categorical.from_codes(codes, categories=pd.Index(labels, dtype=object))
+
+
+def _labels(codes, labels):
+    """Return category codes (-1 is missing) as the labels, with None for missing"""
+    return np.array(list(labels) + [None], dtype=object)[codes]
+
+
+def _integers(values):
+    """Return an integer column (-1 is missing) as a nullable integer array"""
+    return pd.arrays.IntegerArray(values.copy(), values < 0)
+
+
+def _date_columns(seconds):
+    """Return the local date, hour and day of week columns of epoch seconds, as time2tuple but for all rows"""
+    from js.jobtable import local_seconds
+    local = local_seconds(seconds)
+    missing = np.isnan(local)
+    days = np.floor(np.where(missing, 0, local) / (24 * 3600)).astype(np.int64)
+    dates = days.astype('datetime64[D]').astype('datetime64[s]')
+    dates[missing] = np.datetime64('NaT')
+    hours = ((np.where(missing, 0, local) - days * 24 * 3600) // 3600).astype(np.int32)
+    weekdays = np.where(missing, -1, (days + 3) % 7)  # 1970-01-01 was a Thursday
+    return dates, pd.arrays.IntegerArray(hours, missing), _categorical(weekdays, DAY_NAMES)
+
+
+def jobs_dataframe(jobs):
+    """
+    Return the jobs of a job list as a DataFrame with the columns of the csv, without writing and reading a csv
+
+    The columns are built from the JobTable of the job list: dates are datetime64, hours and integers are
+    nullable integers, intervals are minutes rounded as in the csv and the columns are of the types in
+    CSV_DTYPES.  The version column has the scheduler version, it is empty in the csv.
+    """
+    table = jobs.job_table()
+    if table is None:
+        raise ImportError('the job table needs numpy')
+    columns = {}
+    for name in ('submitted', 'start'):
+        (dates, hours, days) = _date_columns(table.column(name))
+        columns[name + '_date'] = dates
+        columns[name + '_time'] = hours
+        columns[name + '_day'] = days
+    columns['duration_m'] = np.round(table.column('duration') / 60.0, 2)
+    columns['wait_m'] = np.round(table.column('queued') / 60.0, 2)
+    for name in ('user', 'simulator', 'host'):
+        columns[name] = _labels(table.column(name), table.categories[name].labels)
+    columns['working_set'] = table.column('working_set').astype(np.float64)
+    for name in ('priority', 'min_proc', 'threads', 'max_proc'):
+        columns[name] = _integers(table.column(name))
+    for (name, col) in (('req_perf', 'req_perf'), ('req_mem', 'req_mem'), ('exit_code', 'exit')):
+        columns[name] = _categorical(table.column(col), table.categories[col].labels)
+    columns['results_copy_m'] = np.round(table.column('results_copy') / 60.0, 2)
+    columns['uuid'] = [j.uuid for j in jobs.joblist]
+    columns['version'] = _categorical(table.column('version'), table.categories['version'].labels)
+    # the same types as read_and_validate of the csv, the categories are already built
+    types = {c: t for (c, t) in CSV_DTYPES.items() if t not in ('category', 'str')}
+    types.update((c, DATE_DTYPE) for c in DATE_COLUMNS)
+    return pd.DataFrame(columns).astype(types)
 
 
 def jobs_with_duration(jobs_df):
@@ -46,97 +210,205 @@ def sim_list(df):
     return sorted([x for x in df.simulator.unique() if isinstance(x, str)])
 
 
+# exit_code -> exit category of jobs_by_type, any other exit is 'Other Disposition'
+EXIT_CATEGORIES = {
+    '0': 'Completed Successfully',
+    'cancelled': 'Cancelled by User',
+    'host_reassigned': 'Host Reassigned',
+    'shutdown': 'Scheduler Shutdown',
+}
+OTHER_EXIT = 'Other Disposition'
+
+
+def exit_categories(exit_codes):
+    """Return the exit category of each exit code as a Categorical, the exit codes are only looked at once each"""
+    labels = list(EXIT_CATEGORIES.values()) + [OTHER_EXIT]
+    codes = pd.Categorical(exit_codes)
+    # the category code of each exit code, the trailing OTHER_EXIT is for missing exit codes (code -1)
+    mapping = [labels.index(EXIT_CATEGORIES.get(str(c), OTHER_EXIT)) for c in codes.categories] + [len(labels) - 1]
+    return pd.Categorical.from_codes(np.array(mapping, dtype=np.int8)[codes.codes], categories=labels)
+
+
+# the statistics group_stats computes by default
+STATS = ('count', 'sum', 'max', 'mean', 'median')
+
+
+def group_stats(jobs_df, keys, columns=('duration_m', 'wait_m'), stats=STATS):
+    """
+    Compute statistics of columns for each group of jobs in one grouped pass
+
+    Arguments:
+        jobs_df: the jobs
+        keys: the columns to group by, an empty list gives a single row for all the jobs
+        columns: the columns to compute the statistics of
+        stats: the statistics to compute, count is the number of values
+
+    Returns:
+        a dataframe indexed by the keys with the number of jobs and a <column>_<stat> column for each statistic,
+        missing values are skipped and a missing key is a group of its own
+    """
+    columns = list(columns)
+    if not keys:
+        row = {'jobs': len(jobs_df)}
+        if columns:
+            values = jobs_df[columns].agg(list(stats))
+            row.update(('{}_{}'.format(c, stat), int(values.at[stat, c]) if stat == 'count' else values.at[stat, c])
+                       for c in columns for stat in stats)
+        return pd.DataFrame([row])
+    grouped = jobs_df.groupby(list(keys), observed=True, dropna=False, sort=True)
+    result = pd.DataFrame({'jobs': grouped.size()})
+    if columns:
+        values = grouped[columns].agg(list(stats))
+        values.columns = ['{}_{}'.format(c, stat) for (c, stat) in values.columns]
+        result = result.join(values)
+    return result
+
+
+def job_stats(jobs_df):
+    """Compute the duration and wait statistics for each (simulator, user, exit category) of jobs"""
+    df = jobs_df.assign(exit_category=exit_categories(jobs_df.exit_code))
+    return group_stats(df, ['simulator', 'user', 'exit_category'])
+
+
+def _lookup(stats, key, column):
+    """Return stats[column] for key, NaN if there is no group for key"""
+    return stats.at[key, column] if key in stats.index else np.nan
+
+
+def stats_table(jobs_df, column, rows, simulators):
+    """
+    Build a table of statistics of a column with a row per statistic and a column per simulator
+
+    Arguments:
+        jobs_df: the jobs
+        column: the column the statistics are computed on
+        rows: list of (row label, statistic) where statistic is a group_stats statistic, eg 'max'
+        simulators: the simulator columns to add after 'Overall'
+    """
+    stats = [stat for (label, stat) in rows]
+    overall = group_stats(jobs_df, [], [column], stats)
+    by_sim = group_stats(jobs_df, ['simulator'], [column], stats) if simulators else overall
+    results = {}
+    for (label, stat) in rows:
+        name = '{}_{}'.format(column, stat)
+        row = {'Overall': overall[name].iloc[0]}
+        for sim in simulators:
+            row[sim] = _lookup(by_sim, sim, name)
+        results[label] = row
+    return pd.DataFrame.from_dict(results, orient="index")
+
+
 def jobs_by_type(jobs_df, sim_breakdown=True):
     """Compute a dataframe of the number of jobs by completion type"""
-    results = {}
     simulators = sim_list(jobs_df) if sim_breakdown else []
+    df = jobs_df.assign(exit_category=exit_categories(jobs_df.exit_code))
+    counts = group_stats(df, ['exit_category', 'simulator'], columns=())['jobs']
+    counts = counts.unstack('simulator', fill_value=0) if len(counts) else pd.DataFrame()
+
+    results = {}
 
-    def add_row(label, df):
-        nonlocal results
-        row = {}
-        row['Total'] = len(df)
-        vc = df.simulator.value_counts()
+    def add_row(label, row_counts):
+        row = {'Total': int(row_counts.sum())}
         for sim in simulators:
-            row[sim] = vc[sim] if sim in vc else 0
+            row[sim] = int(row_counts[sim]) if sim in row_counts.index else 0
         results[label] = row
 
-    add_row('Jobs Submitted', jobs_df)
-    add_row('Completed Successfully', jobs_df[jobs_df.exit_code == '0'])
-    add_row('Cancelled by User', jobs_df[jobs_df.exit_code == 'cancelled'])
-    add_row('Host Reassigned', jobs_df[jobs_df.exit_code == 'host_reassigned'])
-    add_row('Scheduler Shutdown', jobs_df[jobs_df.exit_code == 'shutdown'])
-    add_row('Other Disposition', jobs_df[~ jobs_df.exit_code.isin(['0', 'cancelled', 'shutdown', 'host_reassigned'])])
+    add_row('Jobs Submitted', counts.sum(axis=0))
+    for label in list(EXIT_CATEGORIES.values()) + [OTHER_EXIT]:
+        add_row(label, counts.loc[label] if label in counts.index else pd.Series(dtype=int))
 
     return pd.DataFrame.from_dict(results, orient="index")
 
 
 def duration_stats(jobs_df, sim_breakdown=True):
     """Computes statistics on the durations of all jobs in the list"""
-
-    results = {}
     simulators = sim_list(jobs_df) if sim_breakdown else []
     # only keep jobs that have durations
     df = jobs_with_duration(jobs_df)
-
-    def add_row(label, stat_func):
-        nonlocal results
-        row = {}
-        row['Overall'] = stat_func(df.duration_m)
-        for sim in simulators:
-            row[sim] = stat_func(df[df.simulator == sim].duration_m)
-        results[label] = row
-
-    add_row('Longest Job', max)
-    add_row('Average Job Duration', np.mean)
-    add_row('Median Job Duration', np.median)
-
-    return pd.DataFrame.from_dict(results, orient="index")
+    rows = [('Longest Job', 'max'), ('Average Job Duration', 'mean'), ('Median Job Duration', 'median')]
+    return stats_table(df, 'duration_m', rows, simulators)
 
 
 def wait_stats(jobs_df, sim_breakdown=True):
     """Compute statistics on the amount of time jobs wait in the queue"""
-
-    results = {}
     simulators = sim_list(jobs_df) if sim_breakdown else []
     # only keep jobs that were not cancelled
     df = jobs_df[jobs_df.exit_code != 'cancelled']
-
-    def add_row(label, stat_func):
-        nonlocal results
-        row = {}
-        row['Overall'] = stat_func(df.wait_m)
-        for sim in simulators:
-            row[sim] = stat_func(df[df.simulator == sim].wait_m)
-        results[label] = row
-
-    add_row('Longest Wait', max)
-    add_row('Average Wait', np.mean)
-    add_row('Median Wait', np.median)
-
-    return pd.DataFrame.from_dict(results, orient="index")
+    rows = [('Longest Wait', 'max'), ('Average Wait', 'mean'), ('Median Wait', 'median')]
+    return stats_table(df, 'wait_m', rows, simulators)
 
 
 def median_by_user(jobs_df, sim_breakdown=True):
     """Compute the median simulation time of successful jobs by user"""
-    results = {}
     simulators = sim_list(jobs_df) if sim_breakdown else []
-    # only keep jobs that were not cancelled
-    jobs_df = succeeded_jobs(jobs_df)
+    df = successful_jobs(jobs_df)
+    overall = group_stats(df, ['user'], ['duration_m'], ['median'])
+    by_sim = group_stats(df, ['user', 'simulator'], ['duration_m'], ['median']) if simulators else overall
 
-    def add_row(label, df):
-        nonlocal results
-        row = {}
-        row['Overall'] = np.median(df.duration_m)
+    results = {}
+    for user in sorted(u for u in df.user.unique() if isinstance(u, str)):
+        row = {'Overall': overall.at[user, 'duration_m_median']}
         for sim in simulators:
-            row[sim] = np.median(df[df.simulator == sim].duration_m)
-        results[label] = row
-
-    for user in sorted(df.user.unique()):
-        add_row(user, jobs_df[jobs_df.user == user])
+            row[sim] = _lookup(by_sim, (user, sim), 'duration_m_median')
+        results[user] = row
 
     return pd.DataFrame.from_dict(results, orient="index")
 
 
+# the edges of histogram bins and a label for each bin
+Bins = namedtuple('Bins', ['edges', 'labels'])
+
+# the bins of the histograms of the notebook, durations and waits in minutes, working sets in MB
+BIN_PRESETS = {
+    'duration': Bins([0, 1, 5, 10, 60, 300, 5000], ['<1m', '1-5', '5-10', '10-60', '60-300', '>300']),
+    'wait': Bins([0, 1, 5, 30, 60, 240, 20000], ['<1m', '1-5m', '5-30m', '30-60m', '1-4h', '>4h']),
+    'working_set_axiem': Bins([0, 500, 1000, 2000, 4000, 8000, 90000],
+                              ['<500m', '.5-1G', '1-2G', '2-4G', '4-8G', '>8G']),
+    'working_set_analyst': Bins([0, 1000, 2000, 4000, 8000, 16000, 90000],
+                                ['<1G', '1-2G', '2-4G', '4-8G', '8-16G', '>16G']),
+    'working_set_large': Bins(list(range(8000, 21000, 2000)),
+                              ['8-10G', '10-12G', '12-14G', '14-16G', '16-18G', '18-20G']),
+}
+
+
+def histogram(jobs_df, column, bins='duration', by='simulator'):
+    """
+    Count the jobs in each bin of a column for every group of jobs, in one pass over the frame
+
+    The bins are as np.histogram: [edge, next edge) with the last bin closed, values outside the edges
+    or missing are not counted.
+
+    Arguments:
+        jobs_df: the jobs, eg successful_jobs(df)
+        column: the column to bin, eg 'duration_m' or 'working_set'
+        bins: the name of one of the BIN_PRESETS, a Bins or a list of edges
+        by: the column to group by, eg 'simulator', 'user' or 'host', None for a single 'Overall' row
+
+    Returns:
+        a dataframe of counts with a row per group and a column per bin
+    """
+    if isinstance(bins, str):
+        bins = BIN_PRESETS[bins]
+    if not isinstance(bins, Bins):
+        bins = Bins(list(bins), ['{}-{}'.format(a, b) for (a, b) in zip(bins[:-1], bins[1:])])
+    edges = np.asarray(bins.edges, dtype=np.float64)
+    n = len(edges) - 1
+
+    values = jobs_df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+    index = np.searchsorted(edges, values, side='right') - 1
+    index[values == edges[-1]] = n - 1  # the last bin includes its upper edge
+    if by is None:
+        (groups, names) = (np.zeros(len(values), dtype=np.intp), pd.Index(['Overall']))
+    else:
+        (groups, names) = pd.factorize(jobs_df[by], sort=True)
+    keep = (index >= 0) & (index < n) & (groups >= 0)
+    counts = np.bincount(groups[keep] * n + index[keep], minlength=len(names) * n).reshape(len(names), n)
+    # a group is a row if it has jobs, even if none of them are in a bin
+    present = np.bincount(groups[groups >= 0], minlength=len(names)) > 0
+    result = pd.DataFrame(counts[present], index=pd.Index(np.asarray(names)[present], name=by), columns=bins.labels)
+    return result.sort_index()
+
+
 if __name__ == '__main__':
     df = read_and_validate('jobs.csv')
-    print(median_by_user(df))
\ No newline at end of file
+    print(median_by_user(df))
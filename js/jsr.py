@@ -13,22 +13,37 @@ This is very much a work-in-progress.  For additional information or
 enhancement requests contact dane@awr.com
 """
 
-from typing import List, Union, Dict, Tuple, IO, Any
+from typing import List, Union, Dict, Tuple, IO, Any, Iterator, Optional
 
 # standard imports
-import codecs
+import mmap
+import os
+from array import array
 import re
 import time
-from collections import defaultdict
+from collections import namedtuple
 from collections import Counter
+from collections.abc import MutableMapping
 from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
 import sys
 
+try:
+    import numpy as np
+    from js.jobtable import JobTable
+except ImportError:  # numpy is optional, without it Jobs has no columnar table
+    np = None
+    JobTable = None
+
+from js.util import open_log, is_compressed
+
 
 # Set to a port to generate debug information during run
 debug_port = None  # type: IO[str]
 
-running_hosts = {}  # type: Dict
+# Size of the buffered reads used when streaming a log file
+LOG_CHUNK_SIZE = 1024 * 1024
 
 
 def dprint(*args) -> None:
@@ -118,24 +133,159 @@ def float_to_date(f: float) -> str:
         return ''
 
 
+@lru_cache(maxsize=4096)
+def hour_epoch(hour: str, tzname: Tuple[str, str]) -> Union[float, bool]:
+    """ Return the time float of the start of an hour, False if the clocks change during it
+
+        Arguments:
+            hour: the YYYY-MM-DDTHH prefix of a timestamp
+            tzname: time.tzname, part of the key so a time.tzset() to another zone is not served old hours
+    """
+    (year, month, day, hr) = (int(hour[:4]), int(hour[5:7]), int(hour[8:10]), int(hour[11:13]))
+    base = time.mktime((year, month, day, hr, 0, 0, 0, 0, -1))
+    if time.mktime((year, month, day, hr, 59, 59, 0, 0, -1)) - base != 3599:
+        # the clocks change part way through this hour so it can't be done as an offset
+        return False
+    return base
+
+
 def timestamp2float(ts: str) -> float:
     """ Converts a timestamp of the form 2016-03-10T04:15:02.0036 into a time float
 
+        The layout is fixed so the fields are sliced out directly instead of going through
+        strptime.  Only the start of each hour goes through mktime, hour_epoch caches it so
+        the local time conversion is done once per hour of log.
+
         Arguments:
-            ts: timestamp string
+            ts: timestamp string, the fractional part can be 3 or 4 digits
 
         Returns:
-            floating point time from mktime with microseconds added to it.
+            floating point time from mktime with the fraction of a second added to it.
+
+    """
+    if not ts[0].isdigit():
+        ts = ts[1:]  # hack because of utf char added by cat!
+    base = hour_epoch(ts[:13], time.tzname)
+    if base is False:
+        float_time = time.mktime(time.strptime(ts[:19], "%Y-%m-%dT%H:%M:%S"))
+    else:
+        float_time = base + int(ts[14:16]) * 60 + int(ts[17:19])
+    fraction = ts[20:]
+    return float_time + int(fraction) / 10 ** len(fraction)
+
+
+def iter_log_spans(filename: str, chunk_size: int = LOG_CHUNK_SIZE,
+                   start: int = 0, end: int = None) -> Iterator[Tuple[int, int, str]]:
+    """ Yield the lines of a log file one at a time along with where they are in the file
+
+        The file is read through a buffer of chunk_size bytes so memory use does not
+        depend on the size of the log.  Scheduler logs are written with LF or CRLF
+        line endings so lines are split on LF before being decoded.  Compressed logs
+        (.gz, .bz2, .xz) are decompressed as they are read and the offsets are those
+        of the decompressed text.
+
+        Arguments:
+            filename: name of the log file
+            chunk_size: number of bytes read from the file at a time
+            start: byte offset to start at, must be the start of a line
+            end: byte offset to stop at, the end of the file if None
+
+        Returns:
+            an iterator of (byte offset, length in bytes, decoded line including the line ending)
+    """
+    offset = start
+    with open_log(filename, chunk_size) as fp:
+        if start:
+            fp.seek(start)
+        for raw in fp:
+            if end is not None and offset >= end:
+                break
+            yield offset, len(raw), raw.decode('utf-8')
+            offset += len(raw)
+
+
+def iter_log_mmap(filename: str, start: int = 0, end: int = None) -> Iterator[Tuple[int, int, Optional[str]]]:
+    """ Yield the lines of a log file like iter_log_spans, with None in place of the lines the parser ignores
+
+        The file is memory mapped and each line is first looked at as raw bytes, as skip_raw_line
+        does.  Only the lines that may reach a handler are decoded, the others are passed over as
+        bytes.  The last line is always decoded as its time stamp is used to close out the
+        log.  Compressed logs cannot be mapped, use iter_log_spans for them.
+
+        Arguments:
+            filename: name of the log file
+            start: byte offset to start at, must be the start of a line
+            end: byte offset to stop at, the end of the file if None
+
+        Returns:
+            an iterator of (byte offset, length in bytes, decoded line including the line ending or None)
+    """
+    with open(filename, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        stop = size if end is None else min(end, size)
+        if start >= stop:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            mm.seek(start)
+            (readline, match) = (mm.readline, _skip_re.match)
+            pos = start
+            while pos < stop:
+                raw = readline()
+                n = len(raw)
+                i = raw.find(b' - ')
+                if i >= 0 and pos + n < stop and match(raw, i + 3):
+                    yield pos, n, None
+                else:
+                    yield pos, n, raw.decode('utf-8')
+                pos += n
 
+
+def log_spans(filename: str, chunk_size: int = LOG_CHUNK_SIZE,
+              start: int = 0, end: int = None) -> Iterator[Tuple[int, int, Optional[str]]]:
+    """ Return the fastest line iterator for a log, iter_log_mmap unless the log is compressed or debugging
+        output is on, then every line is decoded by iter_log_spans so unmatched lines can be printed
     """
-    (time_stamp, fractseconds) = ts.split('.')
-    if len(time_stamp) != 19:
-        time_stamp = time_stamp[1:]  # hack because of utf char added by cat!
+    if is_compressed(filename) or debug_port is not None:
+        return iter_log_spans(filename, chunk_size, start, end)
+    return iter_log_mmap(filename, start, end)
+
+
+def iter_log_lines(filename: str, chunk_size: int = LOG_CHUNK_SIZE) -> Iterator[str]:
+    """ Yield the decoded lines of a log file one at a time, see iter_log_spans"""
+    for (offset, length, line) in iter_log_spans(filename, chunk_size):
+        yield line
+
 
-    msgtm = time.strptime(time_stamp, "%Y-%m-%dT%H:%M:%S")
-    float_time = time.mktime(msgtm)
-    float_time += float(fractseconds) / 10000
-    return float_time
+def read_log_spans(filename: str, spans: List[Tuple[int, int]]) -> List[str]:
+    """ Read back lines of a log file from their (byte offset, length) without reading the file
+
+        Arguments:
+            filename: name of the log file
+            spans: list of (byte offset, length) as returned by iter_log_spans
+
+        Returns:
+            the lines with line endings and any byte order mark removed
+    """
+    if is_compressed(filename):
+        # a compressed log can only be read forward, seeking back starts again from the top
+        with open_log(filename) as fp:
+            lines = []
+            for (offset, length) in spans:
+                fp.seek(offset)
+                lines.append(fp.read(length).decode('utf-8'))
+    else:
+        with open(filename, 'rb') as fp:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = [mm[offset:offset + length].decode('utf-8') for (offset, length) in spans]
+    return [line.rstrip().lstrip('\ufeff') for line in lines]
+
+
+_controller_re = re.compile('to controller "(.*)"')
+
+
+def assigned_host(message: str) -> str:
+    """ Return the host name from an assigned message, e.g. assigned AXIEM:8.0 to controller "sim03" """
+    return _controller_re.search(message).group(1)
 
 
 def to_int_or_na(i):
@@ -148,14 +298,242 @@ def to_int_or_na(i):
         return float('nan')
 
 
+# ############################################################################ LINE CLASSIFICATION
+# Every line the parser cares about is identified by a substring.  This list is in priority
+# order: a line containing several of the substrings is of the first kind listed.  The kind
+# is the name of the Job method that handles the line, or a name handled by Jobs itself.
+LINE_KINDS = [
+    ('Found version', 'found'),
+    ('Submitted.', 'submitted'),
+    ('restored. UniqueID', 'restored'),  # Job 1 restored. UniqueID={828BDD14-...-ACDCCF69756A}
+    ('Creating Process', 'creating'),
+    ('on controller', 'started'),
+    ('releasing', 'releasing'),
+    ('Job Scheduler shutting down', 'shutdown'),  # Scheduler shutting down with exit code 0x00000000
+    ('Processing Command Line', 'restart'),
+    ('MaxProcessors', 'request_info'),
+    ('peak working set =', 'working_set'),  # could be peak working set not reported so = needed
+    ('Exit status', 'exit_status'),
+    ('exit code ', 'exit_code'),  # this will also match scheduler shutdown, must come after
+    ('- Dequeueing job', 'cancelled'),  # V11
+    ('- Dequeueing pending job j', 'cancelled'),
+    ('Dequeueing scheduled job', 'cancelled'),  # v12 dequeue different from v11
+    (': Dequeueing job', 'cancelled'),  # v14 change dequeing syntax again
+    ('Setting job to CANCELING state', 'cancelled'),
+    ('Terminating job', 'terminated'),  # 2016-....0468 - Terminating job number 26 (mpiexec:2.2)
+    ('Output Files remaining:', 'copy_back'),
+    ('Registering Task token', 'ignore'),  # we don't need to track these for now
+    ('Registering task id', 'ignore'),
+    ('Child Process', 'ignore'),  # child process exit messages, we don't need these
+    ('assigned', 'assigned'),
+    ('Requesting input file', 'ignore'),  # we don't track file copying
+    ('Preparing to wait for transfer of input file', 'ignore'),
+    ('Transfer complete for outgoing input file', 'ignore'),
+    ('Transfer complete for all input files', 'ignore'),
+    ('File requested by remote queue', 'ignore'),
+    ('Transfer complete for input file', 'ignore'),
+    ('Transfer complete for output file', 'ignore'),
+    ('Preparing to wait for transfer of output file', 'ignore'),
+    ('Requesting output file', 'ignore'),
+    ('Responded to ping from', 'ignore'),
+    ('has disconnected', 'ignore'),
+    ('Starting Job Scheduler', 'scheduler_start'),
+    ('Output Files remaining', 'files_remaining'),
+]  # type: List[Tuple[str, str]]
+
+# Most lines are "<timestamp> - Job <n>: <message>" or "<timestamp> - <message>" and the start
+# of the message is enough to narrow the kind down to one or two candidates.  The keys are
+# (has job number, first 4 characters of message), the candidates are checked in LINE_KINDS order.
+_HEAD_KINDS = {
+    (True, 'Foun'): [('Found version', 'found')],
+    (True, 'Subm'): [('Submitted.', 'submitted')],
+    (True, 'rest'): [('restored. UniqueID', 'restored')],
+    (True, 'Crea'): [('Creating Process', 'creating')],
+    (True, 'star'): [('on controller', 'started')],
+    (True, 'rele'): [('releasing', 'releasing')],
+    (True, 'MaxP'): [('MaxProcessors', 'request_info')],
+    (True, 'peak'): [('peak working set =', 'working_set')],
+    (True, '('): [('Exit status', 'exit_status'), ('exit code ', 'exit_code')],  # (AXIEM:1.0) Ended. ...
+    (True, 'Proc'): [('exit code ', 'exit_code')],
+    (True, 'Chil'): [('exit code ', 'exit_code'), ('Child Process', 'ignore')],
+    (True, 'Dequ'): [('Dequeueing scheduled job', 'cancelled'), (': Dequeueing job', 'cancelled')],
+    (True, 'Sett'): [('Setting job to CANCELING state', 'cancelled')],
+    (True, 'Outp'): [('Output Files remaining:', 'copy_back'), ('Output Files remaining', 'files_remaining')],
+    (True, 'assi'): [('assigned', 'assigned')],
+    (True, 'Requ'): [('Requesting input file', 'ignore'), ('Requesting output file', 'ignore')],
+    (True, 'Prep'): [('Preparing to wait for transfer of input file', 'ignore'),
+                     ('Preparing to wait for transfer of output file', 'ignore')],
+    (True, 'Tran'): [('Transfer complete for outgoing input file', 'ignore'),
+                     ('Transfer complete for all input files', 'ignore'),
+                     ('Transfer complete for input file', 'ignore'),
+                     ('Transfer complete for output file', 'ignore')],
+    (True, 'File'): [('File requested by remote queue', 'ignore')],
+    (True, 'requ'): [],
+    (True, 'rese'): [],
+    (True, 'Erro'): [],
+    (True, 'All '): [],
+    (True, 'Lice'): [],
+    (True, 'Work'): [],
+    (False, 'Job '): [('Job Scheduler shutting down', 'shutdown')],
+    (False, 'Proc'): [('Processing Command Line', 'restart')],
+    (False, 'Dequ'): [('- Dequeueing job', 'cancelled'), ('- Dequeueing pending job j', 'cancelled')],
+    (False, 'Term'): [('Terminating job', 'terminated')],
+    (False, 'Regi'): [('Registering Task token', 'ignore'), ('Registering task id', 'ignore')],
+    (False, 'Resp'): [('Responded to ping from', 'ignore')],
+    (False, 'Clie'): [('has disconnected', 'ignore')],
+    (False, 'Star'): [('Starting Job Scheduler', 'scheduler_start')],
+    (False, 'AWRJ'): [],
+    (False, 'Send'): [],
+    (False, 'Quer'): [],
+    (False, 'Conn'): [],
+}  # type: Dict[Tuple[bool, str], List[Tuple[str, str]]]
+_job_number_re = re.compile(r'- Job (\d+)[: ]')
+_job_number_text_re = re.compile(r'job number (\d+) ')
+
+# (has job number, first 4 characters of message) of the lines that parse_line can only classify as
+# ignored or unmatched.  _skip_re matches the message of these lines on the raw bytes, see skip_raw_line
+_SKIP_HEADS = sorted((has_number, head.encode('utf-8')) for ((has_number, head), candidates) in _HEAD_KINDS.items()
+                     if all(kind == 'ignore' for (substring, kind) in candidates))  # type: List[Tuple[bool, bytes]]
+_skip_re = re.compile(rb'(?:Job \d+:* (?:' + b'|'.join(re.escape(h) for (n, h) in _SKIP_HEADS if n) +
+                      rb')|(?:' + b'|'.join(re.escape(h) for (n, h) in _SKIP_HEADS if not n) + rb'))')
+
+
+def skip_raw_line(buf, start: int, end: int) -> bool:
+    """ Return True if the line buf[start:end] of a raw log is one that the parser ignores
+
+        This is the head lookup of parse_line done on the undecoded bytes.  It only says True for
+        lines whose head has no candidates in _HEAD_KINDS but ignored ones, everything else is left
+        for parse_line.
+
+        Arguments:
+            buf: the bytes of the log, e.g. an mmap
+            start, end: byte range of the line
+    """
+    i = buf.find(b' - ', start, end)
+    return i >= 0 and _skip_re.match(buf, i + 3, end) is not None
+
+
+def classify_line_by_search(line: str) -> Tuple[Union[str, None], Union[str, None]]:
+    """ Classify a line by searching it for each of the LINE_KINDS substrings in turn
+
+        This is the reference classifier.  It is used for lines whose first word is not
+        in the dispatch table so that unusual lines are still handled.
+
+        Arguments:
+            line: a line from the log with the line ending removed
+
+        Returns:
+            a tuple of (kind, job number), either can be None if not found
+    """
+    for substring, kind in LINE_KINDS:
+        if substring in line:
+            break
+    else:
+        return None, None
+    m = _job_number_re.search(line)
+    if not m:
+        m = _job_number_text_re.search(line)
+    return kind, m.group(1) if m else None
+
+
+# One parsed line of the log.  tm is the time of the line (None for lines that are not handled),
+# number is the job number, kind is from LINE_KINDS, message is the text after "<timestamp> - "
+# and "Job <n>: " and line is the whole line.
+LogRecord = namedtuple('LogRecord', ['tm', 'number', 'kind', 'message', 'line'])
+
+
+def parse_line(line: str) -> LogRecord:
+    """ Identify the kind of a log line and split it into a LogRecord
+
+        The job number and the start of the message are sliced out of the line once and
+        the start of the message selects the few substrings that need to be checked.  The
+        timestamp is only decoded for lines that will be passed to a handler.
+
+        Arguments:
+            line: a line from the log with the line ending removed
+
+        Returns:
+            a LogRecord, the kind and job number are None if not found
+    """
+    i = line.find(' - ')
+    if i < 0:
+        (kind, job_number) = classify_line_by_search(line)
+        return LogRecord(None, job_number, kind, line, line)
+    message = line[i + 3:]
+    job_number = None
+    if message.startswith('Job '):
+        end = message.find(' ', 4)
+        number = message[4:end].rstrip(':')
+        if number.isdigit():
+            job_number = number
+            message = message[end + 1:]
+    head = '(' if message[:1] == '(' else message[:4]
+    candidates = _HEAD_KINDS.get((job_number is not None, head))
+    if candidates is None:
+        (kind, job_number) = classify_line_by_search(line)
+    else:
+        for substring, kind in candidates:
+            if substring in line:
+                if job_number is None and kind != 'ignore':
+                    m = _job_number_text_re.search(line)
+                    job_number = m.group(1) if m else None
+                break
+        else:
+            (kind, job_number) = (None, None)
+    if kind is None or kind == 'ignore':
+        return LogRecord(None, job_number, kind, message, line)
+    return LogRecord(timestamp2float(line[:i]), job_number, kind, message, line)
+
+
+def classify_line(line: str) -> Tuple[Union[str, None], Union[str, None]]:
+    """ Identify the kind of a log line and the job number it refers to
+
+        Arguments:
+            line: a line from the log with the line ending removed
+
+        Returns:
+            a tuple of (kind, job number), either can be None if not found
+    """
+    rec = parse_line(line)
+    return rec.kind, rec.number
+
+
+def as_record(message: Union[str, LogRecord]) -> LogRecord:
+    """ Return a log line as a LogRecord, the handlers accept either
+
+        Arguments:
+            message: a LogRecord or a line from the log
+
+        Returns:
+            a LogRecord with the time of the line set
+    """
+    if isinstance(message, LogRecord):
+        return message
+    line = message.rstrip()
+    rec = parse_line(line)
+    if rec.tm is None:
+        rec = rec._replace(tm=timestamp2float(line[:line.find(' - ')]))
+    return rec
+
+
 # ######################################################################################## TIMELINE
-class Timeline(list):
-    running_jobs = 0
-    queued_jobs = 0
-    next_id = 0
+EVENT_TYPES = ['queued', 'cancelled', 'started', 'ended', 'terminated', 'shutdown', 'vanished']
+EVENT_CODES = {ev_type: code for code, ev_type in enumerate(EVENT_TYPES)}
+SHUTDOWN = EVENT_CODES['shutdown']
+# change in the number of queued and running jobs for each event type, a shutdown resets both to 0
+QUEUED_DELTA = [1, -1, -1, 0, 0, 0, 0]
+RUNNING_DELTA = [0, 0, 1, -1, -1, 0, -1]
+
+
+class Timeline:
     """
     Keeps a list of events along with the running list of the queued and running jobs
 
+    The events are kept in parallel arrays of time, event type code (index into EVENT_TYPES) and
+    job index (position of the job in jobs, -1 for events without a job).  The number of queued and
+    running jobs after each event is computed from the arrays when it is needed and kept until an
+    event is added, see counts().
+
     Outputs:
         Timeline events can be written out in different formats depending on what the goal is.
 
@@ -169,6 +547,102 @@ class Timeline(list):
             this format write the queue_input information but adds in other user input such as
             job cancellations and job queue restarts/shutdowns
     """
+    def __init__(self, jobs=None, running_jobs=0, queued_jobs=0):
+        """
+        Arguments:
+            jobs: list of jobs the job indexes refer to, Job.index is the position in it. If not given
+                  the timeline keeps its own list of the jobs it has seen
+            running_jobs, queued_jobs: counts before the first event, for a timeline that carries on
+                                       from an earlier one
+        """
+        self.own_jobs = jobs is None
+        self.jobs = [] if jobs is None else jobs  # type: List[Job]
+        self.times = array('d')
+        self.types = array('b')
+        self.job_index = array('i')
+        self.initial_counts = (running_jobs, queued_jobs)
+        # number of running and queued jobs after the last event
+        self.running_jobs = running_jobs
+        self.queued_jobs = queued_jobs
+        # (running, queued) returned by counts(), None when events were added since
+        self.counts_cache = None
+
+    def __getstate__(self):
+        # the counts are not saved with a checkpoint, they are recomputed when needed
+        state = dict(self.__dict__)
+        state['counts_cache'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.counts_cache = None
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        (running, queued) = self.counts()
+        for i in range(len(self.times)):
+            yield self.event(i, running[i], queued[i])
+
+    def __getitem__(self, i):
+        i = range(len(self.times))[i]
+        (running, queued) = self.counts()
+        return self.event(i, running[i], queued[i])
+
+    def event(self, i, running_jobs=None, queued_jobs=None):
+        """Return event i as an Event object"""
+        n = self.job_index[i]
+        event = Event(self.times[i], EVENT_TYPES[self.types[i]], self.jobs[n].job if n >= 0 else None)
+        event.seq = i
+        event.running_jobs = running_jobs
+        event.queued_jobs = queued_jobs
+        return event
+
+    def index_of(self, job):
+        """Return the index used for job in the job_index array"""
+        if job is None:
+            return -1
+        if isinstance(job, JobView):
+            job = job._job
+        if self.own_jobs:
+            if job.index is None or job.index >= len(self.jobs) or self.jobs[job.index] is not job:
+                job.index = len(self.jobs)
+                self.jobs.append(job)
+        elif job.index is None:
+            raise ValueError('job {} is not in the job list of the timeline'.format(job))
+        return job.index
+
+    def add(self, tm, ev_type, job=None):
+        """
+        Adds an event to the event list
+
+        Arguments:
+            tm: event time as a floating point number
+            ev_type: one of EVENT_TYPES
+            job: the Job the event is for, None for a shutdown
+
+        Returns: nothing
+        """
+        code = EVENT_CODES.get(ev_type)
+        if code is None:
+            print('Unknown evert type {}'.format(ev_type))
+            assert False
+        self.times.append(tm)
+        self.types.append(code)
+        self.job_index.append(self.index_of(job))
+        self.update_counts(code)
+
+    def update_counts(self, code):
+        """Update running_jobs and queued_jobs for an added event"""
+        self.counts_cache = None
+        if code == SHUTDOWN:
+            self.running_jobs = 0
+            self.queued_jobs = 0
+        else:
+            self.running_jobs += RUNNING_DELTA[code]
+            self.queued_jobs += QUEUED_DELTA[code]
+
     def add_event(self, event):
         """
         Adds an event to the event list
@@ -179,42 +653,69 @@ class Timeline(list):
         Returns: nothing
 
         """
-        cls = type(self)
-        id = cls.next_id
-        cls.next_id += 1
-
-        if event.ev_type == 'queued':
-            cls.queued_jobs += 1
-            event.queued_jobs = cls.queued_jobs
-            event.running_jobs = cls.running_jobs
-        elif event.ev_type == 'cancelled':
-            cls.queued_jobs -= 1
-            event.queued_jobs = cls.queued_jobs
-            event.running_jobs = cls.running_jobs
-        elif event.ev_type == 'started':
-            cls.queued_jobs -= 1
-            cls.running_jobs += 1
-            event.running_jobs = cls.running_jobs
-            event.queued_jobs = cls.queued_jobs
-        elif event.ev_type == 'ended' or event.ev_type == 'terminated':
-            cls.running_jobs -= 1
-            event.running_jobs = cls.running_jobs
-            event.queued_jobs = cls.queued_jobs
-        elif event.ev_type == 'shutdown':
-            cls.queued_jobs = 0
-            cls.running_jobs = 0
-            event.running_jobs = cls.running_jobs
-            event.queued_jobs = cls.queued_jobs
-        elif event.ev_type == 'vanished':
-            cls.running_jobs -= 1
-            event.queued_jobs = cls.queued_jobs
-            event.running_jobs = cls.running_jobs
-        else:
-            print('Unknown evert type {}'.format(event.ev_type))
-            assert False
+        self.add(event.tm, event.ev_type, event.job)
 
-        event.seq = id
-        self.append(event)
+    def counts(self):
+        """
+        Return the number of running and queued jobs after each event
+
+        The lists are kept until an event is added so indexing the timeline event by event does not
+        recount it each time, they must not be modified.
+
+        Returns: (running, queued) lists
+        """
+        if self.counts_cache is None:
+            self.counts_cache = self.counts_by_loop() if np is None else self.counts_by_array()
+        return self.counts_cache
+
+    def counts_by_array(self):
+        """counts() with numpy"""
+        types = np.frombuffer(self.types, dtype=np.int8) if len(self.types) else np.zeros(0, dtype=np.int8)
+        running = np.cumsum(np.array(RUNNING_DELTA)[types])
+        queued = np.cumsum(np.array(QUEUED_DELTA)[types])
+        # a shutdown resets the counts so subtract the count at the last shutdown
+        positions = np.arange(len(types))
+        last_shutdown = np.maximum.accumulate(np.where(types == SHUTDOWN, positions, -1))
+        seen = last_shutdown >= 0
+        running[seen] -= running[last_shutdown[seen]]
+        queued[seen] -= queued[last_shutdown[seen]]
+        running[~seen] += self.initial_counts[0]
+        queued[~seen] += self.initial_counts[1]
+        return running.tolist(), queued.tolist()
+
+    def counts_by_loop(self):
+        """counts() without numpy"""
+        running = []
+        queued = []
+        (r, q) = self.initial_counts
+        for code in self.types:
+            if code == SHUTDOWN:
+                (r, q) = (0, 0)
+            else:
+                r += RUNNING_DELTA[code]
+                q += QUEUED_DELTA[code]
+            running.append(r)
+            queued.append(q)
+        return running, queued
+
+    def extend(self, other, index=None, start=0, end=None):
+        """
+        Append the events of another timeline
+
+        Arguments:
+            other: Timeline to copy the events from
+            index: list mapping the job indexes of other to job indexes of this timeline, None if they are the same
+            start, end: range of the events of other to copy, all of them by default
+        """
+        end = len(other) if end is None else end
+        self.times.extend(other.times[start:end])
+        self.types.extend(other.types[start:end])
+        if index is None:
+            self.job_index.extend(other.job_index[start:end])
+        else:
+            self.job_index.extend(index[n] if n >= 0 else -1 for n in other.job_index[start:end])
+        for code in other.types[start:end]:
+            self.update_counts(code)
 
     def shutdown(self, tm):
         """
@@ -227,27 +728,38 @@ class Timeline(list):
 
         Returns: none
         """
-        self.add_event(Event(tm, 'shutdown', None))
+        self.add(tm, 'shutdown')
         return True
 
     def write_queue_input(self, fp=sys.stdout):
         start_time = False
-        for ev in self:
-            if ev.ev_type == 'queued':  # job submitted
+        queued = EVENT_CODES['queued']
+        for i, code in enumerate(self.types):
+            if code == queued:  # job submitted
+                ev = self.event(i)
                 # need to wait until we get a queue event (as opposed to shutdown) to get start time
                 if not start_time:
                     start_time = ev.job['submitted']  # this is considered t0
                 print(ev.queue_input_fmt(start_time), file=fp)
 
-    def write(self, fp=sys.stdout):
-        print('date,time,type,running,queued,id', file=fp)
-        for ev in self:
-            s = '20{},{},{},{},{}'.format(float_to_date(ev.tm), ev.tm, ev.ev_type, ev.running_jobs, ev.queued_jobs)
-            if ev.job:
-                s += "," + ev.job['id']
-            else:
-                s += ',NA'
-            print(s, file=fp)
+    def write(self, fp=sys.stdout, header=True):
+        if header:
+            print('date,time,type,running,queued,id', file=fp)
+        (running, queued) = self.counts()
+        jobs = self.jobs
+        for tm, code, n, r, q in zip(self.times, self.types, self.job_index, running, queued):
+            job_id = (jobs[n].id or '') if n >= 0 else 'NA'
+            print('20{},{},{},{},{},{}'.format(float_to_date(tm), tm, EVENT_TYPES[code], r, q, job_id), file=fp)
+
+    def write_parquet(self, filename):
+        """Write the events into a Parquet file with a fixed schema, see js.arrow, needs pyarrow"""
+        from js.arrow import events_table, write_table
+        write_table(events_table(self), filename, 'parquet')
+
+    def write_arrow(self, filename):
+        """Write the events into an Arrow IPC file with a fixed schema, see js.arrow, needs pyarrow"""
+        from js.arrow import events_table, write_table
+        write_table(events_table(self), filename, 'arrow')
 
 
 class Event:
@@ -314,18 +826,32 @@ class Jobs:
     Attributes
         joblist - this is a list of job objects
         files   - this is a list of the names of the files that have been read
+        active  - job number -> job for the jobs seen since the last scheduler restart
+        by_uuid - S_UniqueID -> job, used to reconnect jobs after a scheduler restart
+        running_hosts - host name -> the job last started on it, used to end jobs whose exit was not logged
+        job_counter - number of job identifiers given out, see new_job_id
+        finished - None, or a list that finalize() appends jobs to, used to follow a live log
+        last_version_line - version to give the next submitted job, False if there is none
+        track_lines - if True each job records where its log lines are so they can be
+                      printed by Job.pprint, turn off for production conversions
     """
-    last_version_line = False
-
-    def __init__(self, load=None):
+    def __init__(self, load=None, track_lines=True):
         self.joblist = list()
+        self.track_lines = track_lines
         self.files = list()
         self.starts = list()
-        self.timeline = Timeline()
+        self.timeline = Timeline(self.joblist)
+        self.active = dict()  # type: Dict[str, Job]
+        self.by_uuid = dict()  # type: Dict[str, Job]
+        self.table = JobTable() if JobTable else None  # one row per job in joblist, see job_table()
+        self.running_hosts = dict()  # type: Dict[str, Job]
+        self.job_counter = 0
+        self.last_version_line = False  # type: Union[str, bool]
+        self.finished = None  # type: List[Job]
         if load:
             self.read_log_file(load)
 
-    def read_log_file(self, filename):
+    def read_log_file(self, filename, chunk_size=LOG_CHUNK_SIZE, start=0, end=None, first_line=1, close=True):
         """
         Parse through the logfile and create the joblist
 
@@ -333,217 +859,298 @@ class Jobs:
         are added for all Job # messages even if they are not processed.  By
         turning on debug_port we can see all the lines in the log that are
         ignored.
+
+        The file is memory mapped and the lines the parser ignores are skipped
+        without being decoded, see iter_log_mmap.  Compressed logs are streamed
+        through a buffer of chunk_size bytes rather than read into memory all at once.
+
+        Arguments:
+            filename: name of the log file
+            chunk_size: number of bytes read from the file at a time
+            start, end: byte range of the file to parse, the whole file by default
+            first_line: line number of the line at start, used in messages
+            close: close out the open jobs at the end of the range as at the end of a log,
+                   see js.parallel for reading a log in pieces
+
+        Returns:
+            the number of jobs submitted
         """
-        c = Counter()
+        file_id = len(self.files)
         self.files.append(filename)
-        with codecs.open(filename, encoding='utf-8') as fp:
-            lineno = 0
-
-            jobre = re.compile('- Job \d\d*:')
-            re_restore_job = re.compile('- Job \d\d* ')
-            dequere = re.compile('job number \d\d* ')
-            terminating = re.compile('job number \d\d* ')
-
-            for lineno, line in enumerate(fp.readlines()):
-                lineno += 1  # enumerate 0 based, line numbers 1 based
-                if (lineno % 100000) == 0:
-                    print(lineno)
-                line = line.rstrip()
-                if not line:
-                    continue
-                line = line[1:] if line[0] == '\ufeff' else line
-                j = None
-# ##################################################################################### LOG PARSING
-                # Identify the type of line and dispatch to right parsing function
-                if match(line, 'Found version'):
-                    j = Job()
-                    j.jl = self
-                    j.found(line)
-                    self.add(j)
-                elif match(line, 'Submitted.'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.submitted(line)
-                    if Jobs.last_version_line:
-                        j.job['version'] = Jobs.last_version_line
-                        Jobs.last_version_line = False
-                    c['jobs'] += 1
-                elif match(line, 'restored. UniqueID'):  # Job 1 restored. UniqueID={828BDD14-...-ACDCCF69756A}
-                    # need to reconnect a job number to a job.
-                    # print(line)
-                    job_number = re_restore_job.search(line).group()[6:-1]
-                    uuid = line[line.find('=') + 1:-1]
-                    self.set_jobno_from_uuid(uuid, job_number, lineno)
-                elif match(line, 'Creating Process'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.creating(line)
-                elif match(line, 'on controller'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.started(line)
-                elif match(line, 'releasing'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.releasing(line)
-                elif match(line, 'Job Scheduler shutting down'):  # Scheduler shutting down with exit code 0x00000000
-                    dprint('DEBUG: restarting scheduler on line {}'.format(lineno))
-                    self.restart_scheduler(line, shutdown=True)
-                elif match(line, 'Processing Command Line'):
-                    dprint('DEBUG: restarting scheduler on line {}'.format(lineno))
-                    self.restart_scheduler(line)
-                elif match(line, 'MaxProcessors'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.request_info(line)
-                elif match(line, 'peak working set ='):  # could be peak working set not reported so = needed
-                    job_number = jobre.search(line).group()[6:-1]
-                    j = self.__find_by_number(job_number, lineno)
-                    j.working_set(line)
-                elif match(line, 'Exit status'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.exit_status(line)
-                elif match(line, 'exit code '):  # this will also match scheduler shutdown, must come after
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.exit_code(line)
-                elif match(line, '- Dequeueing job') or match(line, '- Dequeueing pending job j'):  # V11
-                    job_number = dequere.search(line).group()[11:-1]
-                    j = self.__find_by_number(job_number, lineno)
-                    j.cancelled(line)
-                # v12 dequeue different from v11
-                elif match(line, 'Dequeueing scheduled job'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.cancelled(line)
-                # v14 change dequeing syntax again
-                elif match(line, ': Dequeueing job'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.cancelled(line)
-                elif match(line, 'Setting job to CANCELING state'):
-                    job_number = jobre.search(line).group()[6:-1]
-                    j = self.__find_by_number(job_number, lineno)
-                    j.cancelled(line)
-                elif match(line, 'Terminating job'):  # 2016-....0468 - Terminating job number 26 (mpiexec:2.2)
-                    job_number = terminating.search(line).group()[11:-1]
-                    j = self.__find_by_number(job_number, lineno)
-                    j.terminated(line)
-                elif match(line, 'Output Files remaining:'):
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    if line[-2:] == ' 0':
-                        # if this is the last file then copying back of results is done
-                        j.copy_back_end(line)
-                    else:
-                        j.copy_back_start(line)
-                elif match(line, 'Registering Task token') or match(line, 'Registering task id'):
-                    # we don't need to track these for now
-                    pass
-                elif match(line, 'Child Process'):
-                    # child process exit messages, we don't need these
-                    pass
-                elif match(line, 'assigned'):
-                    # 2016-01-20T19:08:31.0676 - Job 46: assigned AXIEM:3.0 to controller "dfw0awrsim01"
-                    # this is the beginning of the input file copy process but also a good place to check
-                    # that last job on this machine is done.
-                    job_number = jobre.search(line).group()[6:-1]  # del  -Job and :
-                    j = self.__find_by_number(job_number, lineno)
-                    j.assigned(line)
-                elif match(line, 'Requesting input file') or\
-                        match(line, 'Preparing to wait for transfer of input file') or\
-                        match(line, 'Transfer complete for outgoing input file') or\
-                        match(line, 'Transfer complete for all input files') or\
-                        match(line, 'File requested by remote queue') or\
-                        match(line, 'Transfer complete for input file'):
-                    # we don't track file copying
-                    pass
-                elif match(line, 'Transfer complete for output file') or\
-                        match(line, 'Preparing to wait for transfer of output file') or\
-                        match(line, 'Requesting output file'):
-                    # we don't track file copying
-                    pass
-                elif match(line, 'Responded to ping from') or match(line, 'has disconnected'):
-                    pass
-                elif match(line, 'Starting Job Scheduler'):
-                    # job scheduler is starting
-                    (tm, rest) = line.split(' - ', 1)
-                    (time_stamp, fractseconds) = tm.split('.')
-                    self.starts.append((time_stamp, rest[len(' Starting Job Scheduler '):]))
-                elif match(line, 'Output Files remaining'):
-                    job_number = jobre.search(line).group()[6:-1]
-                    j = self.__find_by_number(job_number, lineno)
-                    j.files_remaining(line)
-                else:
-                    dprint('unmatched line:', line)
+        return self.parse_spans(log_spans(filename, chunk_size, start, end), file_id, first_line, close)
+
+    def parse_spans(self, spans, file_id, first_line=1, close=True):
+        """
+        Parse lines of a log file that is in self.files
 
-                # mostly for debugging we want to track all the lines used in creating the job
-                if j:
-                    j.lines.append(line)
+        Arguments:
+            spans: iterator of (byte offset, length, line) as returned by iter_log_spans, line is None
+                   for a line that is known to be ignored, see iter_log_mmap
+            file_id: index of the log file in self.files
+            first_line: line number of the first line, used in messages
+            close: close out the open jobs after the last line, see read_log_file
+
+        Returns:
+            the number of jobs submitted
+        """
+        c = Counter()
+        lineno = 0
+
+        for lineno, (offset, length, line) in enumerate(spans, first_line):
+            if (lineno % 100000) == 0:
+                print(lineno)
+            if line is None:
+                continue
+            line = line.rstrip()
+            if not line:
+                continue
+            line = line[1:] if line[0] == '\ufeff' else line
+            rec = parse_line(line)
+            if rec.kind == 'submitted':
+                c['jobs'] += 1
+            j = self.dispatch(rec, lineno)
+
+            # mostly for debugging we want to track all the lines used in creating the job
+            if j and self.track_lines:
+                j.lines.append((file_id, offset, length))
 
         # at end of every file close out all open jobs
         # if there were no lines, do nothing since line is unset
-        if lineno > 0:
+        if close and lineno > 0:
             self.restart_scheduler(line)  # don't really have a choice but to use last line for time stamp
         return c['jobs']
 
+    def read_log_files(self, filenames, processes=1, cache=None):
+        """
+        Parse several log files in order
+
+        With more than one process the files are split at the scheduler restarts and the pieces are
+        parsed in parallel, see js.parallel.  The jobs and events are the same either way.
+
+        Arguments:
+            filenames: list of log file names
+            processes: number of processes to use, None for one per CPU
+            cache: a js.cache.LogCache to load the files that were parsed before from, and to
+                   save the others in
+
+        Returns:
+            list of the number of jobs submitted in each file
+        """
+        if cache is not None:
+            return cache.read_log_files(self, filenames, processes)
+        if processes == 1:
+            return [self.read_log_file(f) for f in filenames]
+        from js.parallel import read_log_files
+        return read_log_files(self, filenames, processes)
+
+    def follow(self, filename, interval=5.0, settle=60.0):
+        """
+        Follow a live log file, see js.follow.LogFollower
+
+        Arguments:
+            filename: name of the log file
+            interval: seconds to wait between checks for new lines
+            settle: seconds of log time after its exit before a job that is still active is finished
+
+        Returns:
+            an endless iterator of the jobs as they finish
+        """
+        from js.follow import LogFollower
+        follower = LogFollower(self, filename, settle)
+        while True:
+            yield from follower.poll()
+            time.sleep(interval)
+
+    def dispatch(self, rec, lineno):
+        """
+        Apply one parsed log line to the job list
+
+        Arguments:
+            rec: LogRecord of the line, see parse_line
+            lineno: line number, used in messages
+
+        Returns:
+            the job the line belongs to, None if it is not a job line
+        """
+        j = None
+        line = rec.line
+# ##################################################################################### LOG PARSING
+        # Identify the type of line and dispatch to right parsing function
+        kind = rec.kind
+        if kind == 'ignore':
+            # registrations, child processes and file copying are not tracked
+            pass
+        elif kind == 'found':
+            j = Job()
+            j.jl = self
+            j.found(rec)
+            self.add(j)
+        elif kind == 'submitted':
+            j = self.__find_by_number(rec.number, lineno)
+            j.submitted(rec)
+            self.add_uuid(j)
+            if self.last_version_line:
+                j.version = self.last_version_line
+                self.last_version_line = False
+        elif kind == 'restored':
+            # need to reconnect a job number to a job.
+            uuid = line[line.find('=') + 1:-1]
+            self.set_jobno_from_uuid(uuid, rec.number, lineno)
+        elif kind == 'shutdown':
+            dprint('DEBUG: restarting scheduler on line {}'.format(lineno))
+            self.restart_scheduler(rec, shutdown=True)
+        elif kind == 'restart':
+            dprint('DEBUG: restarting scheduler on line {}'.format(lineno))
+            self.restart_scheduler(rec)
+        elif kind == 'copy_back':
+            j = self.__find_by_number(rec.number, lineno)
+            if line[-2:] == ' 0':
+                # if this is the last file then copying back of results is done
+                j.copy_back_end(rec)
+            else:
+                j.copy_back_start(rec)
+        elif kind == 'scheduler_start':
+            # job scheduler is starting
+            (tm, rest) = line.split(' - ', 1)
+            (time_stamp, fractseconds) = tm.split('.')
+            self.starts.append((time_stamp, rest[len(' Starting Job Scheduler '):]))
+        elif kind:
+            # the remaining kinds are named after the Job method that parses them
+            j = self.__find_by_number(rec.number, lineno)
+            getattr(j, kind)(rec)
+        else:
+            dprint('unmatched line:', line)
+        return j
+
+    def source_lines(self, refs):
+        """ Read back the log lines for a list of (file id, offset, length) references"""
+        lines = []
+        for file_id in sorted(set(ref[0] for ref in refs)):  # file ids only increase so order is kept
+            spans = [(offset, length) for (f, offset, length) in refs if f == file_id]
+            lines += read_log_spans(self.files[file_id], spans)
+        return lines
+
     def add(self, job):
         """ Add a job object to the master list"""
+        job.index = len(self.joblist)
         self.joblist.append(job)
+        if self.table is not None:
+            self.table.append(job)
+        if job.number:
+            self.activate(job)
+        else:
+            # no log line can find a job without a number
+            self.finalize(job)
+
+    def activate(self, job):
+        """Register a job under its job number so that later log lines can find it"""
+        n = job.number
+        if not n:
+            return
+        old = self.active.get(n)
+        if old is not None and old is not job:
+            print('ERROR: job number {} reused before scheduler restart, retiring {}'.format(n, old))
+            old.number = None
+            self.finalize(old)
+        self.active[n] = job
+
+    def new_job_id(self):
+        """Return an identifier for a new job, unique within this job list"""
+        job_id = 'JOB' + str(self.job_counter)
+        self.job_counter += 1
+        return job_id
+
+    def finalize(self, job):
+        """Called when a job is no longer active, its fields are written into the columnar table"""
+        if self.table is not None:
+            self.table.store(job.index, job, final=True)
+        if self.finished is not None:
+            self.finished.append(job)
+
+    def job_table(self):
+        """
+        Return the JobTable of all the jobs, None if numpy is not installed
+
+        The rows of jobs that are still active are brought up to date first.
+        """
+        if self.table is not None:
+            for job in self.active.values():
+                self.table.store(job.index, job)
+        return self.table
+
+    def retain(self, keep):
+        """
+        Drop all the jobs but the active ones and those in keep, the jobs left are renumbered
+
+        The events are dropped as well, the new timeline carries on from the counts of the old one.
+        This keeps memory bounded when jobs are written out as they finish, see js.stream.
+
+        Arguments:
+            keep: the inactive jobs to keep, e.g. ones that may still be restored
+        """
+        keep = set(keep)
+        keep.update(self.active.values())
+        self.joblist[:] = sorted(keep, key=lambda j: j.index)
+        if self.table is not None:
+            self.table = JobTable()
+        for (i, job) in enumerate(self.joblist):
+            job.index = i
+            if self.table is not None:
+                self.table.append(job)
+                if self.active.get(job.number) is not job:
+                    self.table.store(i, job, final=True)
+        self.by_uuid = {uuid: j for (uuid, j) in self.by_uuid.items() if j in keep}
+        self.running_hosts = {host: j for (host, j) in self.running_hosts.items() if j in keep}
+        self.timeline = Timeline(self.joblist, self.timeline.running_jobs, self.timeline.queued_jobs)
+        self.starts = []
+
+    def add_uuid(self, job):
+        """Register a job under its UniqueID so it can be reconnected after a restart"""
+        uuid = job.uuid
+        if uuid:
+            self.by_uuid[uuid] = job
 
     def get_list(self):
         return self.joblist
 
     def set_jobno_from_uuid(self, uuid, jobno, lineno):
-        jobs_matching_uuid = [x for x in self.joblist if x.job['S_UniqueID'] == uuid]
-        if len(jobs_matching_uuid) == 1:
-            job = jobs_matching_uuid[0].job
-            job['number'] = jobno
-            job['exit'] = 'restored'
-            return True
+        j = self.by_uuid.get(uuid)
+        if j is not None:
+            if self.active.get(j.number) is j:
+                del self.active[j.number]
+            j.number = jobno
+            j.exit = 'restored'
+            self.activate(j)
         else:
-            if jobs_matching_uuid:
-                print('ERROR: {} jobs matched uuid, should only be 1'.format(len(jobs_matching_uuid)))
-                for j in jobs_matching_uuid:
-                    print(j)
-            else:
-                print('ERROR: Could not find job matching uuid {}'.format(uuid))
-                print('       error occured on line {}'.format(lineno))
-                # need to return something
-                job = Job()
-                job.job['number'] = jobno
-                job.job['exit'] = 'restored'
-                self.add(job)
-            return True
+            print('ERROR: Could not find job matching uuid {}'.format(uuid))
+            print('       error occured on line {}'.format(lineno))
+            # need to return something
+            j = Job()
+            j.number = jobno
+            j.exit = 'restored'
+            self.add(j)
+        return True
 
     def __find_by_number(self, n, lineno):
         """ Returns the job that matches based on the number n"""
-        jobs_matching_number = [x for x in self.joblist if x.job['number'] == n]
-        num_jobs_found = len(jobs_matching_number)
-        if num_jobs_found == 0:
+        job = self.active.get(n)
+        if job is None:
             print('ERROR: Could not find job with number {}'.format(n))
             print('       error occured processing line {}'.format(lineno))
-            # print(self.joblist)
-        elif num_jobs_found > 1:
-            print('ERROR: jobs_matching_number {} jobs with number {}'.format(num_jobs_found, n))
-            assert len(jobs_matching_number) < 2
-        else:
-            return jobs_matching_number[0]
+        return job
 
     def restart_scheduler(self, line, shutdown=False):
         """
         When the scheduler is restarted it will start reusing job numbers so we need to renove
-        the number on all the existing jobs
+        the number on all the active jobs.  Jobs stay in by_uuid so they can be restored.
         """
-        s = line.rstrip()
-        (tm, rest) = s.split(' - ', 1)
-        message_time = timestamp2float(tm)
-        for x in self.joblist:
-            if x.job['number'] != 0:
-                if shutdown and 'exit' not in x.job:
-                    x.job['exit'] = 'shutdown'
-                x.job['number'] = 0
+        message_time = as_record(line).tm
+        for x in self.active.values():
+            if shutdown and x.exit is None:
+                x.exit = 'shutdown'
+            x.number = None
+            self.finalize(x)
+        self.active.clear()
         self.timeline.shutdown(message_time)
 
 
@@ -573,7 +1180,10 @@ class Jobs:
             Jobs may not have a duration if they are in progress when
             scheduler is restarted or if cancelled
         """
-        return [x for x in self.joblist if x.duration() != '']
+        table = self.job_table()
+        if table is None:
+            return [x for x in self.joblist if x.duration() != '']
+        return [self.joblist[i] for i in table.column('has_duration').nonzero()[0]]
 
     def write_xml(self, filename):
         """Write all jobs into an Excel friendly xml file"""
@@ -583,16 +1193,145 @@ class Jobs:
                 print(j.job2xml(), file=fp)
             print('</Jobs>\n', file=fp)
 
+    def write_parquet(self, filename):
+        """Write all jobs into a Parquet file with a fixed schema, see js.arrow, needs pyarrow"""
+        from js.arrow import jobs_table, write_table
+        write_table(jobs_table(self), filename, 'parquet')
+
+    def write_arrow(self, filename):
+        """Write all jobs into an Arrow IPC file with a fixed schema, see js.arrow, needs pyarrow"""
+        from js.arrow import jobs_table, write_table
+        write_table(jobs_table(self), filename, 'arrow')
+
+    def to_dataframe(self):
+        """Return all jobs as a pandas DataFrame with the columns of the csv, see js.js_pd.jobs_dataframe"""
+        from js.js_pd import jobs_dataframe
+        return jobs_dataframe(self)
+
     def write_csv(self, filename):
-        """Write all jobs out into an Excel friendly csv file"""
-        with open(filename, "w") as fp:
-            header = True
-            for j in self.joblist:
-                if header:
-                    print(j.job2csv(header), file=fp)
-                    header = False
+        """Write all jobs out into an Excel friendly csv file, see write_csv_rows"""
+        with open(filename, "w", buffering=1024 * 1024) as fp:
+            write_csv_rows(fp, self.joblist)
+
+
+# ###################################################################################### JOB RECORD
+# log file key name -> Job slot. The keys are the names the fields had when a job was a dict and they
+# are still what the JobView mapping, and so job2csv/job2dict and the timeline, use.
+JOB_KEYS = {
+    'id': 'id',
+    'number': 'number',
+    'version': 'version',
+    'submitted': 'submit_time',
+    'start': 'start_time',
+    'stop': 'stop_time',
+    'queued': 'wait_time',
+    'duration': 'run_time',
+    'host': 'host',
+    'exit': 'exit',
+    'working_set': 'mem_mb',
+    'results_copy': 'copy_time',
+    'files_remaining': 'files_left',
+    'processors': 'processors',
+    'num_processors': 'num_processors',
+    'exceptions': 'exceptions',
+    'S_Name': 'name',
+    'S_User': 'user',
+    'S_Priority': 'priority',
+    'S_UniqueID': 'uuid',
+    'R_MinProcessors': 'min_proc',
+    'R_ThreadsPerProcessor': 'threads',
+    'R_MaxProcessors': 'max_proc',
+    'R_PreferredPerf': 'req_perf',
+    'R_PreferredMemCap': 'req_mem',
+}  # type: Dict[str, str]
+
+# intervals that are NaN when one end was lost in a scheduler restart, shown as 'NA' in the view
+_NA_KEYS = frozenset(['queued', 'duration'])
+# integer fields that appear as strings in the view, as they do in the log
+_INT_KEYS = frozenset(['S_Priority', 'R_MinProcessors', 'R_ThreadsPerProcessor', 'R_MaxProcessors'])
+
+
+def _to_int(value: str) -> Union[int, str]:
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class JobView(MutableMapping):
+    """
+    Mapping view of a Job under the log file key names
+
+    Reads give the values a job dict used to hold: '' for a missing field, 'NA' for an interval
+    lost in a restart and the Submitted/request fields as strings. Writes are converted back.
+    Keys that have no slot (e.g. R_NodeExclusive) are kept in Job.extra.
+    """
+    __slots__ = ('_job',)
+
+    def __init__(self, job: 'Job') -> None:
+        self._job = job
+
+    def __getitem__(self, key: str) -> Any:
+        slot = JOB_KEYS.get(key)
+        if slot is None:
+            extra = self._job.extra
+            return extra.get(key, '') if extra else ''
+        value = getattr(self._job, slot)
+        if value is None:
+            return ''
+        if key in _NA_KEYS and value != value:
+            return 'NA'
+        if key in _INT_KEYS:
+            return str(value)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        slot = JOB_KEYS.get(key)
+        if slot is None:
+            if self._job.extra is None:
+                self._job.extra = {}
+            self._job.extra[key] = value
+            return
+        if isinstance(value, str):
+            if value == '':
+                value = None
+            elif key in _NA_KEYS and value == 'NA':
+                value = float('nan')
+            elif key in _INT_KEYS:
+                value = _to_int(value)
+        setattr(self._job, slot, value)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        slot = JOB_KEYS.get(key)
+        if slot is None:
+            del self._job.extra[key]
+        else:
+            setattr(self._job, slot, None)
+
+    def __contains__(self, key: object) -> bool:
+        slot = JOB_KEYS.get(key)  # type: ignore
+        if slot is None:
+            return bool(self._job.extra) and key in self._job.extra
+        return getattr(self._job, slot) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        job = self._job
+        for key, slot in JOB_KEYS.items():
+            if getattr(job, slot) is not None:
+                yield key
+        if job.extra:
+            yield from job.extra
 
-                print(j.job2csv(header), file=fp)
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
 
 
 class Job:
@@ -600,19 +1339,29 @@ class Job:
     Operations on a specific job
 
     Members:
-        job: a dict with the items {S_Name S_User S_Priority duration number submitted start queued}
+        the job fields, see JOB_KEYS. A field that was not seen in the log is None. queued and
+            duration (wait_time, run_time) are NaN when the other end was lost in a restart
+        extra: dict of Submitted/request fields that have no slot, None if there are none
         jl: a pointer back to the job list if the job is in one. needed to track events
-        lines: a list of all the source file lines that were used to build the job
+        index: position of the job in the job list, also its row in the job list's JobTable
+        lines: (file id, byte offset, length) of the source file lines that were used to build the job,
+               see source_lines()
 
+    job gives a JobView of the fields under the log file key names.
     """
-
-    __JOB_COUNTER__ = 0  # used to create unique identifier for jobs
-    last_version_line = False
+    __slots__ = tuple(JOB_KEYS.values()) + ('extra', 'jl', 'lines', 'index')
 
     def __init__(self):
-        self.job = defaultdict(str)
+        for slot in JOB_KEYS.values():
+            setattr(self, slot, None)
+        self.extra = None  # type: Dict[str, str]
         self.jl = None  # pointer back to the job list this job is in
-        self.lines = []
+        self.lines = []  # type: List[Tuple[int, int, int]]
+        self.index = None  # type: int
+
+    @property
+    def job(self) -> JobView:
+        return JobView(self)
 
     @staticmethod
     def parse_job_message(s):
@@ -632,110 +1381,128 @@ class Job:
     def sim(self):
         """The name of the simulator is unfriendly in the log file so this returns a
            friendlier name for the EM simulator"""
-        if self.job['S_Name'].startswith('mpiexec'):
+        name = self.name or ''
+        if name.startswith('mpiexec'):
             return 'Analyst'
-        elif self.job['S_Name'].startswith('AXIEM') or self.job['S_Name'].startswith('Axiem'):
+        elif name.startswith('AXIEM') or name.startswith('Axiem'):
             return 'AXIEM'
-        elif self.job['S_Name'].startswith('AWR_EMS2Proxy'):
+        elif name.startswith('AWR_EMS2Proxy'):
             return 'EM_3rd_Party'
         else:
-            return self.job['S_Name']
+            return name
+
+    def host_table(self) -> Dict[str, 'Job']:
+        """The running host table of the job list, a job that is not in a job list has nothing to track"""
+        return self.jl.running_hosts if self.jl else {}
+
+    def add_exception(self, note: str) -> None:
+        self.exceptions = (self.exceptions or '') + note
 
     #
     # Set of functions to parse the various types of lines found in the log
     #
     def found(self, message):
         # Found version 11111 for task id "AXIEM"
-        (message_time, job_number, command) = self.parse_job_message(message)
-        self.job['id'] = 'JOB' + str(Job.__JOB_COUNTER__)
-        Job.__JOB_COUNTER__ += 1
-        self.job['number'] = job_number
-        version = command[command.find('version') + 8:]
+        rec = as_record(message)
+        if self.jl:
+            self.id = self.jl.new_job_id()
+        self.number = rec.number
+        version = rec.message[rec.message.find('version') + 8:]
         version = version[0:version.find(' ')]
-        self.job['version'] = version
+        self.version = version
 
     def submitted(self, message):
         # 2014-11-05T12:45:43.0188 - Job 1: Submitted. Name="mpiexec:3.0", User="dhoekstr",
         # Priority=1
-        (message_time, job_number, command) = self.parse_job_message(message)
-        command = command[len('submitted. '):]
-        # self.job['id'] = 'JOB' + str(Job.__JOB_COUNTER__) moved to found
-        # Job.__JOB_COUNTER__ += 1 moved to found
-        self.job['submitted'] = message_time
-        # self.job['number'] = job_number moved to found
+        rec = as_record(message)
+        command = rec.message[len('submitted. '):]
+        self.submit_time = rec.tm
 
         # submitted command contains pairs of name=value keyword pairs
+        job = self.job
         for keyword_pair in [f.strip() for f in command.split(',')]:
             (name, value) = keyword_pair.split('=')
-            self.job['S_' + name] = value.rstrip('"').lstrip('"')
+            job['S_' + name] = value.rstrip('"').lstrip('"')
         if self.jl:
-            self.jl.timeline.add_event(Event(message_time, 'queued', self.job))
+            self.jl.timeline.add(rec.tm, 'queued', self)
 
     def creating(self, message):
         # 2014-11-05T12:46:42.0140 - Job 1: Creating Process C:\Program Files\AWR\V11\mpiexec.exe
         # -np 8 -localonly "C:\Program Files\AWR\V11\grsim.exe"
         # "C:\ProgramData\AWR\Design Environment\11.
-        (message_time, job_number, command) = self.parse_job_message(message)
-        self.job['start'] = message_time
-        if self.job['submitted'] == '':
+        rec = as_record(message)
+        self.start_time = rec.tm
+        if self.submit_time is None:
             # the start time got lost in a server restart
-            self.job['queued'] = 'NA'
+            self.wait_time = float('nan')
         else:
-            self.job['queued'] = self.job['start'] - self.job['submitted']
-        if match(command, '-np'):
-            tmp = command[command.find('-np') + 4:]
+            self.wait_time = self.start_time - self.submit_time
+        if match(rec.message, '-np'):
+            tmp = rec.message[rec.message.find('-np') + 4:]
             tmp = tmp[0:tmp.find(' ')]
-            self.job['num_processors'] = int(tmp)
+            self.num_processors = int(tmp)
 
     def assigned(self, message):
-        global running_hosts
-        assigned_re = re.compile('to controller "(.*)"')
-        (message_time, job_number, command) = self.parse_job_message(message)
-        host_name = assigned_re.search(message).group(1)
+        rec = as_record(message)
+        self.reassign_host(assigned_host(rec.message), rec.tm, self.run_time is None)
+
+    def reassign_host(self, host_name, tm, set_duration):
+        """
+        The host is being assigned to this job, end the job last started on it if no exit message was seen
+
+        Arguments:
+            host_name: name of the controller
+            tm: time of the assignment
+            set_duration: whether to set the duration of the old job, assigned() sets it when this
+                          job has no duration yet
+        """
+        running_hosts = self.host_table()
         if host_name in running_hosts:
             j = running_hosts[host_name]
-            job = j.job
-            if not job['exit']:
-                job['exit'] = 'host_reassigned'
+            if not j.exit:
+                j.exit = 'host_reassigned'
                 del running_hosts[host_name]
-                job['exceptions'] += 'exit status set by next assignment - '
+                j.add_exception('exit status set by next assignment - ')
                 # old job did not see an exit message but host is getting re-assigned
-                if job['start'] != '' and not job['stop']:  # we know that job is over so set stop time
-                    job['stop'] = message_time
-                    if self.duration() == '':
-                        job['duration'] = job['stop'] - job['start']
-                        if job['duration'] < 0:
+                if j.start_time is not None and not j.stop_time:  # we know that job is over so set stop time
+                    j.stop_time = tm
+                    if set_duration:
+                        j.run_time = j.stop_time - j.start_time
+                        if j.run_time < 0:
                             # this seems to be possible under odd restart conditions
                             # where the log lines are out of order. It has to be bogus
                             # data so null out the duration
-                            job['duration'] = ''
-                            job['exceptions'] += 'negative duration deleted = '
+                            j.run_time = None
+                            j.add_exception('negative duration deleted = ')
 
                 if self.jl:
-                    self.jl.timeline.add_event(Event(message_time, 'vanished', job))
+                    self.jl.timeline.add(tm, 'vanished', j)
+                if j.jl:
+                    # the old job is over, it may already have been finalized at a restart
+                    j.jl.finalize(j)
 
     def started(self, message):
-        global running_hosts
+        running_hosts = self.host_table()
         # 2014-11-13T09:09:10.0581 - Job 254: started AXIEM:33.0, procId:0 on
         # controller "dfw0awrsim01"
-        (message_time, job_number, command) = self.parse_job_message(message)
-        self.job['start'] = message_time
-        if self.job['submitted'] == '':
+        rec = as_record(message)
+        self.start_time = rec.tm
+        if self.submit_time is None:
             # the start time got lost in a server restart
-            self.job['queued'] = 'NA'
+            self.wait_time = float('nan')
         else:
-            self.job['queued'] = self.job['start'] - self.job['submitted']
-        host = command[command.find('controller ') + 12: -1]
-        self.job['host'] = host
+            self.wait_time = self.start_time - self.submit_time
+        host = rec.message[rec.message.find('controller ') + 12: -1]
+        self.host = host
         running_hosts[host] = self
 
         if self.jl:
-            self.jl.timeline.add_event(Event(message_time, 'started', self.job))
+            self.jl.timeline.add(rec.tm, 'started', self)
 
     def working_set(self, message):
         # 2015-03-03T16:49:10.0093 - Job 97: peak working set = 4546879488.
-        (message_time, job_number, command) = self.parse_job_message(message)
-        size = command[command.find('=') + 2:-1]  # from equal to before period
+        rec = as_record(message)
+        size = rec.message[rec.message.find('=') + 2:-1]  # from equal to before period
         if "KB" in size:
             size = float(size[:-2]) / 1024  # to MB
         elif "MB" in size:
@@ -746,19 +1513,19 @@ class Job:
             if size[-1] == 'B':
                 size = size[:-1]
             size = float(size) / 1024 / 1024  # convert to MB
-        self.job['working_set'] = size
+        self.mem_mb = size
 
     def releasing(self, message):
         # 2014-11-05T13:56:43.0531 - Job 1: releasing 8 processors (processor
         # reservations available before:0, after:8)
-        (message_time, job_number, command) = self.parse_job_message(message)
-        self.job['stop'] = message_time
-        if self.job['start'] == '':
+        rec = as_record(message)
+        self.stop_time = rec.tm
+        if self.start_time is None:
             # the start time got lost in a server restart
-            self.job['duration'] = 'NA'
+            self.run_time = float('nan')
         else:
-            self.job['duration'] = self.job['stop'] - self.job['start']
-            if self.job['duration'] < 0:
+            self.run_time = self.stop_time - self.start_time
+            if self.run_time < 0:
                 print('----- Job has negative duration -----')
                 print('Set due releasing')
                 print(self.job)
@@ -766,143 +1533,142 @@ class Job:
     def request_info(self, message):
         # 014-10-21T12:37:31.0010 - Job 1: MaxProcessors=8, MinProcessors=1,
         # ThreadsPerProcessor=1, PreferredPerf="low", PreferredMemCap="low".
-        (message_time, job_number, command) = self.parse_job_message(message)
-        for keyword_pair in [f.strip() for f in command.split(',')]:
+        rec = as_record(message)
+        job = self.job
+        for keyword_pair in [f.strip() for f in rec.message.split(',')]:
             (name, value) = keyword_pair.split('=')
 
-            self.job['R_' + name] = value.rstrip('.').rstrip('"').lstrip('"')
+            job['R_' + name] = value.rstrip('.').rstrip('"').lstrip('"')
 
     def reserving(self, message):
         # 2014-10-21T12:37:31.0665 - Job 1: reserving 8 processors (0 processor
         # reservations remaining)
-        (message_time, job_number, command) = self.parse_job_message(message)
-        num_proc = command[10:command.find(' processors')]
-        self.job['processors'] = int(num_proc)
+        rec = as_record(message)
+        num_proc = rec.message[10:rec.message.find(' processors')]
+        self.processors = int(num_proc)
 
     def files_remaining(self, message):
         # 2015-05-01T09:42:34.0945 - Job 1: Output Files remaining: 1
-        (message_time, job_number, command) = self.parse_job_message(message)
-        files_remaining = command[command.find(': ') + 1:]
-        self.job['files_remaining'] = int(files_remaining)
+        rec = as_record(message)
+        files_remaining = rec.message[rec.message.find(': ') + 1:]
+        self.files_left = int(files_remaining)
 
     def exit_status(self, message):
-        global running_hosts
+        running_hosts = self.host_table()
         # 2014-10-21T12:37:59.0573 - Job 1: (AXIEM:1.0) Ended. Exit status: 0
-        (message_time, job_number, command) = self.parse_job_message(message)
+        rec = as_record(message)
 
         # remove job from running host table
-        if self.job['host'] in running_hosts:
-            del running_hosts[self.job['host']]
+        if self.host in running_hosts:
+            del running_hosts[self.host]
 
         # need to check whether job has already see other exist status message
-        if self.job['exit']:
+        if self.exit:
             return
 
-        self.job['exit'] = command.split(': ')[1]  # extract numerical exit status
-        if self.duration() == '':
-            if self.job['start'] != '':
-                self.job['stop'] = message_time
-                self.job['duration'] = self.job['stop'] - self.job['start']
-                if self.job['duration'] < 0:
+        self.exit = rec.message.split(': ')[1]  # extract numerical exit status
+        if self.run_time is None:
+            if self.start_time is not None:
+                self.stop_time = rec.tm
+                self.run_time = self.stop_time - self.start_time
+                if self.run_time < 0:
                     print('----- Job has negative duration -----')
                     print('Set due to exit status')
                     print(self.job)
             else:
-                print('Job {} has no start time {}.'.format(job_number, self.job['start']))
+                print('Job {} has no start time {}.'.format(rec.number, self.job['start']))
         if self.jl:
-            self.jl.timeline.add_event(Event(message_time, 'ended', self.job))
+            self.jl.timeline.add(rec.tm, 'ended', self)
 
     def exit_code(self, message):
-        global running_hosts
+        running_hosts = self.host_table()
         # 20...0 - Job 18: Process 404 ("C:\Program Files\AWR\V12\mpiexec.exe") ended with exit code 1.
-        (message_time, job_number, command) = self.parse_job_message(message)
+        rec = as_record(message)
 
         # remove job from running host table
-        if self.job['host'] in running_hosts:
-            del running_hosts[self.job['host']]
+        if self.host in running_hosts:
+            del running_hosts[self.host]
 
         # need to check whether job has already see other exist status message
-        if self.job['exit'] and self.job['start'] and self.job['duration']:
+        if self.exit and self.start_time and self.run_time:
             return
 
-        if self.job.get('exit') != 'cancelled':
+        if self.exit != 'cancelled':
             # cancelled precedes the exit code as it is a more useful message
-            self.job['exit'] = command.split('exit code ')[1][:-1]  # extract numerical exit status
-        if self.duration() == '':
-            if self.job['start'] != '':
-                self.job['stop'] = message_time
-                self.job['duration'] = self.job['stop'] - self.job['start']
-                if self.job['duration'] < 0:
+            self.exit = rec.message.split('exit code ')[1][:-1]  # extract numerical exit status
+        if self.run_time is None:
+            if self.start_time is not None:
+                self.stop_time = rec.tm
+                self.run_time = self.stop_time - self.start_time
+                if self.run_time < 0:
                     print('----- Job has negative duration -----')
                     print('Set due to exit status')
                     print(self.job)
             else:
-                print('Job {} has no start time {}.'.format(job_number, self.job['start']))
+                print('Job {} has no start time {}.'.format(rec.number, self.job['start']))
         if self.jl:
-            self.jl.timeline.add_event(Event(message_time, 'ended', self.job))
+            self.jl.timeline.add(rec.tm, 'ended', self)
 
     def cancelled(self, message):
         # 2014-11-13T14:17:10.0419 - Dequeueing job number 263 (AXIEM:39.0)
         # for some weird reason this message is non-standard
-        if self.job['exit']:
+        if self.exit:
             # job already cancelled or terminated, do nothing
             return
 
-        s = message.rstrip()
-        (tm, rest) = s.split(' - ', 1)
-        message_time = timestamp2float(tm)
+        rec = as_record(message)
 
-        if self.duration() == '':
+        if self.run_time is None:
             # jobs being cancelled may not have been started yet
-            if self.job['start'] != '':
-                self.job['stop'] = message_time
+            if self.start_time is not None:
+                self.stop_time = rec.tm
                 # don't set duration because job was cancelled
 
-        self.job['exit'] = 'cancelled'
+        self.exit = 'cancelled'
 
         # remove job from running host table
-        if self.job['host'] in running_hosts:
-            del running_hosts[self.job['host']]
+        running_hosts = self.host_table()
+        if self.host in running_hosts:
+            del running_hosts[self.host]
 
         if self.jl:
-            self.jl.timeline.add_event(Event(message_time, 'cancelled', self.job))
+            self.jl.timeline.add(rec.tm, 'cancelled', self)
 
     def terminated(self, message):
         # 2016 - 03 - 28T13:44:17.0468 - Terminating job number 26(mpiexec:2.2)
 
-        if self.job['exit']:
+        if self.exit:
             # job already cancelled or terminated, do nothing
             return
 
-        s = message.rstrip()
-        (tm, rest) = s.split(' - ', 1)
-        message_time = timestamp2float(tm)
-        self.job['stop'] = message_time
-        self.job['exit'] = 'cancelled'
+        rec = as_record(message)
+        self.stop_time = rec.tm
+        self.exit = 'cancelled'
         # don't set duration because job was cancelled
 
         # remove job from running host table
-        if self.job['host'] in running_hosts:
-            del running_hosts[self.job['host']]
+        running_hosts = self.host_table()
+        if self.host in running_hosts:
+            del running_hosts[self.host]
 
         if self.jl:
-            self.jl.timeline.add_event(Event(message_time, 'terminated', self.job))
+            self.jl.timeline.add(rec.tm, 'terminated', self)
 
     def copy_back_start(self, message):
         # 2016-02-27T20:10:50.0577 - Job 464: Output Files remaining: 1
-        (message_time, job_number, command) = self.parse_job_message(message)
-        if not self.job['stop']:
+        rec = as_record(message)
+        if not self.stop_time:
             # file copying started so job is over but no exit message seen yet.
             # set stop time make mark that it is set from copy
-            self.job['stop'] = message_time
-            self.job['exceptions'] += 'set stop time from copy line - '
+            self.stop_time = rec.tm
+            self.add_exception('set stop time from copy line - ')
 
     def copy_back_end(self, message):
         # 2016-02-19T09:23:59.0571 - Job 22: Output Files remaining: 1
-        (message_time, job_number, command) = self.parse_job_message(message)
-        if self.job['stop']:
-            self.job['results_copy'] = message_time - self.job['stop']
-        elif self.job['exit'] == 'cancelled':
+        rec = as_record(message)
+        if self.stop_time:
+            self.copy_time = rec.tm - self.stop_time
+        elif self.exit == 'cancelled':
             # cancelled, output file message is actually erronious
             return
         else:
@@ -914,95 +1680,49 @@ class Job:
     # ############################################################################### OUTPUT FUNCTION
 
     def job2csv(self, is_header):
-        """For writing out jobs as CSV, take one job and convert it to a string in csv format"""
-
-        s = ''
-        (date, tm, day) = time2tuple(self.job['submitted'])
-        s += 'submitted_date' if is_header else date
-        s += ','
-        s += 'submitted_time' if is_header else tm
-        s += ','
-        s += 'submitted_day' if is_header else day
-        s += ','
-
-        (date, tm, day) = time2tuple(self.job['start'])
-        s += 'start_date' if is_header else date
-        s += ','
-        s += 'start_time' if is_header else tm
-        s += ','
-        s += 'start_day' if is_header else day
-        s += ','
-        s += 'duration_m' if is_header else interval2string_m(self.job['duration'])
-        s += ','
-        s += 'wait_m' if is_header else interval2string_m(self.job['queued'])
-        s += ','
-        s += 'user' if is_header else self.job['S_User']
-        s += ','
-        s += 'simulator' if is_header else self.sim()
-        s += ','
-        s += 'host' if is_header else self.job['host']
-        s += ','
-        s += 'working_set' if is_header else str(self.job['working_set'])
-        s += ','
-        s += 'priority' if is_header else self.job['S_Priority']
-        s += ','
-        s += 'min_proc' if is_header else self.job['R_MinProcessors']
-        s += ','
-        s += 'threads' if is_header else self.job['R_ThreadsPerProcessor']
-        s += ','
-        s += 'max_proc' if is_header else self.job['R_MaxProcessors']
-        s += ','
-        s += 'req_perf' if is_header else self.job['R_PreferredPerf']
-        s += ','
-        s += 'req_mem' if is_header else self.job['R_PreferredMemCap']
-        s += ','
-        s += 'exit_code' if is_header else self.job['exit']
-        s += ','
-        s += 'results_copy_m' if is_header else interval2string_m(self.job['results_copy'])
-        s += ','
-        s += 'uuid' if is_header else str(self.job['S_UniqueID'])
-        s += ','
-        s += 'version' if is_header else str(self.job['major_version'])
-
-        return s
+        """For writing out jobs as CSV, take one job and convert it to a string in csv format, see csv_rows"""
+        if is_header:
+            return CSV_HEADER
+        return csv_rows([self])[0]
 
     def job2dict(self):
-        """convert a job into a 'clean' dictionary (I know, it already is)"""
+        """convert a job into a 'clean' dictionary"""
         d = {}
 
-        (date, tm, day) = time2tuple(self.job['submitted'])
+        job = self.job
+        (date, tm, day) = time2tuple(job['submitted'])
         d['submitted_date'] = date
         d['submitted_time'] = tm
         d['submitted_day'] = day
 
-        (date, tm, day) = time2tuple(self.job['start'])
+        (date, tm, day) = time2tuple(job['start'])
         d['start_date'] = date
         d['start_time'] = tm
         d['start_day'] = day
-        d['duration_m'] = interval2float_m(self.job['duration'])
-        d['wait_m'] = interval2float_m(self.job['queued'])
-        d['user'] = self.job['S_User']
-        d['major_version'] = to_int_or_na(self.job['version'][:2])
-        d['minor_version'] = self.job['version']
+        d['duration_m'] = interval2float_m(job['duration'])
+        d['wait_m'] = interval2float_m(job['queued'])
+        d['user'] = job['S_User']
+        d['major_version'] = to_int_or_na(job['version'][:2])
+        d['minor_version'] = job['version']
         d['simulator'] = self.sim()
-        d['host'] = self.job['host']
-        d['priotiry'] = to_int_or_na(self.job['S_Priority'])
-        d['min_proc'] = to_int_or_na(self.job['R_MinProcessors'])
-        d['threads'] = to_int_or_na(self.job['R_ThreadsPerProcessor'])
-        d['max_proc'] = to_int_or_na(self.job['R_MaxProcessors'])
-        d['req_perf'] = self.job['R_PreferredPerf']
-        d['req_mem'] = self.job['R_PreferredMemCap']
-        d['exit'] = self.job['exit']
-        d['files_remaining'] = to_int_or_na(self.job['files_remaining'])
-        d['working_set'] = to_int_or_na(self.job['working_set'])
-        d['results_copy_m'] = interval2float_m(self.job['results_copy'])
+        d['host'] = job['host']
+        d['priotiry'] = to_int_or_na(job['S_Priority'])
+        d['min_proc'] = to_int_or_na(job['R_MinProcessors'])
+        d['threads'] = to_int_or_na(job['R_ThreadsPerProcessor'])
+        d['max_proc'] = to_int_or_na(job['R_MaxProcessors'])
+        d['req_perf'] = job['R_PreferredPerf']
+        d['req_mem'] = job['R_PreferredMemCap']
+        d['exit'] = job['exit']
+        d['files_remaining'] = to_int_or_na(job['files_remaining'])
+        d['working_set'] = to_int_or_na(job['working_set'])
+        d['results_copy_m'] = interval2float_m(job['results_copy'])
         return d
 
     def pprint(self):
         ordered_keys = ['submitted', 'start', 'stop', 'exit', 'S_Name', 'host']
         d = self.job
-        print('\n{} =============================================='.format(self.job['id']))
-        max_key = max([len(k) for k in d.keys()])
+        print('\n{} =============================================='.format(d['id']))
+        max_key = max([len(k) for k in ordered_keys + list(d.keys())])
         fmt_str = "%{}s: %s" .format(max_key + 1)
         for k in ordered_keys + sorted([x for x in d.keys() if x not in ordered_keys]):
             if k in ['start', 'submitted', 'stop']:
@@ -1010,11 +1730,119 @@ class Job:
             else:
                 print(fmt_str % (k, d[k]))
         print('----- Log Lines -----')
-        for l in self.lines:
+        for l in self.source_lines():
             print(l)
 
+    def source_lines(self):
+        """Return the log lines used to build the job, they are read back from the log files"""
+        if self.jl and self.lines:
+            return self.jl.source_lines(self.lines)
+        return []
+
     def __str__(self):
-        return self.job['id']
+        return self.id or ''
 
     def __repr__(self):
         return 'Job({})'.format(self.job)
+
+
+# ###################################################################################### CSV OUTPUT
+CSV_COLUMNS = ['submitted_date', 'submitted_time', 'submitted_day', 'start_date', 'start_time', 'start_day',
+               'duration_m', 'wait_m', 'user', 'simulator', 'host', 'working_set', 'priority', 'min_proc',
+               'threads', 'max_proc', 'req_perf', 'req_mem', 'exit_code', 'results_copy_m', 'uuid', 'version']
+CSV_HEADER = ','.join(CSV_COLUMNS)
+
+# number of jobs formatted and written at a time by write_csv_rows
+CSV_BATCH = 10000
+
+_NA_TIME = ('NA', 'NA', 'NA')
+
+
+def time_columns(times: List[Optional[float]], memo: Dict[float, Tuple[str, str, str]]):
+    """
+    Return the date, hour and day of week columns of times, as time2tuple of each time
+
+    The columns only depend on the local hour a time is in.  Time zone offsets and their changes are
+    whole quarter hours so time2tuple is called once for each quarter hour and kept in memo.
+
+    Arguments:
+        times: epoch seconds, None where the time is missing
+        memo: quarter hour -> time2tuple, pass the same dict for all the batches of a file
+
+    Returns:
+        a (dates, hours, days) tuple of lists of strings
+    """
+    def lookup(tm):
+        t = memo[tm // 900] = time2tuple(tm)
+        return t
+
+    tuples = [_NA_TIME if tm is None else (memo.get(tm // 900) or lookup(tm)) for tm in times]
+    if not tuples:
+        return [], [], []
+    return tuple(zip(*tuples))
+
+
+def csv_rows(joblist: List['Job'], memo: Dict[float, Tuple[str, str, str]] = None) -> List[str]:
+    """
+    Return the csv rows of jobs, the same as job2csv(False) of each job
+
+    The rows are built a column at a time from the Job slots, rather than a field at a time through the
+    JobView.  A missing value is '' and a missing interval is 'NA', as in the JobView.
+
+    Arguments:
+        joblist: the jobs to format
+        memo: see time_columns, a new one is used if it is None
+    """
+    if memo is None:
+        memo = {}
+
+    def values(slot):
+        return map(attrgetter(slot), joblist)
+
+    def text(slot):
+        return ['' if v is None else v for v in values(slot)]
+
+    def strings(slot):
+        return ['' if v is None else str(v) for v in values(slot)]
+
+    def minutes(slot, na=True):
+        # interval2string_m, the JobView shows a NaN queued or duration as 'NA'
+        if na:
+            return ['NA' if type(v) is not float or v != v else str(round(v / 60.0, 2)) for v in values(slot)]
+        return ['NA' if type(v) is not float else str(round(v / 60.0, 2)) for v in values(slot)]
+
+    columns = []
+    columns.extend(time_columns(list(values('submit_time')), memo))
+    columns.extend(time_columns(list(values('start_time')), memo))
+    columns.append(minutes('run_time'))
+    columns.append(minutes('wait_time'))
+    columns.append(text('user'))
+    columns.append([j.sim() for j in joblist])
+    columns.append(text('host'))
+    columns.append(strings('mem_mb'))
+    for slot in ('priority', 'min_proc', 'threads', 'max_proc'):
+        columns.append(strings(slot))
+    for slot in ('req_perf', 'req_mem', 'exit'):
+        columns.append(text(slot))
+    columns.append(minutes('copy_time', na=False))
+    columns.append(strings('uuid'))
+    columns.append([str(j.extra.get('major_version', '')) if j.extra else '' for j in joblist])
+    return list(map(','.join, zip(*columns)))
+
+
+def write_csv_rows(fp: IO, joblist: List['Job'], header: bool = True, batch: int = CSV_BATCH) -> None:
+    """
+    Write jobs to an open file in csv format, batch jobs at a time
+
+    Arguments:
+        fp: file to write to
+        joblist: the jobs to write
+        header: write the CSV_HEADER line first
+        batch: number of jobs formatted and written with one write
+    """
+    if header:
+        fp.write(CSV_HEADER + '\n')
+    memo = {}  # type: Dict[float, Tuple[str, str, str]]
+    for n in range(0, len(joblist), batch):
+        rows = csv_rows(joblist[n:n + batch], memo)
+        fp.write('\n'.join(rows) + '\n')
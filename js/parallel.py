@@ -0,0 +1,306 @@
+"""
+Parallel parsing of scheduler logs
+
+Every scheduler restart or shutdown retires all the job numbers so a log is a sequence of independent
+segments.  The segments are parsed in a process pool and the results are stitched back together in
+order.  The little state that does cross a restart is recorded by the worker and resolved when stitching:
+
+    - a job restored by UniqueID after a restart is stood in for by a placeholder job, the lines of
+      the placeholder are replayed on the original job
+    - a host assignment that may end a job started before the restart is replayed against the
+      running host table of the earlier segments
+
+The result is the same as parsing the files one after another with Jobs.read_log_file.
+"""
+import mmap
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Iterable
+
+from js.jsr import Jobs, Job, Timeline, LINE_KINDS, LOG_CHUNK_SIZE, parse_line, assigned_host
+from js.util import is_compressed
+
+# the segments of a log are combined into pieces of at least this many bytes for the workers
+SEGMENT_SIZE = 4 * 1024 * 1024
+
+# text of the lines that end a segment
+_RESTART_TEXT = [text.encode('utf-8') for (text, kind) in LINE_KINDS if kind in ('restart', 'shutdown')]
+
+# a byte range of a log file to parse, file_number is the position of the file in the list being read
+Segment = namedtuple('Segment', ['file_number', 'filename', 'start', 'end', 'first_line', 'close', 'track_lines'])
+# a job restored by UniqueID that was not submitted in the segment, records are the (line number, LogRecord)
+# of the lines for the placeholder job
+Restore = namedtuple('Restore', ['uuid', 'number', 'lineno', 'records'])
+# an assignment to a host that was not started on in the segment, position is where it is in the timeline
+Reassign = namedtuple('Reassign', ['lineno', 'position', 'host', 'tm', 'job', 'set_duration'])
+
+
+def restart_offsets(filename: str) -> List[int]:
+    """ Return the byte offsets just after each scheduler restart or shutdown line of a log"""
+    offsets = set()
+    with open(filename, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for text in _RESTART_TEXT:
+                pos = mm.find(text)
+                while pos >= 0:
+                    line_start = mm.rfind(b'\n', 0, pos) + 1
+                    line_end = mm.find(b'\n', pos)
+                    line_end = len(mm) if line_end < 0 else line_end + 1
+                    line = mm[line_start:line_end].decode('utf-8').rstrip().lstrip('\ufeff')
+                    if parse_line(line).kind in ('restart', 'shutdown'):
+                        offsets.add(line_end)
+                    pos = mm.find(text, line_end)
+    return sorted(offsets)
+
+
+def log_segments(file_number: int, filename: str, min_size: int = SEGMENT_SIZE,
+                 track_lines: bool = True) -> List[Segment]:
+    """
+    Split a log file at its scheduler restarts
+
+    Arguments:
+        file_number: position of the file in the list of files being read
+        filename: name of the log file
+        min_size: consecutive segments are combined until they are at least this many bytes
+        track_lines: passed on to the Jobs that parses each segment
+
+    Returns:
+        the segments in file order, the last one closes out the open jobs, a compressed log is not split
+    """
+    if is_compressed(filename):
+        return [Segment(file_number, filename, 0, None, 1, True, track_lines)]
+    size = os.path.getsize(filename)
+    ends = restart_offsets(filename)
+    if not ends or ends[-1] != size:
+        ends.append(size)
+    segments = []
+    start = 0
+    first_line = 1
+    with open(filename, 'rb') as fp:
+        for end in ends:
+            if end - start < min_size and end < size:
+                continue
+            fp.seek(start)
+            lines = fp.read(end - start).count(b'\n')
+            segments.append(Segment(file_number, filename, start, end, first_line, end == size, track_lines))
+            (start, first_line) = (end, first_line + lines)
+    return segments
+
+
+class HostTable(dict):
+    """ running host table that remembers which hosts were started on or removed"""
+
+    def __init__(self, items: Iterable = (), touched: Iterable = ()) -> None:
+        super().__init__(items)
+        self.touched = set(touched)
+
+    def __setitem__(self, host, job):
+        self.touched.add(host)
+        super().__setitem__(host, job)
+
+    def __delitem__(self, host):
+        self.touched.add(host)
+        super().__delitem__(host)
+
+    def __reduce__(self):
+        return HostTable, (dict(self), self.touched)
+
+
+class SegmentJobs(Jobs):
+    """
+    Jobs for one segment of a log, parsed without the jobs of the segments before it
+
+    Members (in addition to those of Jobs):
+        restores: placeholder job -> Restore, for jobs restored from an earlier segment
+        reassigns: list of Reassign, host assignments that may end a job of an earlier segment
+        count: number of jobs submitted
+    """
+
+    def __init__(self, track_lines: bool = True) -> None:
+        super().__init__(track_lines=track_lines)
+        self.table = None  # the table is built by the job list the segment is stitched into
+        self.running_hosts = HostTable()
+        self.restores = {}  # placeholder job -> Restore
+        self.reassigns = []  # type: List[Reassign]
+        self.count = 0
+
+    def set_jobno_from_uuid(self, uuid, jobno, lineno):
+        if uuid in self.by_uuid:
+            return super().set_jobno_from_uuid(uuid, jobno, lineno)
+        # the job is from an earlier segment, a placeholder collects its lines until stitch()
+        j = Job()
+        j.number = jobno
+        j.exit = 'restored'
+        self.add(j)
+        self.restores[j] = Restore(uuid, jobno, lineno, [])
+        return True
+
+    def dispatch(self, rec, lineno):
+        if rec.kind == 'assigned':
+            host = assigned_host(rec.message)
+            job = self.active.get(rec.number)
+            if job is not None and host not in self.running_hosts.touched:
+                self.reassigns.append(Reassign(lineno, len(self.timeline), host, rec.tm, job, job.run_time is None))
+        j = super().dispatch(rec, lineno)
+        if j is not None and j in self.restores:
+            self.restores[j].records.append((lineno, rec))
+        return j
+
+
+def parse_segment(segment: Segment) -> SegmentJobs:
+    """ Parse one segment of a log, this runs in the worker processes"""
+    jobs = SegmentJobs(segment.track_lines)
+    jobs.count = jobs.read_log_file(segment.filename, LOG_CHUNK_SIZE, segment.start, segment.end,
+                                    segment.first_line, segment.close)
+    return jobs
+
+
+def stitch(jobs: Jobs, seg: SegmentJobs, file_id: int) -> None:
+    """
+    Append the jobs and events of a parsed segment to a job list
+
+    Arguments:
+        jobs: job list holding the segments before this one
+        seg: the parsed segment
+        file_id: index of the segment's log file in jobs.files
+    """
+    found = find_restored(jobs, seg, file_id)
+    (index, moved) = move_jobs(jobs, seg, found, file_id)
+    inserted = replay(jobs, seg, found)
+    # the segment ends with a restart
+    for job in jobs.active.values():
+        job.number = None
+    jobs.active.clear()
+    merge_state(jobs, seg, found, index, inserted)
+    for job in moved + list(found.values()):
+        jobs.finalize(job)
+
+
+def find_restored(jobs: Jobs, seg: SegmentJobs, file_id: int) -> Dict[Job, Job]:
+    """Return placeholder -> the job of the earlier segments it stands for, the placeholder's lines are added to it"""
+    found = {}
+    for (p, restore) in seg.restores.items():
+        job = jobs.by_uuid.get(restore.uuid)
+        if job is None:
+            # the placeholder stays as the job, as Jobs.set_jobno_from_uuid does
+            print('ERROR: Could not find job matching uuid {}'.format(restore.uuid))
+            print('       error occured on line {}'.format(restore.lineno))
+        else:
+            found[p] = job
+            job.lines += [(file_id, offset, length) for (_, offset, length) in p.lines]
+    return found
+
+
+def move_jobs(jobs: Jobs, seg: SegmentJobs, found: Dict[Job, Job], file_id: int) -> Tuple[List[int], List[Job]]:
+    """
+    Move the jobs of a segment over to the job list, the placeholders in found are not moved
+
+    Returns:
+        the index in jobs of each job index of the segment, the jobs moved
+    """
+    index = []
+    moved = []
+    for j in seg.joblist:
+        if j in found:
+            index.append(found[j].index)
+            continue
+        j.jl = jobs
+        if j.id is not None:
+            j.id = jobs.new_job_id()
+        j.index = len(jobs.joblist)
+        j.lines = [(file_id, offset, length) for (_, offset, length) in j.lines]
+        jobs.joblist.append(j)
+        if jobs.table is not None:
+            jobs.table.append(j)
+        index.append(j.index)
+        moved.append(j)
+    return index, moved
+
+
+def replay(jobs: Jobs, seg: SegmentJobs, found: Dict[Job, Job]) -> List[Tuple[int, Timeline]]:
+    """
+    Replay the restores, the lines of the restored jobs and the host reassignments of a segment in line order
+
+    Returns:
+        (position in the segment timeline, events) of the host reassignments that added events
+    """
+    ops = [(r.lineno, 0, 'restore', p) for (p, r) in seg.restores.items() if p in found]
+    ops += [(lineno, 1, 'replay', rec) for p in found for (lineno, rec) in seg.restores[p].records]
+    ops += [(r.lineno, 1, 'reassign', r) for r in seg.reassigns]
+    inserted = []
+    timeline = jobs.timeline
+    try:
+        for (lineno, _, op, arg) in sorted(ops, key=lambda x: x[:2]):
+            # the events of the replayed lines are already in the segment's timeline
+            jobs.timeline = Timeline(jobs.joblist)
+            if op == 'restore':
+                job = found[arg]
+                job.number = seg.restores[arg].number
+                job.exit = 'restored'
+                jobs.active[job.number] = job
+            elif op == 'replay':
+                jobs.dispatch(arg, lineno)
+            else:
+                job = found.get(arg.job, arg.job)
+                job.reassign_host(arg.host, arg.tm, arg.set_duration)
+                if len(jobs.timeline):
+                    inserted.append((arg.position, jobs.timeline))
+    finally:
+        jobs.timeline = timeline
+    return inserted
+
+
+def merge_state(jobs: Jobs, seg: SegmentJobs, found: Dict[Job, Job], index: List[int],
+                inserted: List[Tuple[int, Timeline]]) -> None:
+    """Add the events, running hosts, UniqueIDs and scheduler starts of a segment to the job list"""
+    # events, with those of the host reassignments where they happened
+    timeline = jobs.timeline
+    start = 0
+    for (position, events) in inserted:
+        timeline.extend(seg.timeline, index, start, position)
+        timeline.extend(events)
+        start = position
+    timeline.extend(seg.timeline, index, start, len(seg.timeline))
+
+    for host in seg.running_hosts.touched:
+        if host in seg.running_hosts:
+            job = seg.running_hosts[host]
+            jobs.running_hosts[host] = found.get(job, job)
+        else:
+            jobs.running_hosts.pop(host, None)
+    for (uuid, job) in seg.by_uuid.items():
+        jobs.by_uuid[uuid] = found.get(job, job)
+    jobs.starts += seg.starts
+
+
+def read_log_files(jobs: Jobs, filenames: List[str], processes: int = None,
+                   min_size: int = SEGMENT_SIZE) -> List[int]:
+    """
+    Parse log files into a job list using a pool of processes
+
+    Arguments:
+        jobs: the job list to add the jobs to
+        filenames: the log files in the order they would be read
+        processes: number of worker processes, the number of CPUs if None
+        min_size: most bytes that have to be given to a worker at once, see log_segments
+
+    Returns:
+        the number of jobs submitted in each file
+    """
+    # enough pieces to keep all the workers busy
+    total = sum(os.path.getsize(f) for f in filenames)
+    min_size = min(min_size, total // (4 * (processes or os.cpu_count() or 1)))
+    segments = [s for (n, f) in enumerate(filenames) for s in log_segments(n, f, min_size, jobs.track_lines)]
+    counts = [0] * len(filenames)
+    file_ids = {}  # file number -> index in jobs.files
+    with ProcessPoolExecutor(processes) as pool:
+        for (segment, seg) in zip(segments, pool.map(parse_segment, segments)):
+            if segment.file_number not in file_ids:
+                file_ids[segment.file_number] = len(jobs.files)
+                jobs.files.append(segment.filename)
+            counts[segment.file_number] += seg.count
+            stitch(jobs, seg, file_ids[segment.file_number])
+    return counts
@@ -0,0 +1,169 @@
+"""
+Pre-aggregated job totals by time, simulator, user and host
+
+The monthly and hourly reports of the notebook pivot every job each time they are run.  A Rollup keeps
+the totals the reports need in cells keyed by (date, hour, simulator, user, host) of the submit time,
+jobs are added to it as they are parsed and the reports are answered from the cells alone.  The month
+and day of a cell are parts of its date.  A cell holds the number of jobs, the number that completed
+and the count and sum of their durations, waits and working sets, so means can be computed for any
+grouping.
+
+    rollup = Rollup.load('site.rollup')
+    rollup.add_jobs(finished)
+    rollup.save('site.rollup')
+    rollup.query(['month', 'simulator'])
+
+Rollups merge, the rollups of several scheduler nodes add up to the one of the whole site.
+"""
+import os
+import pickle
+from typing import Dict, Iterable, Tuple, Any
+
+from js.jsr import Job, time_columns
+
+ROLLUP_VERSION = 1
+
+# the key of a cell
+KEY = ('date', 'hour', 'simulator', 'user', 'host')
+# the dimensions a query can group by or filter on, month and day are parts of the date
+DIMENSIONS = {
+    'month': lambda key: key[0][:7],
+    'day': lambda key: key[0][8:],
+    'date': lambda key: key[0],
+    'hour': lambda key: key[1],
+    'simulator': lambda key: key[2],
+    'user': lambda key: key[3],
+    'host': lambda key: key[4],
+}
+# the totals kept in a cell, in order
+MEASURES = ('jobs', 'completed', 'duration_n', 'duration_m', 'wait_n', 'wait_m', 'working_set_n', 'working_set')
+# measure -> the count its mean is taken over
+MEANS = {'duration_m': 'duration_n', 'wait_m': 'wait_n', 'working_set': 'working_set_n'}
+
+CellKey = Tuple[str, int, str, str, str]
+
+
+class Rollup:
+    """
+    Job totals for each (date, hour, simulator, user, host)
+
+    Members:
+        cells: key -> list of the MEASURES, the date is YYYY-MM-DD and the hour 0 to 23 of the local submit
+               time, 'NA' and -1 if the job has no submit time
+        jobs: number of jobs added
+    """
+
+    def __init__(self) -> None:
+        self.version = ROLLUP_VERSION
+        self.cells = {}  # type: Dict[CellKey, list]
+        self.jobs = 0
+
+    @classmethod
+    def load(cls, path: str) -> 'Rollup':
+        """Return the rollup saved in path, an empty one if the file does not exist"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'rb') as fp:
+            rollup = pickle.load(fp)
+        if getattr(rollup, 'version', None) != ROLLUP_VERSION:
+            print('ERROR: {} is not a rollup of this version, starting over'.format(path))
+            return cls()
+        return rollup
+
+    def save(self, path: str) -> None:
+        with open(path + '.tmp', 'wb') as fp:
+            pickle.dump(self, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def add_job(self, job: Job) -> None:
+        self.add_jobs([job])
+
+    def add_jobs(self, jobs: Iterable[Job]) -> None:
+        """Add finished jobs to the totals"""
+        jobs = list(jobs)
+        (dates, hours, days) = time_columns([j.submit_time for j in jobs], {})
+        for (job, date, hour) in zip(jobs, dates, hours):
+            key = (date, -1 if hour == 'NA' else int(hour), job.sim(), job.user or '', job.host or '')
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = [0] * len(MEASURES)
+            cell[0] += 1
+            if job.exit == '0':
+                cell[1] += 1
+            for (n, value) in ((2, job.run_time), (4, job.wait_time)):
+                if isinstance(value, float) and value == value:
+                    cell[n] += 1
+                    cell[n + 1] += value / 60.0
+            if isinstance(job.mem_mb, (int, float)) and job.mem_mb == job.mem_mb:
+                cell[6] += 1
+                cell[7] += job.mem_mb
+        self.jobs += len(jobs)
+
+    def merge(self, other: 'Rollup') -> None:
+        """Add the totals of another rollup, eg of another scheduler node"""
+        self.jobs += other.jobs
+        for (key, values) in other.cells.items():
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = list(values)
+            else:
+                for (n, value) in enumerate(values):
+                    cell[n] += value
+
+    def query(self, by: Iterable[str], where: Dict[str, Any] = None) -> Dict[Tuple, Dict[str, float]]:
+        """
+        Return the totals of the cells grouped by some of the DIMENSIONS
+
+        Arguments:
+            by: the dimensions to group by, eg ['month', 'simulator']
+            where: dimension -> value, only the cells with these values are counted
+
+        Returns:
+            group key tuple -> measure -> total, sorted by key, plus <measure>_mean for the MEANS
+        """
+        group_of = [DIMENSIONS[d] for d in by]
+        filters = [(DIMENSIONS[d], value) for (d, value) in (where or {}).items()]
+        totals = {}  # type: Dict[Tuple, list]
+        for (key, values) in self.cells.items():
+            if any(dimension(key) != value for (dimension, value) in filters):
+                continue
+            group = tuple(g(key) for g in group_of)
+            total = totals.get(group)
+            if total is None:
+                totals[group] = list(values)
+            else:
+                for (n, value) in enumerate(values):
+                    total[n] += value
+        result = {}
+        for group in sorted(totals):
+            row = dict(zip(MEASURES, totals[group]))
+            for (measure, count) in MEANS.items():
+                row[measure + '_mean'] = row[measure] / row[count] if row[count] else float('nan')
+            result[group] = row
+        return result
+
+    def monthly(self, by: str = 'simulator') -> Dict[Tuple, Dict[str, float]]:
+        """Return the totals for each (month, by)"""
+        return self.query(['month', by])
+
+    def hourly(self, by: str = 'simulator') -> Dict[Tuple, Dict[str, float]]:
+        """Return the totals for each (hour of the day, by)"""
+        return self.query(['hour', by])
+
+    def to_frame(self, by: Iterable[str], where: Dict[str, Any] = None):
+        """Return query() as a pandas DataFrame indexed by the dimensions, eg to plot or pivot with unstack"""
+        import pandas as pd
+        by = list(by)
+        rows = self.query(by, where)
+        index = pd.MultiIndex.from_tuples(list(rows), names=by) if rows else None
+        return pd.DataFrame(list(rows.values()), index=index)
+
+    def report(self) -> str:
+        """Return a text table of the monthly totals by simulator"""
+        lines = ['{:8s} {:15s} {:>8s} {:>10s} {:>10s} {:>10s}'.format(
+            'month', 'simulator', 'jobs', 'hours', 'mean min', 'wait h')]
+        for ((month, simulator), row) in self.monthly().items():
+            lines.append('{:8s} {:15s} {:8d} {:10.1f} {:10.2f} {:10.1f}'.format(
+                month, simulator, row['jobs'], row['duration_m'] / 60.0, row['duration_m_mean'],
+                row['wait_m'] / 60.0))
+        return '\n'.join(lines)
@@ -0,0 +1,215 @@
+"""
+Mergeable quantile sketches of job durations and waits
+
+The js_pd statistics need the whole jobs table in memory to take a median.  When jobs are written as
+they finish (js.follow, js.checkpoint, js.stream) JobSketches keeps running percentiles instead: each
+value is counted in a bucket of width relative to the value, so a quantile is known to within
+relative_accuracy of the true value while the memory only grows with the range of the values, up to
+max_buckets per sketch.
+
+Sketches with the same accuracy merge exactly, the sketches of the logs of several scheduler nodes
+add up to the sketches of the whole site.
+
+    sketches = JobSketches.load('site.sketch')
+    sketches.add_jobs(finished)
+    sketches.save('site.sketch')
+    print(sketches.report())
+
+Running this module prints the merged report of sketch files:
+
+    python -m js.sketch node1.sketch node2.sketch
+"""
+import math
+import os
+import pickle
+import sys
+from typing import Dict, List, Iterable, Optional, Tuple
+
+from js.jsr import Job
+
+SKETCH_VERSION = 1
+
+
+class QuantileSketch:
+    """
+    Counts of values in logarithmic buckets (DDSketch)
+
+    Bucket k holds the values in (gamma^(k-1), gamma^k] with gamma = (1 + a) / (1 - a), the middle of a
+    bucket is within a relative error a of all the values in it.  Values below min_value are counted as
+    zero.  If there are more than max_buckets buckets the lowest ones are merged, the accuracy is then
+    only lost for the lowest quantiles.
+
+    Members:
+        relative_accuracy: a, the largest relative error of a quantile
+        count, total, low, high: number, sum, smallest and largest of the values added
+        zeros: number of values below min_value
+        buckets: bucket key -> number of values
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048, min_value: float = 1e-6) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.total = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.zeros = 0
+        self.buckets = {}  # type: Dict[int, int]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add count values equal to value, NaN is ignored"""
+        if value != value:
+            return
+        self.count += count
+        self.total += value * count
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+        if value < self.min_value:
+            self.zeros += count
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self) -> None:
+        """Merge the lowest buckets into one so that there are at most max_buckets"""
+        keys = sorted(self.buckets)
+        extra = keys[:len(keys) - self.max_buckets + 1]
+        self.buckets[extra[-1]] = sum(self.buckets.pop(k) for k in extra[:-1]) + self.buckets[extra[-1]]
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        """Add the values of another sketch with the same accuracy"""
+        if other.gamma != self.gamma or other.min_value != self.min_value:
+            raise ValueError('sketches with different accuracies can not be merged')
+        self.count += other.count
+        self.total += other.total
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+        self.zeros += other.zeros
+        for (key, n) in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the value of rank q * (count - 1) within the relative accuracy, None if the sketch is empty"""
+        if self.count == 0:
+            return None
+        rank = math.floor(q * (self.count - 1))
+        seen = self.zeros
+        if rank < seen:
+            return min(max(0.0, self.low), self.high)
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.low), self.high)
+        return self.high
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+class JobSketches:
+    """
+    Quantile sketches of the job durations and waits, for all jobs, per simulator and per user
+
+    As in js_pd, durations are of the jobs that have one and waits of the jobs that were not cancelled.
+
+    Members:
+        sketches: (column, grouping, label) -> QuantileSketch, grouping is one of GROUPINGS and the label
+                  is '' for 'all'
+        relative_accuracy: of the sketches
+        jobs: number of jobs added
+    """
+    COLUMNS = ('duration_m', 'wait_m')
+    GROUPINGS = ('all', 'simulator', 'user')
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.version = SKETCH_VERSION
+        self.relative_accuracy = relative_accuracy
+        self.sketches = {}  # type: Dict[Tuple[str, str, str], QuantileSketch]
+        self.jobs = 0
+
+    @classmethod
+    def load(cls, path: str) -> 'JobSketches':
+        """Return the sketches saved in path, new ones if the file does not exist"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'rb') as fp:
+            sketches = pickle.load(fp)
+        if getattr(sketches, 'version', None) != SKETCH_VERSION:
+            print('ERROR: {} is not a sketch file of this version, starting over'.format(path))
+            return cls()
+        return sketches
+
+    def save(self, path: str) -> None:
+        with open(path + '.tmp', 'wb') as fp:
+            pickle.dump(self, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def sketch(self, column: str, grouping: str = 'all', label: str = '') -> QuantileSketch:
+        """Return the sketch of a column for a group, it is created if there is none yet"""
+        key = (column, grouping, label)
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            sketch = self.sketches[key] = QuantileSketch(self.relative_accuracy)
+        return sketch
+
+    def add_value(self, column: str, value: float, simulator: str, user: str) -> None:
+        self.sketch(column).add(value)
+        self.sketch(column, 'simulator', simulator).add(value)
+        self.sketch(column, 'user', user).add(value)
+
+    def add_job(self, job: Job) -> None:
+        """Add the duration and wait of a finished job"""
+        self.jobs += 1
+        (simulator, user) = (job.sim(), job.user or '')
+        if isinstance(job.run_time, float) and job.run_time == job.run_time:
+            self.add_value('duration_m', job.run_time / 60.0, simulator, user)
+        if job.exit != 'cancelled' and isinstance(job.wait_time, float) and job.wait_time == job.wait_time:
+            self.add_value('wait_m', job.wait_time / 60.0, simulator, user)
+
+    def add_jobs(self, jobs: Iterable[Job]) -> None:
+        for job in jobs:
+            self.add_job(job)
+
+    def merge(self, other: 'JobSketches') -> None:
+        """Add the sketches of another set of jobs, eg from another scheduler node"""
+        self.jobs += other.jobs
+        for ((column, grouping, label), sketch) in other.sketches.items():
+            self.sketch(column, grouping, label).merge(sketch)
+
+    def percentiles(self, column: str, grouping: str = 'all',
+                    qs: Tuple[float, ...] = (0.5, 0.9, 0.99)) -> Dict[str, List[Optional[float]]]:
+        """Return label -> the qs quantiles of column for each group of a grouping"""
+        return {label: [sketch.quantile(q) for q in qs]
+                for ((c, g, label), sketch) in sorted(self.sketches.items()) if c == column and g == grouping}
+
+    def report(self, groupings: Iterable[str] = ('all', 'simulator'), qs: Tuple[float, ...] = (0.5, 0.9, 0.99)) -> str:
+        """Return a text table of the count and quantiles of the durations and waits of each group"""
+        lines = ['{:10s} {:10s} {:20s} {:>8s} '.format('column', 'group', 'label', 'jobs') +
+                 ' '.join('{:>9s}'.format('p{:g}'.format(q * 100)) for q in qs)]
+        for column in self.COLUMNS:
+            for grouping in groupings:
+                for (label, values) in self.percentiles(column, grouping, qs).items():
+                    count = len(self.sketches[(column, grouping, label)])
+                    # a group can have jobs but no durations or waits yet, its sketches are empty
+                    lines.append('{:10s} {:10s} {:20s} {:8d} '.format(column, grouping, label, count) +
+                                 ' '.join('{:>9s}'.format('NA') if v is None else '{:9.2f}'.format(v)
+                                          for v in values))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    merged = JobSketches()
+    for path in sys.argv[1:]:
+        merged.merge(JobSketches.load(path))
+    print(merged.report())
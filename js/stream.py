@@ -0,0 +1,122 @@
+"""
+Streaming conversion of scheduler logs with bounded memory
+
+Jobs keeps every job it has seen, which for years of logs is more than fits in memory.  A JobStream
+hands each job to a sink as soon as it is done and then forgets it, only the jobs that a later line
+may still change are kept:
+
+    - active jobs, until their exit is settle seconds old in log time
+    - jobs retired at a scheduler restart without an exit, for revive_days, they may be restored by
+      UniqueID or ended by a host reassignment
+
+Every batch lines the done jobs are written out and the job list is cut down with Jobs.retain.  The
+jobs come out in the order they finish rather than the order they were submitted.  As in js.follow a
+job that is still active after it was written takes the lines logged for it later, those changes
+are not written again.
+"""
+from typing import Callable, List
+
+from js.jsr import Jobs, Job, Timeline, LOG_CHUNK_SIZE, log_spans, timestamp2float
+
+
+class JobStream:
+    """
+    Parses logs and passes the jobs to a sink as they finish
+
+    Members:
+        jobs: the Jobs the lines are parsed into, it only holds the jobs that may still change
+        sink: called with each job once it is done
+        events: None, or called with the timeline of the events parsed since the last call
+        settle: seconds of log time after its exit before an active job is done
+        revive_days: days a job retired without an exit is kept before it is written as it is
+        batch: number of lines between writing out the done jobs
+        count: number of jobs written
+    """
+
+    def __init__(self, sink: Callable[[Job], None], events: Callable[[Timeline], None] = None,
+                 settle: float = 60.0, revive_days: float = 7.0, batch: int = 10000) -> None:
+        self.jobs = Jobs(track_lines=False)
+        self.jobs.table = None  # the jobs do not stay long enough to be worth a table
+        self.sink = sink
+        self.events = events
+        self.settle = settle
+        self.revive_days = revive_days
+        self.batch = batch
+        self.count = 0
+        self.written = set()  # jobs in jobs.joblist that have been passed to sink
+        self.last_line = None  # type: str
+
+    def read_log_file(self, filename: str) -> int:
+        """
+        Parse a log file, the jobs that finish in it are written as they are seen
+
+        Returns:
+            the number of jobs submitted
+        """
+        file_id = len(self.jobs.files)
+        self.jobs.files.append(filename)
+        return self.jobs.parse_spans(self.batches(log_spans(filename, LOG_CHUNK_SIZE)), file_id)
+
+    def read_log_files(self, filenames: List[str]) -> List[int]:
+        """Parse log files in order and write out all the jobs, returns the number submitted in each file"""
+        counts = [self.read_log_file(f) for f in filenames]
+        self.close()
+        return counts
+
+    def close(self) -> None:
+        """Write out all the jobs that are left"""
+        self.flush(final=True)
+
+    def batches(self, spans):
+        """Pass the spans through, writing out the done jobs every batch lines"""
+        for (n, span) in enumerate(spans, 1):
+            if span[2] is not None and span[2].strip():
+                self.last_line = span[2]
+            yield span
+            if n % self.batch == 0:
+                self.flush()
+        self.flush()
+
+    def log_time(self) -> float:
+        """Return the time of the last line parsed, None before the first line"""
+        try:
+            return timestamp2float(self.last_line.lstrip('\ufeff').split(' - ', 1)[0])
+        except (AttributeError, ValueError, IndexError):
+            return None
+
+    def done(self, job: Job) -> bool:
+        """Return True if a job has an exit that will not be changed by a restore or host reassignment"""
+        return job.exit not in (None, 'shutdown', 'restored')
+
+    def flush(self, final: bool = False) -> None:
+        """
+        Write out the jobs that are done and drop them, and pass on the events so far
+
+        Arguments:
+            final: write out all the jobs, there are no more lines
+        """
+        jobs = self.jobs
+        tm = self.log_time()
+        horizon = None if tm is None else tm - self.revive_days * 24 * 3600
+        for job in jobs.joblist:
+            if job in self.written:
+                continue
+            if jobs.active.get(job.number) is job:
+                ready = self.done(job) and tm is not None and tm - (job.stop_time or tm) >= self.settle
+            else:
+                last = job.stop_time or job.start_time or job.submit_time or 0
+                ready = self.done(job) or (horizon is not None and last < horizon)
+            if ready or final:
+                self.written.add(job)
+                self.sink(job)
+                self.count += 1
+
+        if self.events is not None:
+            self.events(jobs.timeline)
+        # written jobs that ended long ago no longer need their number
+        for (number, job) in list(jobs.active.items()):
+            if job in self.written and (final or (horizon is not None and (job.stop_time or 0) < horizon)):
+                job.number = None
+                del jobs.active[number]
+        jobs.retain(j for j in jobs.joblist if j not in self.written)
+        self.written &= set(jobs.joblist)
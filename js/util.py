@@ -1,12 +1,32 @@
 import sys
 import os
+import bz2
+import gzip
+import lzma
+
+# openers of the compressed log archives by file name extension
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+def is_compressed(f):
+    return os.path.splitext(f)[1].lower() in COMPRESSED_OPENERS
 
 
 def is_logfile(f):
     f = f.lower()
+    if is_compressed(f):
+        f = os.path.splitext(f)[0]
     return f.startswith('awr_jobscheduler') and f.endswith('.txt')
 
 
+def open_log(f, buffering=-1):
+    """Open a log file for reading bytes, compressed logs are decompressed as they are read"""
+    ext = os.path.splitext(f)[1].lower()
+    if ext in COMPRESSED_OPENERS:
+        return COMPRESSED_OPENERS[ext](f, 'rb')
+    return open(f, 'rb', buffering=buffering)
+
+
 def expand_file_list(file_args):
     file_list = []
     for f in file_args:
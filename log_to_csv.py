@@ -1,5 +1,5 @@
-
 # standard python includes
+import os
 import sys
 import time
 from optparse import OptionParser
@@ -19,10 +19,42 @@ parser.add_option("-v", "--verbose",
                   help="print additional debugging information")
 parser.add_option('-o', '--outputfile',
                   action="store", dest='output_filename',
-                  help="output file name, will be a .csv file, if not specified only summary will be output")
+                  help="output file name, a .csv file unless it ends in .parquet or .arrow, "
+                       "if not specified only summary will be output")
 parser.add_option('-t', '--outputtype',
                   action="store", dest='output_type', default='jobs',
                   help='Output File Type = [jobs (default) | events]')
+parser.add_option('-f', '--follow',
+                  action="store_true", dest="follow",
+                  help="follow a live log, jobs are added to the output file as they finish (stop with Ctrl-C)")
+parser.add_option('-p', '--processes',
+                  action="store", dest='processes', type='int', default=1,
+                  help='number of processes used to parse the logs, 0 for one per CPU (default 1)')
+parser.add_option('--cache',
+                  action="store_true", dest="cache",
+                  help="load the log files parsed before from a cache and add the others to it")
+parser.add_option('--cache-dir',
+                  action="store", dest='cache_dir', default=None,
+                  help="directory of the cache of parsed log files, implies --cache (default ~/.cache/awrjs)")
+parser.add_option('--clear-cache',
+                  action="store_true", dest="clear_cache",
+                  help="remove the parsed log files from the cache before converting")
+parser.add_option('-s', '--stream',
+                  action="store_true", dest="stream",
+                  help="write jobs out as they finish instead of holding them all in memory, "
+                       "the jobs are in the order they finished")
+parser.add_option('-c', '--checkpoint',
+                  action="store", dest='checkpoint',
+                  help="checkpoint file, only what was logged since the last run is parsed and appended "
+                       "to the output file")
+parser.add_option('--stats',
+                  action="store", dest='stats',
+                  help="file of percentile sketches of the job durations and waits, with -f or -c the jobs "
+                       "are added to the sketches of the earlier runs (see js/sketch.py)")
+parser.add_option('--rollup',
+                  action="store", dest='rollup',
+                  help="file of job totals by month, day, hour, simulator, user and host, with -f or -c the jobs "
+                       "are added to the totals of the earlier runs (see js/rollup.py)")
 
 # options will be a dict of the options
 (options, args) = parser.parse_args()
@@ -38,12 +70,129 @@ else:
     if options.verbose:
         jsr.debug_port = sys.stdout
 
-jobs = jsr.Jobs()
+# log lines are only kept for debugging output
+jobs = jsr.Jobs(track_lines=bool(options.verbose))
+
+# (aggregate, file) the jobs written out are added to, see --stats and --rollup
+aggregates = []
+for (path, module, name) in ((options.stats, 'js.sketch', 'JobSketches'), (options.rollup, 'js.rollup', 'Rollup')):
+    if path:
+        aggregate = getattr(__import__(module, fromlist=[name]), name)
+        # the incremental conversions add to the aggregates of the runs before
+        aggregates.append((aggregate.load(path) if options.follow or options.checkpoint else aggregate(), path))
+
+
+def save_stats(finished):
+    """Add the jobs written out to the aggregates and save them"""
+    for (aggregate, path) in aggregates:
+        aggregate.add_jobs(finished)
+        aggregate.save(path)
+        print(aggregate.report())
+
+
+if options.follow:
+    if len(files) != 1 or not options.output_filename or options.output_type != 'jobs':
+        print('ERROR: --follow needs one log file and a jobs output file')
+        exit(1)
+    header = not os.path.exists(options.output_filename)
+    print('Following {}...'.format(files[0]))
+    with open(options.output_filename, 'a') as fp:
+        try:
+            for job in jobs.follow(files[0]):
+                # the follower drops the jobs it has returned, they are only added to the aggregates
+                for (aggregate, path) in aggregates:
+                    aggregate.add_job(job)
+                if header:
+                    print(job.job2csv(True), file=fp)
+                    header = False
+                print(job.job2csv(False), file=fp)
+                fp.flush()
+                print('{} finished, {} running, {} queued'.format(job, jobs.timeline.running_jobs,
+                                                                  jobs.timeline.queued_jobs))
+        except KeyboardInterrupt:
+            pass
+    save_stats([])
+    exit(0)
+
+if options.checkpoint:
+    from js.checkpoint import Checkpoint
+    if not options.output_filename:
+        print('ERROR: --checkpoint needs an output file')
+        exit(1)
+    checkpoint = Checkpoint.load(options.checkpoint)
+    finished = checkpoint.read(files)
+    header = not os.path.exists(options.output_filename) or os.path.getsize(options.output_filename) == 0
+    with open(options.output_filename, 'a') as fp:
+        if options.output_type == 'jobs':
+            jsr.write_csv_rows(fp, finished, header and bool(finished))
+        else:
+            checkpoint.events().write(fp=fp, header=header)
+    print('added {} jobs and {} events to {}.'.format(len(finished), len(checkpoint.events()),
+                                                      options.output_filename))
+    checkpoint.save(options.checkpoint)
+    save_stats(finished)
+    exit(0)
+
+if options.stream:
+    from js.stream import JobStream
+    if not options.output_filename:
+        print('ERROR: --stream needs an output file')
+        exit(1)
+    header = True
+
+    def count_job(job):
+        for (aggregate, path) in aggregates:
+            aggregate.add_job(job)
+
+    def write_job(job):
+        global header
+        count_job(job)
+        if header:
+            print(job.job2csv(True), file=fp)
+            header = False
+        print(job.job2csv(False), file=fp)
+
+    def write_events(timeline):
+        global header
+        timeline.write(fp=fp, header=header)
+        header = False
+
+    with open(options.output_filename, 'w') as fp:
+        if options.output_type == 'jobs':
+            stream = JobStream(write_job)
+        else:
+            stream = JobStream(count_job, write_events)
+        print('Found {} log files.'.format(len(files)))
+        for file in files:
+            print('Processing {}...'.format(file))
+            job_count = stream.read_log_file(file)
+            print('           contained {} jobs'.format(job_count))
+        stream.close()
+    print('produced {} from {} jobs.'.format(options.output_filename, stream.count))
+    save_stats([])
+    exit(0)
+
+cache = None
+if options.cache or options.cache_dir or options.clear_cache:
+    from js.cache import LogCache, DEFAULT_CACHE_DIR
+    cache = LogCache(options.cache_dir or DEFAULT_CACHE_DIR)
+    if options.clear_cache:
+        cache.clear()
+    if not (options.cache or options.cache_dir):
+        cache = None
+
 print('Found {} log files.'.format(len(files)))
-for file in files:
-    print('Processing {}...'.format(file))
-    job_count = jobs.read_log_file(file)
-    print('           contained {} jobs'.format(job_count))
+if options.processes == 1:
+    for file in files:
+        print('Processing {}...'.format(file))
+        job_count = cache.read_log_file(jobs, file) if cache else jobs.read_log_file(file)
+        print('           contained {} jobs'.format(job_count))
+else:
+    print('Processing in parallel...')
+    for (file, job_count) in zip(files, jobs.read_log_files(files, options.processes or None, cache)):
+        print('{} contained {} jobs'.format(file, job_count))
+if cache:
+    print('{} log files were loaded from the cache in {}'.format(cache.hits, cache.directory))
 timeline = jobs.timeline
 
 if jobs.number_of_jobs() > 0:
@@ -59,16 +208,34 @@ else:
     exit(1)
 
 
+# .parquet and .arrow (or .feather) output files are written typed, see js.arrow
+output_format = os.path.splitext(options.output_filename or '')[1].lower().lstrip('.')
+output_format = {'parquet': 'parquet', 'arrow': 'arrow', 'feather': 'arrow'}.get(output_format)
+if output_format:
+    try:
+        import js.arrow  # noqa: F401 (only checks that pyarrow is installed)
+    except ImportError:
+        print('ERROR: writing {} files needs pyarrow'.format(output_format))
+        exit(1)
+
 if options.output_type == 'jobs':
     if options.output_filename:
-        jobs.write_csv(options.output_filename)
+        if output_format:
+            getattr(jobs, 'write_' + output_format)(options.output_filename)
+        else:
+            jobs.write_csv(options.output_filename)
         print('produced {} containing {} jobs from {} to {}.'.format(options.output_filename,
                                                                      jobs.number_of_jobs(),
                                                                      start, end
                                                                      ))
 else:
     if options.output_filename:
-        fp = open(options.output_filename, 'w')
-        timeline.write(fp=fp)
-        fp.close()
+        if output_format:
+            getattr(timeline, 'write_' + output_format)(options.output_filename)
+        else:
+            fp = open(options.output_filename, 'w')
+            timeline.write(fp=fp)
+            fp.close()
         print('produced {}.'.format(options.output_filename))
+
+save_stats(jobs.get_list())
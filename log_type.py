@@ -1,10 +1,11 @@
 #!/usr/bin/python
+import io
 import re
 import sys
 import os
 import pdb
 from optparse import OptionParser
-from js.util import expand_file_list
+from js.util import expand_file_list, open_log
 
 
 usage = "usage: %prog [options] filename(s)"
@@ -37,7 +38,8 @@ else:
     format = "short"
 
 for file in files:
-    with open(file) as fp:
+    # compressed archives are decompressed as they are read
+    with io.TextIOWrapper(open_log(file), encoding='utf-8') as fp:
         lines = fp.readlines()
 
     scheduler = False
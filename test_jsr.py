@@ -1,7 +1,14 @@
 from js.jsr import Job, Jobs, Timeline
 from js.jsr import interval2string_m, elapsed2string, time2tuple, match
+from js.jsr import classify_line, classify_line_by_search, iter_log_lines, timestamp2float, parse_line
 
+import concurrent.futures
+import glob
+import io
 import math
+import pickle
+import pytest
+from collections import Counter
 import time
 import os
 
@@ -28,6 +35,37 @@ def test_time2string():
     assert b == '12'
     assert c == 'Wednesday'
 
+
+def test_timestamp2float():
+    for ts in ['2016-03-10T04:15:02.0036', '2017-05-03T01:54:37.731', '2016-11-06T01:30:00.0001']:
+        (whole, fract) = ts.split('.')
+        expected = time.mktime(time.strptime(whole, "%Y-%m-%dT%H:%M:%S")) + float('0.' + fract)
+        assert timestamp2float(ts) == pytest.approx(expected, abs=1e-6)
+        assert timestamp2float('\ufeff' + ts) == pytest.approx(expected, abs=1e-6)
+    base = time.mktime(time.strptime('2017-05-03T01:54:37', "%Y-%m-%dT%H:%M:%S"))
+    assert timestamp2float('2017-05-03T01:54:37.731') - base == pytest.approx(0.731, abs=1e-6)
+    assert timestamp2float('2017-05-03T01:54:37.0731') - base == pytest.approx(0.0731, abs=1e-6)
+
+
+def test_classify_line():
+    assert classify_line(submit_msg) == ('submitted', '1')
+    assert classify_line(started_msg) == ('started', '254')
+    assert classify_line('2014-11-13T14:17:10.0419 - Dequeueing job number 263 (AXIEM:39.0)') == ('cancelled', '263')
+    line = '2016-04-16T04:15:02.0057 - Job Scheduler shutting down with exit code 0x0'
+    assert classify_line(line) == ('shutdown', None)
+    assert classify_line('2016-04-20T11:49:54.0288 - Job 2: Child Process 3892 ("grsim.exe") ended with exit code 0.') \
+        == ('exit_code', '2')
+
+
+def test_classify_line_matches_search():
+    for filename in ['tdata/awr_jobs_2016.txt', 'tdata/v12_ana_success.txt', 'tdata/v14_ana_cancel.txt',
+                     'tdata/axiem_deque.log', 'tdata/v13_ana_licfailed.txt']:
+        for line in iter_log_lines(filename):
+            line = line.rstrip().lstrip('\ufeff')
+            if line:
+                assert classify_line(line) == classify_line_by_search(line), line
+
+
 submit_msg = '2014-11-05T12:45:43.0188 - Job 1: Submitted. Name="mpiexec:3.0", \
 User="dhoekstr", Priority=1'
 started_msg = '2014-11-13T09:09:10.0581 - Job 254: started AXIEM:33.0, procId:0 on \
@@ -49,6 +87,19 @@ def test_parse_job_message():
     assert cmd.startswith('started')
 
 
+def test_parse_line():
+    rec = parse_line(submit_msg)
+    assert int(rec.tm) == 1415220343
+    assert rec.number == '1'
+    assert rec.kind == 'submitted'
+    assert rec.message.startswith('Submitted')
+
+    # handlers accept the record as well as the line
+    j = Job()
+    j.started(parse_line(started_msg))
+    assert j.job['host'] == 'dfw0awrsim01'
+
+
 def test_submitted():
     j = Job()
     j.submitted(submit_msg)
@@ -100,6 +151,17 @@ def test_jobs_with_duration():
     assert len(x) == 2
 
 
+def test_source_lines():
+    j = Jobs('tdata/axiem_success.log')
+    lines = j.get_list()[0].source_lines()
+    assert len(lines) == 6
+    assert lines[0] == '2014-10-08T14:16:58.0128 - Job 3: Found version 11.02.7015 for task id "AXIEM"'
+    assert lines[-1].endswith('Exit status: 0')
+
+    j = Jobs('tdata/axiem_success.log', track_lines=False)
+    assert j.get_list()[0].source_lines() == []
+
+
 def test_success_job_fields():
     j = Jobs()
     j.read_log_file('tdata/axiem_success.log')
@@ -318,7 +380,7 @@ def test_axiem_v14_success_dict():
         'submitted_time': '15',
         'threads': 1,
         'user': 'mshattuc',
-        'wait_m': 0.02,
+        'wait_m': 0.01,  # 15:21:44.433 to 15:21:45.104
         'exit': '0',
         'files_remaining': float('nan'),
         'working_set': 3159,
@@ -413,7 +475,7 @@ def test_analyst_v14_cancel_dict():
     assert os.path.exists('tdata/v14_ana_cancel.txt'), 'Test file is missing'
     j = Jobs('tdata/v14_ana_cancel.txt')
     d = {
-        'duration_m': 0.23,
+        'duration_m': 0.24,  # 01:54:38.121 to 01:54:52.255
         'major_version': 14,
         'minor_version': '14.00.8732',
         'host': 'local service',
@@ -431,7 +493,7 @@ def test_analyst_v14_cancel_dict():
         'submitted_time': '01',
         'threads': 1,
         'user': 'sylin',
-        'wait_m': 0.02,
+        'wait_m': 0.01,  # 01:54:37.731 to 01:54:38.121
         'exit': "cancelled",
         'working_set': 351,
         'files_remaining': float('nan'),
@@ -514,3 +576,668 @@ def test_working_set_in_kb():
     assert result['working_set'] == 1, "failed: {}".format(result)
 
 
+# ## Job registry
+restore_log = """2016-12-12T10:13:45.0794 - Job 1: Found version 13.00.8295 for task id "AXIEM"
+2016-12-12T10:13:45.0794 - Job 1: Submitted. Name="AXIEM:1.0", User="user2", Priority=1, UniqueID={FE987EDF-E4CE-4C9C}
+2016-12-12T10:13:47.0104 - Job 1: started AXIEM:1.0, procId:1784 on controller "sim1"
+2016-12-12T10:14:00.0000 - Job Scheduler shutting down with exit code 0x00000000
+2016-12-12T10:15:00.0000 - Processing Command Line
+2016-12-12T10:15:01.0000 - Job 4 restored. UniqueID={FE987EDF-E4CE-4C9C}.
+2016-12-12T10:15:02.0000 - Job 5: Found version 13.00.8295 for task id "AXIEM"
+"""
+
+
+def test_restore_after_restart(tmpdir):
+    log = tmpdir.join('AWR_JobScheduler_x64_log.txt')
+    log.write(restore_log)
+    j = Jobs()
+    j.read_log_file(str(log))
+    assert j.number_of_jobs() == 2
+    first = j.get_list()[0]
+    assert first.job['exit'] == 'restored'
+    assert j.by_uuid['{FE987EDF-E4CE-4C9C}'] is first
+    # end of file acts as a restart so nothing is left active
+    assert j.active == {}
+    assert first.number is None
+
+
+def test_streaming_chunk_size(tmpdir):
+    import gzip
+    from js.jsr import iter_log_spans
+    # a plain log is memory mapped, the chunks are only used by iter_log_spans and for compressed logs
+    spans = list(iter_log_spans('tdata/awr_jobs_2016.txt'))
+    assert list(iter_log_spans('tdata/awr_jobs_2016.txt', chunk_size=64)) == spans
+    assert max(length for (offset, length, line) in spans) > 64
+    log = tmpdir.join('AWR_JobScheduler_x64_log.txt.gz')
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        log.write_binary(gzip.compress(fp.read()))
+    full = Jobs('tdata/awr_jobs_2016.txt')
+    small = Jobs()
+    small.read_log_file(str(log), chunk_size=64)
+    assert full.number_of_jobs() == small.number_of_jobs()
+    for a, b in zip(full.get_list(), small.get_list()):
+        compare_dict(a.job2dict(), b.job2dict())
+
+
+def test_job_view():
+    j = Job()
+    assert 'exit' not in j.job
+    assert j.job['exit'] == ''
+    assert j.job.get('exit') is None
+    j.job['S_Priority'] = '2'
+    j.job['R_NodeExclusive'] = 'false'
+    j.job['duration'] = 'NA'
+    assert j.priority == 2
+    assert j.job['S_Priority'] == '2'
+    assert j.extra == {'R_NodeExclusive': 'false'}
+    assert math.isnan(j.run_time)
+    assert j.job['duration'] == 'NA'
+    assert j.duration() == 'NA'
+    assert set(j.job) == {'S_Priority', 'R_NodeExclusive', 'duration'}
+    del j.job['duration']
+    assert j.run_time is None
+
+
+def test_job_table():
+    j = Jobs('tdata/awr_jobs_2016.txt')
+    table = j.job_table()
+    jobs = j.get_list()
+    assert len(table) == len(jobs)
+    assert table.column('final').all()
+    for job, submitted, duration in zip(jobs, table.column('submitted'), table.column('duration')):
+        assert submitted == job.submit_time or (job.submit_time is None and math.isnan(submitted))
+        assert duration == job.run_time or (job.run_time is None or math.isnan(job.run_time)) and math.isnan(duration)
+    assert list(table.labels('user')) == [x.user for x in jobs]
+    assert table.counts('simulator') == dict(Counter(x.sim() for x in jobs))
+    assert j.jobs_with_duration() == [x for x in jobs if x.duration() != '']
+
+
+def test_timeline_counts():
+    j = Jobs('tdata/awr_jobs_2016.txt')
+    assert j.timeline.counts() == j.timeline.counts_by_loop()
+    t = Timeline()
+    a = Job()
+    b = Job()
+    for (tm, ev_type, job) in [(1.0, 'queued', a), (2.0, 'queued', b), (3.0, 'started', a), (4.0, 'ended', a),
+                               (5.0, 'shutdown', None), (6.0, 'started', b)]:
+        t.add(tm, ev_type, job)
+    assert t.counts() == ([0, 0, 1, 0, 0, 1], [1, 2, 1, 1, 0, -1])
+    assert t.counts() == t.counts_by_loop()
+    assert t.jobs == [a, b]
+    assert t[-1].job['id'] == '' and t[-1].ev_type == 'started' and t[-1].running_jobs == 1
+    # the counts are kept between lookups and recomputed after an event is added
+    assert t.counts() is t.counts()
+    t.add(7.0, 'ended', b)
+    assert t[-1].running_jobs == 0 and t.counts() == t.counts_by_loop()
+    assert pickle.loads(pickle.dumps(t)).counts() == t.counts()
+
+
+def test_parallel_threads():
+    files = ['tdata/awr_jobs_2016.txt', 'tdata/axiem_success.log', 'tdata/axiem_fail.log', 'tdata/awr_jobs_2016.txt']
+
+    def parse(filename):
+        j = Jobs(filename)
+        events = io.StringIO()
+        j.timeline.write(fp=events)
+        return [(x.id, x.job2dict()) for x in j.get_list()], events.getvalue()
+
+    sequential = [parse(f) for f in files]
+    with concurrent.futures.ThreadPoolExecutor(len(files)) as pool:
+        threaded = list(pool.map(parse, files))
+    for (jobs_a, events_a), (jobs_b, events_b) in zip(sequential, threaded):
+        assert events_a == events_b
+        assert [x[0] for x in jobs_a] == [x[0] for x in jobs_b]
+        for (_, a), (_, b) in zip(jobs_a, jobs_b):
+            compare_dict(a, b)
+
+
+# job 1 is restored after a restart and job 2 is ended by the assignment of its host after another
+reassign_log = """2016-12-12T10:13:45.0794 - Job 1: Found version 13.00.8295 for task id "AXIEM"
+2016-12-12T10:13:45.0794 - Job 1: Submitted. Name="AXIEM:1.0", User="user2", Priority=1, UniqueID={FE987EDF-E4CE-4C9C}
+2016-12-12T10:13:47.0104 - Job 1: started AXIEM:1.0, procId:1784 on controller "sim1"
+2016-12-12T10:13:50.0000 - Job 2: Found version 13.00.8295 for task id "AXIEM"
+2016-12-12T10:13:50.0000 - Job 2: Submitted. Name="AXIEM:2.0", User="user3", Priority=1, UniqueID={AB47D2C5-3E8A-4B9A}
+2016-12-12T10:13:52.0000 - Job 2: started AXIEM:2.0, procId:1790 on controller "sim2"
+2016-12-12T10:15:00.0000 - Processing Command Line
+2016-12-12T10:15:01.0000 - Job 4 restored. UniqueID={FE987EDF-E4CE-4C9C}.
+2016-12-12T10:15:03.0000 - Job 4: releasing 8 processors (processor reservations available before:0, after:8)
+2016-12-12T10:16:00.0000 - Processing Command Line
+2016-12-12T10:16:01.0000 - Job 1: Found version 13.00.8295 for task id "AXIEM"
+2016-12-12T10:16:01.0000 - Job 1: Submitted. Name="AXIEM:3.0", User="user2", Priority=1, UniqueID={C2A5F1E0-77B4-4F1D}
+2016-12-12T10:16:02.0000 - Job 1: assigned AXIEM:3.0 to controller "sim2"
+2016-12-12T10:16:03.0000 - Job 1: started AXIEM:3.0, procId:1795 on controller "sim2"
+"""
+
+
+def test_parallel_processes(tmpdir):
+    log = tmpdir.join('AWR_JobScheduler_x64_log.txt')
+    log.write(restore_log + reassign_log.replace('2016-12-12', '2016-12-13'))
+    files = ['tdata/awr_jobs_2016.txt', str(log), 'tdata/v14_ana_cancel.txt', 'tdata/axiem_success.log']
+
+    def result(j):
+        events = io.StringIO()
+        j.timeline.write(fp=events)
+        return ([(x.id, x.job2dict(), x.source_lines()) for x in j.get_list()], events.getvalue(),
+                sorted(j.by_uuid), sorted(j.running_hosts))
+
+    sequential = Jobs()
+    counts = sequential.read_log_files(files)
+    parallel = Jobs()
+    from js.parallel import read_log_files
+    assert read_log_files(parallel, files, processes=2, min_size=0) == counts
+    (jobs_a, events_a, uuids_a, hosts_a) = result(sequential)
+    (jobs_b, events_b, uuids_b, hosts_b) = result(parallel)
+    assert events_a == events_b
+    assert (uuids_a, hosts_a) == (uuids_b, hosts_b)
+    assert len(jobs_a) == len(jobs_b)
+    for (id_a, dict_a, lines_a), (id_b, dict_b, lines_b) in zip(jobs_a, jobs_b):
+        assert (id_a, lines_a) == (id_b, lines_b)
+        compare_dict(dict_a, dict_b)
+    assert parallel.job_table().column('duration').tobytes() == sequential.job_table().column('duration').tobytes()
+    assert parallel.by_uuid['{AB47D2C5-3E8A-4B9A}'].exit == 'host_reassigned'
+    assert abs(parallel.by_uuid['{FE987EDF-E4CE-4C9C}'].duration() - 75.9896) < 1e-6
+    assert 'vanished' in events_b
+
+
+def test_follow(tmpdir):
+    from js.follow import LogFollower
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        data = fp.read()
+    log = tmpdir.join('AWR_JobScheduler_x64_log.txt')
+    log.write_binary(b'')
+    j = Jobs()
+    (events_a, events_b) = (io.StringIO(), io.StringIO())
+    follower = LogFollower(j, str(log), settle=60,
+                           events=lambda timeline: timeline.write(fp=events_b, header=not events_b.tell()))
+    finished = follower.poll()
+    # append the log in pieces that end part way through a line
+    for end in range(1000, len(data), 7919):
+        log.write_binary(data[:end])
+        finished += follower.poll()
+        assert follower.offset <= end
+        assert len(j.joblist) <= len(j.active) + len(j.by_uuid) + 1
+    # a last line without a timestamp is not the time of the restart that closes the log
+    log.write_binary(data + b'\r\n  continued without a timestamp\r\n')
+    finished += follower.poll()
+    assert len(finished) > 0
+    assert follower.last_line == data.decode('utf-8-sig').split('\n')[-2].strip()
+    finished += follower.close()
+    # the returned jobs have been dropped but for those that may still be restored
+    assert set(j.joblist) == follower.returned and not follower.exit_seen
+    assert all(x.exit in (None, 'shutdown', 'restored') for x in j.joblist)
+    full = Jobs('tdata/awr_jobs_2016.txt')
+    finished.sort(key=lambda x: int(x.id[3:]))
+    assert [x.id for x in finished] == [x.id for x in full.get_list()]
+    for a, b in zip(full.get_list(), finished):
+        compare_dict(a.job2dict(), b.job2dict())
+    full.timeline.write(fp=events_a)
+    assert events_a.getvalue() == events_b.getvalue()
+    assert follower.queue_depth() == (0, 0)
+
+
+def test_checkpoint(tmpdir):
+    from js.checkpoint import Checkpoint
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        data = fp.read()
+    first = tmpdir.join('first.txt')
+    with open('tdata/v13_xem_success.txt', 'rb') as fp:
+        first.write_binary(fp.read())
+    live = tmpdir.join('live.txt')
+    path = str(tmpdir.join('nightly.ckpt'))
+    files = [str(first), str(live)]
+    finished = []
+    events = io.StringIO()
+    # each night the live log has grown, the last line may be only partly written
+    for end in (len(data) // 3, len(data) // 3 + 10, 2 * len(data) // 3 + 17, len(data)):
+        live.write_binary(data[:end])
+        checkpoint = Checkpoint.load(path)
+        checkpoint.revive_days = 1
+        finished += checkpoint.read(files)
+        checkpoint.events().write(fp=events, header=not events.getvalue())
+        checkpoint.save(path)
+    checkpoint = Checkpoint.load(path)
+    assert checkpoint.read(files) == []
+    # the logs keep the file id they were first read with
+    assert checkpoint.jobs.files == files
+    held = [j for j in checkpoint.jobs.active.values() if j not in checkpoint.written]
+    assert len(checkpoint.jobs.joblist) < 10
+
+    full = Jobs(track_lines=False)
+    full.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt'])
+    assert len(finished) + len(held) == full.number_of_jobs()
+    ids = [j.id for j in finished + held]
+    assert len(set(ids)) == len(ids)
+    by_id = {j.id: j for j in full.get_list()}
+    for job in finished:
+        compare_dict(by_id[job.id].job2dict(), job.job2dict())
+    # the live log is not closed out so the full parse has one more shutdown at the end
+    expected = io.StringIO()
+    full.timeline.write(fp=expected)
+    assert events.getvalue() == ''.join(expected.getvalue().splitlines(True)[:-1])
+
+
+def test_log_cache(tmpdir):
+    from js.cache import LogCache
+    files = ['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt']
+    full = Jobs()
+    counts = full.read_log_files(files)
+    expected_events = io.StringIO()
+    full.timeline.write(fp=expected_events)
+
+    cache = LogCache(str(tmpdir.join('cache')))
+    for n in range(2):
+        j = Jobs()
+        assert j.read_log_files(files, cache=cache) == counts
+        events_out = io.StringIO()
+        j.timeline.write(fp=events_out)
+        assert [x.job2csv(False) for x in j.get_list()] == [x.job2csv(False) for x in full.get_list()]
+        assert events_out.getvalue() == expected_events.getvalue()
+    assert (cache.hits, cache.misses) == (3, 3)
+    assert len(cache.entries()) == 3
+
+    # only the most recently used entries fit
+    used = cache.entries()[-1].path
+    cache.max_size = cache.size() - 1
+    cache.evict()
+    assert used in [e.path for e in cache.entries()]
+    assert len(cache.entries()) < 3
+    cache.clear()
+    assert cache.entries() == []
+
+    # a directory others can write to is not trusted with pickles
+    if hasattr(os, 'getuid'):
+        shared = tmpdir.mkdir('shared')
+        shared.chmod(0o777)
+        cache = LogCache(str(shared))
+        assert Jobs().read_log_files(files, cache=cache) == counts
+        assert cache.untrusted and cache.entries() == []
+
+
+def test_compressed_logs(tmpdir):
+    import bz2
+    import gzip
+    import lzma
+    from js.util import is_logfile, expand_file_list
+    with open('tdata/awr_jobs_2016.txt', 'rb') as fp:
+        data = fp.read()
+    full = Jobs('tdata/awr_jobs_2016.txt')
+    expected = io.StringIO()
+    full.timeline.write(fp=expected)
+    for (ext, compress) in (('.gz', gzip.compress), ('.bz2', bz2.compress), ('.xz', lzma.compress)):
+        log = tmpdir.join('AWR_JobScheduler_x64_log.txt' + ext)
+        log.write_binary(compress(data))
+        assert is_logfile(log.basename)
+        for processes in (1, 2):
+            j = Jobs()
+            assert j.read_log_files([str(log)], processes) == [full.number_of_jobs()]
+            for a, b in zip(full.get_list(), j.get_list()):
+                compare_dict(a.job2dict(), b.job2dict())
+            events = io.StringIO()
+            j.timeline.write(fp=events)
+            assert events.getvalue() == expected.getvalue()
+        # the log lines of a job are read back from the archive
+        assert j.get_list()[-1].source_lines() == full.get_list()[-1].source_lines()
+    assert len(expand_file_list([str(tmpdir)])) == 3
+    assert not is_logfile('awr_jobscheduler_x64_log.gz')
+
+
+def test_skip_raw_line():
+    from js.jsr import skip_raw_line, iter_log_mmap, iter_log_spans
+    skipped = 0
+    for filename in glob.glob('tdata/*.txt') + glob.glob('tdata/*.log'):
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+        pos = 0
+        for raw in data.splitlines(True):
+            if skip_raw_line(data, pos, pos + len(raw)):
+                skipped += 1
+                assert parse_line(raw.decode('utf-8').rstrip().lstrip('\ufeff')).kind in (None, 'ignore'), raw
+            pos += len(raw)
+        spans = list(iter_log_spans(filename))
+        mapped = list(iter_log_mmap(filename))
+        assert [(o, n) for (o, n, l) in spans] == [(o, n) for (o, n, l) in mapped]
+        assert mapped[-1][2] == spans[-1][2]
+        assert all(b is None or a == b for ((_, _, a), (_, _, b)) in zip(spans, mapped))
+    assert skipped > 500
+
+
+def test_job_stream():
+    from js.stream import JobStream
+    files = ['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt']
+    full = Jobs(track_lines=False)
+    counts = full.read_log_files(files)
+    expected = io.StringIO()
+    full.timeline.write(fp=expected)
+
+    written = []
+    kept = []
+    events = io.StringIO()
+    stream = JobStream(lambda job: (written.append(job), kept.append(len(stream.jobs.joblist))),
+                       lambda timeline: timeline.write(fp=events, header=not events.getvalue()), batch=50)
+    assert stream.read_log_files(files) == counts
+    assert stream.count == len(written) == full.number_of_jobs()
+    assert stream.jobs.joblist == [] and stream.jobs.active == {}
+    assert max(kept) < full.number_of_jobs()
+    assert sorted(j.id for j in written) == sorted(j.id for j in full.get_list())
+    by_id = {j.id: j for j in full.get_list()}
+    for job in written:
+        compare_dict(by_id[job.id].job2dict(), job.job2dict())
+    assert events.getvalue() == expected.getvalue()
+
+
+def test_arrow_output(tmpdir):
+    pytest.importorskip('pyarrow')
+    from js.arrow import read_table, JOB_SCHEMA, EVENT_SCHEMA
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt'])
+    for ext in ('parquet', 'arrow'):
+        jobs_file = str(tmpdir.join('jobs.' + ext))
+        events_file = str(tmpdir.join('events.' + ext))
+        getattr(j, 'write_' + ext)(jobs_file)
+        getattr(j.timeline, 'write_' + ext)(events_file)
+        jobs = read_table(jobs_file)
+        assert jobs.schema.equals(JOB_SCHEMA)
+        rows = jobs.to_pylist()
+        assert len(rows) == j.number_of_jobs()
+        for (job, row) in zip(j.get_list(), rows):
+            d = job.job
+            assert row['id'] == job.id and row['uuid'] == job.uuid
+            assert row['submitted'].timestamp() == pytest.approx(d['submitted'], abs=1e-6)
+            assert row['user'] == job.user and row['exit_code'] == job.exit and row['simulator'] == (job.sim() or None)
+            assert row['host'] == job.host
+            if job.run_time is None or math.isnan(job.run_time):
+                assert row['duration_m'] is None
+            else:
+                assert row['duration_m'] == pytest.approx(job.run_time / 60)
+            assert row['priority'] == (int(d['S_Priority']) if d['S_Priority'] else None)
+        events = read_table(events_file)
+        assert events.schema.equals(EVENT_SCHEMA)
+        expected = io.StringIO()
+        j.timeline.write(fp=expected)
+        got = ['{},{},{},{}'.format(r['type'], r['running'], r['queued'], r['id'] or 'NA') for r in events.to_pylist()]
+        assert got == [','.join(line.split(',')[2:]) for line in expected.getvalue().splitlines()[1:]]
+
+
+def test_to_dataframe():
+    np = pytest.importorskip('numpy')
+    pd = pytest.importorskip('pandas')
+    from js.js_pd import read_and_validate
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt'])
+    csv = io.StringIO()
+    print(j.joblist[0].job2csv(True), file=csv)
+    for job in j.get_list():
+        print(job.job2csv(False), file=csv)
+    csv.seek(0)
+    expected = read_and_validate(csv)
+    df = j.to_dataframe()
+    assert list(df.columns) == list(expected.columns)
+    assert len(df) == len(expected)
+    # the same types as the csv read back, the categoricals differ only in their categories
+    for name in df.columns:
+        if isinstance(expected[name].dtype, pd.CategoricalDtype):
+            assert isinstance(df[name].dtype, pd.CategoricalDtype), name
+        else:
+            assert df[name].dtype == expected[name].dtype, name
+    for name in ('submitted_date', 'start_date', 'duration_m', 'wait_m'):
+        assert df[name].equals(expected[name]), name
+    for name in ('submitted_time', 'start_time', 'duration_m', 'wait_m', 'working_set', 'priority', 'min_proc',
+                 'threads', 'max_proc', 'results_copy_m'):
+        got = df[name].astype('float64').to_numpy(na_value=np.nan)
+        assert np.allclose(got, expected[name].astype('float64'), equal_nan=True), name
+    for name in ('submitted_day', 'start_day', 'user', 'simulator', 'host', 'req_perf', 'req_mem', 'exit_code', 'uuid'):
+        got = df[name].astype(object).where(df[name].notna(), None).tolist()
+        assert got == expected[name].astype(object).where(expected[name].notna(), None).tolist(), name
+
+
+def test_local_seconds():
+    np = pytest.importorskip('numpy')
+    from js.jobtable import local_seconds
+    # around the 2016 daylight saving changes and a missing time
+    seconds = [1457863200.0 + n * 1799.5 for n in range(-6, 6)] + [1478422800.0 + n * 1800 for n in range(-6, 6)]
+    seconds = np.array(seconds + [np.nan])
+    local = local_seconds(seconds)
+    for (s, l) in zip(seconds[:-1], local[:-1]):
+        assert l - s == time.localtime(s).tm_gmtoff
+    assert np.isnan(local[-1])
+
+
+def test_write_csv(tmpdir):
+    from js.jsr import CSV_HEADER, write_csv_rows, time_columns
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt'])
+    filename = str(tmpdir.join('jobs.csv'))
+    j.write_csv(filename)
+    with open(filename) as fp:
+        lines = fp.read().splitlines()
+    assert lines[0] == CSV_HEADER
+    assert len(lines) == j.number_of_jobs() + 1
+    for (job, line) in zip(j.get_list(), lines[1:]):
+        d = job.job
+        fields = list(time2tuple(d['submitted'])) + list(time2tuple(d['start']))
+        fields += [interval2string_m(d['duration']), interval2string_m(d['queued']), d['S_User'], job.sim(),
+                   d['host'], str(d['working_set']), d['S_Priority'], d['R_MinProcessors'],
+                   d['R_ThreadsPerProcessor'], d['R_MaxProcessors'], d['R_PreferredPerf'], d['R_PreferredMemCap'],
+                   d['exit'], interval2string_m(d['results_copy']), str(d['S_UniqueID']), '']
+        assert line == ','.join(fields)
+    batched = io.StringIO()
+    write_csv_rows(batched, j.get_list(), header=False, batch=2)
+    assert batched.getvalue().splitlines() == lines[1:]
+    times = [1457863200.0 + n * 420.5 for n in range(-200, 200)]
+    assert list(zip(*time_columns(times + [None], {}))) == [time2tuple(t) for t in times] + [('NA', 'NA', 'NA')]
+
+
+def test_js_pd_stats():
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('pandas')
+    from js import js_pd
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt',
+                      'tdata/axiem_success.log', 'tdata/v12_xem_fail.txt'])
+    df = j.to_dataframe()
+    sims = js_pd.sim_list(df)
+    assert sims == ['AXIEM', 'Analyst']
+
+    by_type = js_pd.jobs_by_type(df)
+    assert list(by_type.columns) == ['Total'] + sims
+    assert by_type.at['Jobs Submitted', 'Total'] == len(df)
+    assert by_type.at['Cancelled by User', 'AXIEM'] == ((df.exit_code == 'cancelled') & (df.simulator == 'AXIEM')).sum()
+    assert by_type.Total.iloc[1:].sum() == len(df)
+
+    durations = js_pd.duration_stats(df)
+    for sim in sims:
+        d = df[df.simulator == sim].duration_m.dropna()
+        assert durations.at['Longest Job', sim] == d.max()
+        assert durations.at['Average Job Duration', sim] == pytest.approx(d.mean())
+        assert durations.at['Median Job Duration', sim] == d.median()
+    waits = js_pd.wait_stats(df, sim_breakdown=False)
+    assert list(waits.columns) == ['Overall']
+    assert waits.at['Median Wait', 'Overall'] == df[df.exit_code != 'cancelled'].wait_m.median()
+    # two jobs have no wait, the medians skip them as the mean and max do rather than being NaN
+    waits = js_pd.wait_stats(df)
+    assert df[df.exit_code != 'cancelled'].wait_m.isnull().sum() == 2
+    assert waits.at['Median Wait', 'Overall'] == pytest.approx(0.255)
+    assert waits.at['Median Wait', 'Analyst'] == pytest.approx(1.82)
+    assert waits.at['Median Wait', 'AXIEM'] == pytest.approx(0.05)
+
+    medians = js_pd.median_by_user(df)
+    ok = js_pd.successful_jobs(df)
+    assert list(medians.index) == sorted(ok.user.unique())
+    for user in medians.index:
+        assert medians.at[user, 'Overall'] == ok[ok.user == user].duration_m.median()
+        for sim in sims:
+            d = ok[(ok.user == user) & (ok.simulator == sim)].duration_m
+            assert medians.at[user, sim] == d.median() or (len(d) == 0 and np.isnan(medians.at[user, sim]))
+
+    stats = js_pd.job_stats(df)
+    assert stats.jobs.sum() == len(df)
+    assert stats.index.names == ['simulator', 'user', 'exit_category']
+    assert stats.duration_m_count.sum() == df.duration_m.notnull().sum()
+
+
+def test_read_and_validate(tmpdir):
+    pytest.importorskip('numpy')
+    pd = pytest.importorskip('pandas')
+    from js import js_pd
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt',
+                      'tdata/axiem_success.log', 'tdata/v12_xem_fail.txt'])
+    filename = str(tmpdir.join('jobs.csv'))
+    j.write_csv(filename)
+    df = js_pd.read_and_validate(filename)
+    assert len(df) == j.number_of_jobs()
+    assert str(df.submitted_date.dtype).startswith('datetime64')
+    assert df.duration_m.dtype == 'float32' and df.priority.dtype == 'Int32'
+    assert isinstance(df.exit_code.dtype, pd.CategoricalDtype)
+    assert '0' in df.exit_code.cat.categories and (df.exit_code == '0').sum() > 0
+    # a filtered frame only groups and pivots on the values left in it, as in the notebook
+    user = df.user.dropna().iloc[0]
+    one = df[df.user == user]
+    assert len(one.user.value_counts()) == 1
+    assert list(one.groupby('user').duration_m.count().index) == [user]
+    pivot = pd.pivot_table(one, index=['user'], columns=['simulator'], values=['duration_m'], aggfunc='count')
+    assert sorted(pivot.columns.get_level_values('simulator')) == sorted(one.simulator.dropna().unique())
+
+    small = js_pd.read_and_validate(filename, usecols=['user', 'simulator', 'duration_m'])
+    assert sorted(small.columns) == ['duration_m', 'simulator', 'user']
+    with pytest.raises(js_pd.ImproperFormat):
+        js_pd.read_and_validate(filename, usecols=['user', 'no_such_column'])
+    with pytest.raises(js_pd.ImproperFormat):
+        js_pd.read_and_validate(io.StringIO('user,simulator\nuser1,AXIEM\n'))
+
+    chunks = list(js_pd.read_and_validate(filename, chunksize=4))
+    assert [len(c) for c in chunks[:-1]] == [4] * (len(chunks) - 1)
+    assert pd.concat(chunks).duration_m.tolist() == pytest.approx(df.duration_m.tolist(), nan_ok=True)
+
+    stats = js_pd.aggregate_csv(filename, ['simulator'], chunksize=4)
+    full = js_pd.group_stats(df, ['simulator'])
+    for c in stats.columns:
+        assert stats[c].tolist() == pytest.approx(full[c].tolist(), nan_ok=True), c
+
+
+def test_quantile_sketch(tmpdir):
+    import random
+    from js.sketch import QuantileSketch, JobSketches
+    rng = random.Random(1)
+    values = [rng.lognormvariate(1.0, 1.5) for _ in range(20000)] + [0.0] * 10
+    (first, second, both) = (QuantileSketch(), QuantileSketch(), QuantileSketch())
+    for (n, v) in enumerate(values):
+        (first if n % 2 else second).add(v)
+        both.add(v)
+    first.merge(second)
+    assert first.buckets == both.buckets and first.count == both.count == len(values)
+    ordered = sorted(values)
+    for q in (0.0, 0.01, 0.5, 0.9, 0.99, 1.0):
+        exact = ordered[math.floor(q * (len(values) - 1))]
+        assert abs(both.quantile(q) - exact) <= 0.01 * exact
+    small = QuantileSketch(max_buckets=400)
+    for v in values:
+        small.add(v)
+    assert len(small.buckets) <= 400
+    assert abs(small.quantile(0.9) - ordered[math.floor(0.9 * (len(values) - 1))]) <= 0.01 * small.quantile(0.9)
+    assert QuantileSketch().quantile(0.5) is None
+
+    # two scheduler nodes merge into the sketches of all their jobs
+    nodes = [Jobs('tdata/awr_jobs_2016.txt'), Jobs('tdata/v14_ana_cancel.txt')]
+    site = JobSketches()
+    for (n, node) in enumerate(nodes):
+        sketches = JobSketches()
+        sketches.add_jobs(node.get_list())
+        sketches.save(str(tmpdir.join('node{}.sketch'.format(n))))
+        site.merge(JobSketches.load(str(tmpdir.join('node{}.sketch'.format(n)))))
+    jobs = nodes[0].get_list() + nodes[1].get_list()
+    assert site.jobs == len(jobs)
+    for sim in ('AXIEM', 'Analyst'):
+        durations = sorted(j.run_time / 60 for j in jobs if j.sim() == sim and isinstance(j.run_time, float)
+                           and not math.isnan(j.run_time))
+        assert len(site.sketch('duration_m', 'simulator', sim)) == len(durations)
+        (p50, p90, p99) = site.percentiles('duration_m', 'simulator')[sim]
+        for (q, p) in ((0.5, p50), (0.9, p90), (0.99, p99)):
+            exact = durations[math.floor(q * (len(durations) - 1))]
+            assert abs(p - exact) <= 0.01 * exact
+    assert 'p50' in site.report()
+    # a simulator with jobs but no durations has an empty sketch
+    empty = JobSketches()
+    empty.sketch('duration_m', 'simulator', 'AXIEM')
+    assert empty.percentiles('duration_m', 'simulator') == {'AXIEM': [None, None, None]}
+    assert empty.report().splitlines()[-1].split() == ['duration_m', 'simulator', 'AXIEM', '0', 'NA', 'NA', 'NA']
+
+
+def test_rollup(tmpdir):
+    pytest.importorskip('numpy')
+    pytest.importorskip('pandas')
+    from js.rollup import Rollup
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt',
+                      'tdata/axiem_success.log', 'tdata/v12_xem_fail.txt'])
+    jobs = j.get_list()
+    # jobs added in two runs, the first saved and loaded again
+    path = str(tmpdir.join('jobs.rollup'))
+    first = Rollup()
+    first.add_jobs(jobs[:10])
+    first.save(path)
+    rollup = Rollup.load(path)
+    for job in jobs[10:]:
+        rollup.add_job(job)
+    whole = Rollup()
+    whole.add_jobs(jobs)
+    assert rollup.cells == whole.cells and rollup.jobs == len(jobs)
+
+    df = j.to_dataframe()
+    df['month'] = df.submitted_date.dt.strftime('%Y-%m')
+    # the csv columns are rounded to 0.01 minute, the rollup is not
+    df['duration_m'] = [x.run_time / 60 if isinstance(x.run_time, float) else math.nan for x in jobs]
+    df['wait_m'] = [x.wait_time / 60 if isinstance(x.wait_time, float) else math.nan for x in jobs]
+    expected = df.groupby(['month', 'simulator'], observed=True).agg(
+        jobs=('user', 'size'), duration_m=('duration_m', 'sum'), duration_m_mean=('duration_m', 'mean'),
+        wait_m=('wait_m', 'sum'))
+    monthly = rollup.monthly()
+    assert sorted(monthly) == sorted(expected.index)
+    for (key, row) in monthly.items():
+        assert row['jobs'] == expected.at[key, 'jobs']
+        assert row['duration_m'] == pytest.approx(expected.at[key, 'duration_m'])
+        assert row['duration_m_mean'] == pytest.approx(expected.at[key, 'duration_m_mean'], nan_ok=True)
+        assert row['wait_m'] == pytest.approx(expected.at[key, 'wait_m'])
+    hourly = rollup.query(['hour'], where={'simulator': 'AXIEM'})
+    assert sum(r['jobs'] for r in hourly.values()) == (df.simulator == 'AXIEM').sum()
+    assert sorted(h for (h,) in hourly) == sorted(df[df.simulator == 'AXIEM'].submitted_time.unique())
+
+    # two nodes merge into the site rollup
+    site = Rollup()
+    site.merge(first)
+    rest = Rollup()
+    rest.add_jobs(jobs[10:])
+    site.merge(rest)
+    assert site.cells == whole.cells
+    frame = rollup.to_frame(['month', 'simulator'])
+    assert frame.jobs.sum() == len(jobs)
+    assert 'AXIEM' in rollup.report()
+
+
+def test_histogram():
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('pandas')
+    from js import js_pd
+    j = Jobs()
+    j.read_log_files(['tdata/v13_xem_success.txt', 'tdata/awr_jobs_2016.txt', 'tdata/v14_ana_cancel.txt',
+                      'tdata/axiem_success.log', 'tdata/v12_xem_fail.txt'])
+    df = j.to_dataframe()
+    comp = js_pd.successful_jobs(df)
+    for (column, preset, by) in (('duration_m', 'duration', 'simulator'), ('wait_m', 'wait', 'user'),
+                                 ('working_set', 'working_set_axiem', 'host'),
+                                 ('working_set', 'working_set_analyst', 'simulator'),
+                                 ('working_set', 'working_set_large', 'simulator')):
+        hist = js_pd.histogram(comp, column, preset, by)
+        bins = js_pd.BIN_PRESETS[preset]
+        assert list(hist.columns) == bins.labels
+        assert list(hist.index) == sorted(comp[by].dropna().unique())
+        for name in hist.index:
+            expected = np.histogram(comp[comp[by] == name][column].dropna(), bins=bins.edges)[0]
+            assert hist.loc[name].tolist() == expected.tolist()
+    # edges on the bin boundaries, the last bin is closed
+    hist = js_pd.histogram(df.assign(x=[0, 1, 5, 5000, 6000, np.nan] * (len(df) // 6) + [1] * (len(df) % 6)),
+                           'x', by=None)
+    expected = np.histogram([0, 1, 5, 5000, 6000] * (len(df) // 6) + [1] * (len(df) % 6),
+                            bins=js_pd.BIN_PRESETS['duration'].edges)[0]
+    assert list(hist.index) == ['Overall'] and hist.loc['Overall'].tolist() == expected.tolist()
+    assert list(js_pd.histogram(comp, 'wait_m', [0, 1, 10]).columns) == ['0-1', '1-10']